@@ -0,0 +1,152 @@
+"""Author-name parsing: memoized batch pipeline vs. the original per-call functions.
+
+The ``legacy_*`` functions are the pre-``reference.authors`` implementations
+(per-entry .bib normalization in the upload view and the per-call
+``format_authors_*`` helpers), kept here verbatim as the baseline.
+"""
+import gc
+import random
+import time
+
+from research_assistant.reference.authors import clear_caches, normalize_authors_batch
+from research_assistant.reference.citation_styles import STYLES
+
+N = 100_000
+DISTINCT_AUTHORS = 3_000
+
+
+def legacy_normalize_authors_from_bib(entry):
+    raw = (entry.get("author") or "").strip()
+    if not raw:
+        return ""
+    parts = [p.strip() for p in raw.split(" and ") if p.strip()]
+    norm = []
+    for p in parts:
+        if "," in p:
+            last, first = [x.strip() for x in p.split(",", 1)]
+        else:
+            tokens = p.split()
+            last = tokens[-1]
+            first = " ".join(tokens[:-1])
+        initials = "".join([s[0].upper() + "." for s in first.split() if s])
+        norm.append(f"{last}, {initials}".strip())
+    return "; ".join(norm)
+
+
+def legacy_split_author_item(item):
+    item = (item or "").strip()
+    if not item:
+        return "", ""
+    if "," in item:
+        last, first = [x.strip() for x in item.split(",", 1)]
+    else:
+        tokens = item.split()
+        if not tokens:
+            return "", ""
+        last = tokens[-1]
+        first = " ".join(tokens[:-1])
+    return last, first
+
+
+def legacy_to_first_last(item):
+    last, first = legacy_split_author_item(item)
+    return (f"{first} {last}").strip()
+
+
+def legacy_to_last_first(item):
+    last, first = legacy_split_author_item(item)
+    if not last and not first:
+        return item.strip()
+    return f"{last}, {first}".strip().strip(",")
+
+
+def legacy_authors_list(authors):
+    if not authors:
+        return []
+    return [a.strip() for a in authors.split(";") if a.strip()]
+
+
+def legacy_format_authors_apa(authors):
+    items = legacy_authors_list(authors)
+    n = len(items)
+    if n == 0:
+        return ""
+    if n == 1:
+        return items[0]
+    if n == 2:
+        return f"{items[0]} & {items[1]}"
+    return f"{', '.join(items[:-1])}, & {items[-1]}"
+
+
+def legacy_format_authors_chicago(authors):
+    items = legacy_authors_list(authors)
+    n = len(items)
+    if n == 0:
+        return ""
+    if n == 1:
+        return legacy_to_last_first(items[0])
+    first = legacy_to_last_first(items[0])
+    rest = [legacy_to_first_last(x) for x in items[1:]]
+    if len(rest) == 1:
+        return f"{first} and {rest[0]}"
+    return f"{first}, {', '.join(rest[:-1])}, and {rest[-1]}"
+
+
+def legacy_format_authors_mla(authors):
+    items = legacy_authors_list(authors)
+    n = len(items)
+    if n == 0:
+        return ""
+    if n == 1:
+        return legacy_to_last_first(items[0])
+    if n == 2:
+        return f"{legacy_to_last_first(items[0])}, and {legacy_to_first_last(items[1])}"
+    return f"{legacy_to_last_first(items[0])}, et al."
+
+
+def make_bib_authors(rnd):
+    """BibTeX author fields drawn from a pool of recurring co-authors."""
+    firsts = ["John", "Jane Q.", "Wei", "Maria", "Ahmed", "Olga", "Kenji", "Ana Lucia"]
+    pool = [f"Surname{i}, {rnd.choice(firsts)}" if i % 2 else f"{rnd.choice(firsts)} Surname{i}"
+            for i in range(DISTINCT_AUTHORS)]
+    return [" and ".join(rnd.sample(pool, rnd.randint(1, 6))) for _ in range(N)]
+
+
+def bench(label, func):
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<48} {elapsed * 1000:8.1f} ms   ({N / elapsed:,.0f} values/s)")
+    return result
+
+
+def main():
+    rnd = random.Random(11)
+    bib_values = make_bib_authors(rnd)
+    # A library typically holds each author list a few times (re-imports, duplicates, renders).
+    stored = [rnd.choice(bib_values[:N // 4]) for _ in range(N)]
+    stored = normalize_authors_batch(stored)
+
+    print(f"{N} author fields, {DISTINCT_AUTHORS} distinct co-authors")
+    legacy = bench("normalize: legacy per entry", lambda: [
+        legacy_normalize_authors_from_bib({"author": v}) for v in bib_values
+    ])
+    clear_caches()
+    cold = bench("normalize: batch, cold cache", lambda: normalize_authors_batch(bib_values))
+    bench("normalize: batch, warm cache", lambda: normalize_authors_batch(bib_values))
+    assert legacy == cold
+
+    for name, legacy_format in (("APA", legacy_format_authors_apa),
+                                ("CHICAGO", legacy_format_authors_chicago),
+                                ("MLA", legacy_format_authors_mla)):
+        old = bench(f"format {name}: legacy per call", lambda: [legacy_format(v) for v in stored])
+        clear_caches()
+        STYLES[name].format_authors.cache_clear()
+        new = bench(f"format {name}: memoized, cold cache", lambda: [STYLES[name].format_authors(v) for v in stored])
+        bench(f"format {name}: memoized, warm cache", lambda: [STYLES[name].format_authors(v) for v in stored])
+        assert old == new, name
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Formatting throughput of the citation style engine: 100k references per style."""
+import random
+import time
+from collections import namedtuple
+
+from research_assistant.reference.authors import parse_authors
+from research_assistant.reference.citation_styles import STYLES
+
+N = 100_000
+DISTINCT_AUTHOR_LISTS = 5_000
+
+Ref = namedtuple("Ref", "title authors year journal volume issue pages")
+
+
+def make_refs():
+    rnd = random.Random(7)
+    surnames = [f"Surname{i}" for i in range(2_000)]
+    author_lists = [
+        "; ".join(f"{rnd.choice(surnames)}, {rnd.choice('ABCDEFGH')}." for _ in range(rnd.randint(1, 6)))
+        for _ in range(DISTINCT_AUTHOR_LISTS)
+    ]
+    return [
+        Ref(
+            title=f"A study of things, part {i}",
+            authors=rnd.choice(author_lists),
+            year=str(1980 + i % 45),
+            journal=rnd.choice(["Nature", "Science", "JMLR", None]),
+            volume=str(i % 60),
+            issue=str(i % 12),
+            pages=f"{i % 300}-{i % 300 + 12}",
+        )
+        for i in range(N)
+    ]
+
+
+def clear_caches():
+    parse_authors.cache_clear()
+    for style in STYLES.values():
+        style.format_authors.cache_clear()
+
+
+def main():
+    refs = make_refs()
+    for name, style in STYLES.items():
+        for label, render in (("text", style.text), ("html", style.html)):
+            clear_caches()
+            start = time.perf_counter()
+            for ref in refs:
+                render(ref)
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for ref in refs:
+                render(ref)
+            warm = time.perf_counter() - start
+            print(f"{name:<8} {label:<5} {N} refs   cold cache {cold * 1000:8.1f} ms   "
+                  f"warm cache {warm * 1000:8.1f} ms   ({N / warm:,.0f} refs/s)")
+
+
+if __name__ == "__main__":
+    main()
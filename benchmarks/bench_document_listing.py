@@ -0,0 +1,52 @@
+"""/writing_tool/documents over 100k document versions: cost follows the caller's documents only."""
+import time
+
+from sqlalchemy import event, insert
+
+from benchmarks.common import make_app, report, timeit
+
+USERS = 100
+DOCS_PER_USER = 200
+VERSIONS_PER_DOC = 5  # 100k versions in total
+
+
+def populate(db, CloudDocument, DocumentVersion):
+    docs = [
+        {"id": d, "title": f"Draft {d}", "owner_id": 1 + d % USERS}
+        for d in range(1, USERS * DOCS_PER_USER + 1)
+    ]
+    db.session.execute(insert(CloudDocument), docs)
+    versions = [
+        {"document_id": doc["id"], "major_version": 1, "minor_version": v, "file_key": f"documents/{doc['id']}_v1.{v}",
+         "file_url": "https://example.invalid/file", "uploaded_by_id": doc["owner_id"], "file_size": 0.5,
+         "is_current": v == VERSIONS_PER_DOC - 1}
+        for doc in docs for v in range(VERSIONS_PER_DOC)
+    ]
+    for i in range(0, len(versions), 50_000):
+        db.session.execute(insert(DocumentVersion), versions[i:i + 50_000])
+    db.session.commit()
+
+
+def main():
+    make_app()
+    from research_assistant.extensions import db
+    from research_assistant.writing_tool.listing import all_documents, documents_page
+    from research_assistant.writing_tool.models import CloudDocument, DocumentVersion
+
+    start = time.perf_counter()
+    populate(db, CloudDocument, DocumentVersion)
+    print(f"inserted {USERS * DOCS_PER_USER * VERSIONS_PER_DOC} versions in {time.perf_counter() - start:.1f}s")
+
+    queries = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: queries.append(1))
+    all_documents(1)
+    print(f"queries for a whole listing ({DOCS_PER_USER} documents): {len(queries)}")
+
+    report("first page (50 documents)", timeit(lambda: documents_page(1, 50)))
+    report("last page (50 documents)", timeit(lambda: documents_page(1, 50, after_id=USERS * (DOCS_PER_USER - 50))))
+    report("first page, current versions only", timeit(lambda: documents_page(1, 50, current_only=True)))
+    report(f"whole listing ({DOCS_PER_USER} documents)", timeit(lambda: all_documents(1), 50))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Citation .docx generation: fresh python-docx Document per render vs. the preloaded template."""
+from collections import namedtuple
+from io import BytesIO
+
+from docx import Document
+from docx.shared import Pt
+
+from benchmarks.common import report, timeit
+from research_assistant.reference.citation_styles import STYLES
+from research_assistant.reference.docx_templates import base_template
+
+Ref = namedtuple("Ref", "title authors year journal volume issue pages")
+
+REF = Ref("A study of things", "Smith, J.; Doe, A.; Roe, R.", "2021", "Nature", "12", "3", "45-67")
+
+
+def fresh_document():
+    doc = Document()
+    doc.styles["Normal"].font.size = Pt(11)
+    p = doc.add_paragraph()
+    p.paragraph_format.space_after = Pt(0)
+    STYLES["APA"].add_runs(p, REF)
+    bio = BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
+
+
+def preloaded_template():
+    template = base_template()
+    doc = template.new_document()
+    p = template.add_paragraph(doc)
+    p.paragraph_format.space_after = Pt(0)
+    STYLES["APA"].add_runs(p, REF)
+    return template.save(doc)
+
+
+def main():
+    base_template()
+    report("fresh Document() + save", timeit(fresh_document, repeat=200))
+    report("preloaded template", timeit(preloaded_template, repeat=200))
+
+
+if __name__ == "__main__":
+    main()
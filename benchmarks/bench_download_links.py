@@ -0,0 +1,35 @@
+"""Presigned download links for a 50-version listing page: first view signs, repeat views hit the cache."""
+from benchmarks.common import make_app, report, timeit
+
+VERSIONS = 50
+
+
+def main():
+    app = make_app()
+    app.config["AWS_S3_BUCKET_NAME"] = "bench-files"
+    from research_assistant.extensions import cache
+    from research_assistant.storage import presigned_urls
+
+    objects = [(f"blobs/{i:032x}", f"draft-{i}.docx") for i in range(VERSIONS)]
+
+    def cold():
+        presigned_urls.clear()
+        cache.clear()
+        presigned_urls.get_many(objects)
+
+    report(f"sign {VERSIONS} links (cold)", timeit(cold, 20))
+    presigned_urls.get_many(objects)
+    report(f"{VERSIONS} links from this worker", timeit(lambda: presigned_urls.get_many(objects), 200))
+
+    def other_worker():
+        presigned_urls.clear()
+        presigned_urls.get_many(objects)
+
+    report(f"{VERSIONS} links from the shared cache", timeit(other_worker, 200))
+    signed = presigned_urls.signed
+    presigned_urls.get_many(objects)
+    print(f"signatures on a repeat view: {presigned_urls.signed - signed}")
+
+
+if __name__ == "__main__":
+    main()
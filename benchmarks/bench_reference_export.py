@@ -0,0 +1,57 @@
+"""Streaming /references/export of a 100k-reference library: time and peak Python memory."""
+import random
+import time
+import tracemalloc
+
+from sqlalchemy import insert
+
+from benchmarks.common import make_app
+
+N = 100_000
+
+
+def populate(db, Reference):
+    rnd = random.Random(42)
+    rows = []
+    for i in range(N):
+        rows.append({
+            "user_id": 1,
+            "title": f"On the study of things, part {i}",
+            "authors": f"Author{rnd.randint(1, 5000)}, A.; Writer{rnd.randint(1, 5000)}, B.",
+            "year": str(1990 + i % 35),
+            "journal": "Journal of Things",
+            "volume": str(i % 60),
+            "pages": f"{i % 300}-{i % 300 + 12}",
+            "doi": f"10.1000/{i}",
+        })
+        if len(rows) == 10_000:
+            db.session.execute(insert(Reference), rows)
+            rows = []
+    db.session.commit()
+
+
+def main():
+    make_app()
+    from research_assistant.extensions import db
+    from research_assistant.reference.export import WRITERS, export_lines
+    from research_assistant.reference.models import Reference
+
+    populate(db, Reference)
+    query = Reference.query.filter_by(user_id=1)
+    for fmt in WRITERS:
+        start = time.perf_counter()
+        size = sum(len(piece) for piece in export_lines(query, fmt))
+        elapsed = time.perf_counter() - start
+
+        # Separate pass: tracemalloc slows the export down considerably.
+        tracemalloc.start()
+        for _ in export_lines(query, fmt):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{fmt:<8} {N} refs   {size / 1e6:6.1f} MB out   {elapsed:6.2f} s   "
+              f"peak {peak / 1e6:5.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
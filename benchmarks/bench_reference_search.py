@@ -0,0 +1,58 @@
+"""Query latency of /references/search at 100k references for one user."""
+import random
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import make_app, report, timeit
+
+USERS = 3
+PER_USER = 100_000
+WORDS = (
+    "learning deep neural network graph attention transformer protein climate "
+    "model survey causal inference robust optimization language vision quantum "
+    "federated privacy reinforcement policy sparse bayesian kernel retrieval"
+).split()
+JOURNALS = ["Nature", "Science", "NeurIPS", "ICML", "JMLR", "PLoS ONE", "Cell"]
+
+
+def populate(db, Reference):
+    rnd = random.Random(42)
+    for user_id in range(1, USERS + 1):
+        rows = []
+        for i in range(PER_USER):
+            rows.append({
+                "user_id": user_id,
+                "title": " ".join(rnd.choices(WORDS, k=8)),
+                "authors": f"Author{rnd.randint(1, 5000)}, A.; Writer{rnd.randint(1, 5000)}, B.",
+                "year": str(1990 + i % 35),
+                "journal": rnd.choice(JOURNALS),
+                "doi": f"10.1000/{user_id}.{i}",
+                "note": " ".join(rnd.choices(WORDS, k=4)) if i % 3 == 0 else None,
+            })
+            if len(rows) == 10_000:
+                db.session.execute(insert(Reference), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(Reference), rows)
+        db.session.commit()
+
+
+def main():
+    make_app()
+    from research_assistant.extensions import db
+    from research_assistant.reference.models import Reference
+    from research_assistant.reference.search import search_references
+
+    start = time.perf_counter()
+    populate(db, Reference)
+    print(f"inserted {USERS * PER_USER} references (index maintained by triggers) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    for q in ["quantum", "deep learning", "causal infer", "federated privacy kernel", "Author42", "nosuchword"]:
+        report(f"q={q!r} page 1", timeit(lambda: search_references(1, q, limit=20)))
+    report("q='learning' page 50", timeit(lambda: search_references(1, "learning", limit=20, offset=980)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Latency of "more like this" (reference.similarity) on a 50k-reference library."""
+import random
+import time
+
+from sqlalchemy import insert, update
+
+from benchmarks.common import make_app, report, timeit
+
+PER_USER = 50_000
+VOCABULARY = 5_000
+JOURNALS = ["Nature", "Science", "NeurIPS", "ICML", "JMLR", "PLoS ONE", "Cell", "Physical Review Letters"]
+
+
+def populate(db, Reference):
+    rnd = random.Random(42)
+    # Zipf-like word frequencies, as in real titles.
+    words = [f"term{i}" for i in range(VOCABULARY)]
+    weights = [1.0 / (i + 1) for i in range(VOCABULARY)]
+    rows = []
+    for i in range(PER_USER):
+        rows.append({
+            "user_id": 1,
+            "title": " ".join(rnd.choices(words, weights, k=rnd.randint(6, 14))),
+            "authors": f"Author{rnd.randint(1, 5000)}, A.",
+            "year": str(1990 + i % 35),
+            "journal": rnd.choice(JOURNALS),
+            "note": " ".join(rnd.choices(words, weights, k=12)) if i % 4 == 0 else None,
+        })
+        if len(rows) == 10_000:
+            db.session.execute(insert(Reference), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Reference), rows)
+    db.session.commit()
+
+
+def main():
+    make_app()
+    from research_assistant.extensions import db
+    from research_assistant.reference.models import Reference
+    from research_assistant.reference.similarity import similarity_indexes
+
+    populate(db, Reference)
+    rnd = random.Random(7)
+    ids = list(range(1, PER_USER + 1))
+
+    start = time.perf_counter()
+    similarity_indexes.similar(1, 1)
+    print(f"built index over {PER_USER} references in {time.perf_counter() - start:.2f}s")
+
+    report("top-10, unchanged library", timeit(lambda: similarity_indexes.similar(1, rnd.choice(ids)), 200))
+    report("top-100, unchanged library", timeit(lambda: similarity_indexes.similar(1, rnd.choice(ids), k=100), 200))
+
+    def edit_then_query():
+        ref_id = rnd.choice(ids)
+        db.session.execute(update(Reference).where(Reference.id == ref_id).values(title=f"edited {ref_id}"))
+        db.session.commit()
+        similarity_indexes.similar(1, ref_id)
+
+    report("one edit, then top-10", timeit(edit_then_query, 100))
+
+    def import_then_query():
+        db.session.execute(insert(Reference), [
+            {"user_id": 1, "title": f"imported term{i} term{i + 1}", "authors": "X, Y.", "year": "2024"}
+            for i in range(500)
+        ])
+        db.session.commit()
+        similarity_indexes.similar(1, 1)
+
+    report("500-row import, then top-10", timeit(import_then_query, 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""/references/stats latency from the rollups, against the live GROUP BY it replaces."""
+import random
+
+from sqlalchemy import insert
+
+from benchmarks.common import make_app, report, timeit
+
+SIZES = (1_000, 10_000, 100_000)
+JOURNALS = [f"Journal {i}" for i in range(300)]
+
+
+def populate(db, Reference, record_inserted, user_id, count):
+    rnd = random.Random(user_id)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "user_id": user_id,
+            "title": f"Paper {i}",
+            "authors": "Doe, J.",
+            "year": str(rnd.randint(1980, 2025)),
+            "journal": rnd.choice(JOURNALS),
+            "completed": rnd.random() < 0.3,
+        })
+        if len(rows) == 10_000:
+            db.session.execute(insert(Reference), rows)
+            record_inserted(rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Reference), rows)
+        record_inserted(rows)
+    db.session.commit()
+
+
+def main():
+    make_app()
+    from research_assistant.extensions import db
+    from research_assistant.reference.models import Reference
+    from research_assistant.reference.rollups import library_stats, live_aggregates, record_inserted, verify
+
+    for user_id, size in enumerate(SIZES, start=1):
+        populate(db, Reference, record_inserted, user_id, size)
+    assert not verify(), "rollups disagree with the live aggregate"
+
+    for user_id, size in enumerate(SIZES, start=1):
+        report(f"stats from rollups, {size} refs", timeit(lambda: library_stats(user_id)))
+        report(f"live aggregate, {size} refs", timeit(lambda: live_aggregates(user_id), 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Streaming multipart uploads against a local S3 stand-in (moto): time and parts held in memory.
+
+Needs the dev requirements (moto).
+"""
+import io
+import os
+import threading
+
+import boto3
+from moto import mock_aws
+
+from benchmarks.common import make_app, report, timeit
+
+SIZE = 64 * 1024 * 1024
+BUCKET = "bench-uploads"
+
+
+class CountingClient:
+    """Wraps an S3 client to record the most parts being uploaded at once."""
+
+    def __init__(self, client):
+        self.client = client
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def upload_part(self, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return self.client.upload_part(**kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def main():
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        app = make_app()
+        from research_assistant.storage import upload_settings, upload_stream
+
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        app.config["AWS_S3_BUCKET_NAME"] = BUCKET
+        body = os.urandom(SIZE)
+
+        for part_mb, concurrency, budget_mb in ((8, 4, 64), (8, 4, 16), (16, 8, 64)):
+            app.config.update(
+                STORAGE_PART_SIZE=part_mb * 1024 * 1024,
+                STORAGE_UPLOAD_CONCURRENCY=concurrency,
+                STORAGE_UPLOAD_MAX_MEMORY=budget_mb * 1024 * 1024,
+            )
+            counting = CountingClient(client)
+            stats = timeit(lambda: upload_stream(io.BytesIO(body), "bench/obj", client=counting), 5)
+            report(f"{SIZE >> 20} MiB, {part_mb} MiB parts x{concurrency}, {budget_mb} MiB", stats)
+            print(f"  parts in flight: peak {counting.peak}, budget {upload_settings()[2]}")
+
+        report("boto3 upload_fileobj (defaults)", timeit(
+            lambda: client.upload_fileobj(io.BytesIO(body), BUCKET, "bench/obj"), 5
+        ))
+
+
+if __name__ == "__main__":
+    main()
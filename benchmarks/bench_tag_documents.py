@@ -0,0 +1,62 @@
+"""/tags/all-docs-with-tags over a 1M-reference database: cost follows the caller's library only."""
+import random
+import time
+
+from sqlalchemy import event, insert
+
+from benchmarks.common import make_app, report, timeit
+
+USERS = 200
+PER_USER = 5_000  # 1M references in total
+TAGS_PER_USER = 20
+
+
+def populate(db, Reference, Tag, DocumentTag):
+    rnd = random.Random(42)
+    tag_rows = [{"user_id": u, "name": f"tag{t}"} for u in range(1, USERS + 1) for t in range(TAGS_PER_USER)]
+    db.session.execute(insert(Tag), tag_rows)
+    rows = []
+    for i in range(USERS * PER_USER):
+        rows.append({"user_id": 1 + i % USERS, "title": f"Paper {i}", "authors": "Doe, J.", "year": "2020"})
+        if len(rows) == 50_000:
+            db.session.execute(insert(Reference), rows)
+            rows = []
+    links = []
+    for ref_id in range(1, USERS * PER_USER + 1):
+        user_id = 1 + (ref_id - 1) % USERS
+        for t in rnd.sample(range(TAGS_PER_USER), rnd.randint(0, 3)):
+            links.append({"document_id": ref_id, "tag_id": (user_id - 1) * TAGS_PER_USER + t + 1})
+        if len(links) >= 50_000:
+            db.session.execute(insert(DocumentTag), links)
+            links = []
+    if links:
+        db.session.execute(insert(DocumentTag), links)
+    db.session.commit()
+
+
+def main():
+    make_app()
+    from research_assistant.extensions import db
+    from research_assistant.reference.models import Reference
+    from research_assistant.tag.documents import documents_page, stream_all
+    from research_assistant.tag.models import DocumentTag, Tag
+
+    start = time.perf_counter()
+    populate(db, Reference, Tag, DocumentTag)
+    print(f"inserted {USERS * PER_USER} references in {time.perf_counter() - start:.1f}s")
+
+    queries = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: queries.append(1))
+    documents_page(1, 50)
+    print(f"queries per page: {len(queries)}")
+
+    last_id = USERS * (PER_USER - 60)
+    report("first page (50)", timeit(lambda: documents_page(1, 50)))
+    report("deep page (50, near the end)", timeit(lambda: documents_page(1, 50, after_id=last_id)))
+    report("page filtered by tag", timeit(lambda: documents_page(1, 50, tag_id=1)))
+    report(f"stream whole library ({PER_USER})", timeit(lambda: "".join(stream_all(1)), 10))
+    report("stream library filtered by tag", timeit(lambda: "".join(stream_all(1, tag_id=1)), 10))
+
+
+if __name__ == "__main__":
+    main()
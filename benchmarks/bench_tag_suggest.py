@@ -0,0 +1,48 @@
+"""/tags/suggest over a user with 50k tags: prefix lookups of every width against the in-memory index."""
+import random
+import string
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import make_app, report, timeit
+
+TAGS = 50_000
+REFERENCES = 20_000
+
+
+def populate(db, Reference, Tag, DocumentTag):
+    rnd = random.Random(42)
+    names = {"".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 14))) for _ in range(TAGS * 2)}
+    db.session.execute(insert(Tag), [{"user_id": 1, "name": n} for n in sorted(names)[:TAGS]])
+    db.session.execute(insert(Reference), [
+        {"user_id": 1, "title": f"Paper {i}", "authors": "Doe, J.", "year": "2020"} for i in range(REFERENCES)
+    ])
+    # Skewed usage: a few tags are on many references.
+    links = {(rnd.randint(1, REFERENCES), min(int(rnd.paretovariate(0.5)), TAGS)) for _ in range(100_000)}
+    db.session.execute(insert(DocumentTag), [{"document_id": d, "tag_id": t} for d, t in links])
+    db.session.commit()
+
+
+def main():
+    make_app()
+    from research_assistant.extensions import db
+    from research_assistant.reference.models import Reference
+    from research_assistant.reference.rollups import rebuild
+    from research_assistant.tag.models import DocumentTag, Tag
+    from research_assistant.tag.suggest import TagIndex, tag_suggestions
+
+    populate(db, Reference, Tag, DocumentTag)
+    rebuild(1)
+
+    start = time.perf_counter()
+    TagIndex(1)
+    print(f"index build ({TAGS} tags): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    tag_suggestions.suggest(1, "")
+    for q in ("", "m", "ma", "mat", "math", "zzzzq"):
+        report(f"suggest q={q!r}", timeit(lambda: tag_suggestions.suggest(1, q), 2000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Shared setup for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite database (or ``BENCH_DATABASE_URL``)
+using the normal app factory, e.g.::
+
+    python -m benchmarks.bench_reference_search
+"""
+import atexit
+import os
+import statistics
+import tempfile
+import time
+
+
+def make_app():
+    """Create the app on a scratch database and push an app context."""
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        fd, path = tempfile.mkstemp(suffix=".sqlite", prefix="bench_")
+        os.close(fd)
+        atexit.register(os.remove, path)
+        url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = url
+
+    from research_assistant.app import create_app
+
+    app = create_app()
+    app.app_context().push()
+    return app
+
+
+def timeit(func, repeat=50):
+    """Call ``func`` ``repeat`` times; return (p50, p95, max) in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples), p95, samples[-1]
+
+
+def report(label, stats):
+    p50, p95, worst = stats
+    print(f"{label:<40} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms   max {worst:8.3f} ms")
@@ -7,17 +7,28 @@ import sys
 from flask import Flask, jsonify
 from flask_cors import CORS
 from sqlalchemy import inspect
-from flask_migrate import upgrade as migrate_upgrade
 from research_assistant import commands, public, user
+from research_assistant.database import add_missing_columns, create_missing_indexes, drop_unique
 from research_assistant.ai_assistant.views import blueprint as ai_bp
 from research_assistant.brain.views import brainstorm_bp
 from research_assistant.chat.views import chat_bp
 from research_assistant.dashboard.views import dashboard as dashboard_blueprint
 from research_assistant.outline.views import outline_bp
 from research_assistant.planning.views import planning_bp
+from research_assistant.tag.batch import remove_duplicate_links
+from research_assistant.tag.models import DocumentTag, Tag
 from research_assistant.tag.views import blueprint as tag_bp
+from research_assistant.writing_tool.listing import backfill_owners
+from research_assistant.writing_tool.models import CloudDocument, DocumentVersion
 from research_assistant.writing_tool.routes import writing_tool_bp
-from research_assistant.reference.models import Reference
+from research_assistant.reference.models import Reference, ReferenceRollup
+from research_assistant.reference.citation_cache import citation_cache
+from research_assistant.reference.dedup import backfill_keys
+from research_assistant.reference.rollups import rebuild as rebuild_rollups
+from research_assistant.reference.search import ensure_search_index
+from research_assistant.reference.similarity import backfill_updated_at, similarity_indexes
+from research_assistant.tag.suggest import tag_suggestions
+from research_assistant.storage import presigned_urls
 from research_assistant.reference.views import bp as reference_bp
 from research_assistant.user_settings.views import settings_bp
 from research_assistant.extensions import (
@@ -63,7 +74,26 @@ def create_app(config_object="research_assistant.settings"):
     # 启动时尝试检查或创建表，不影响启动
     with app.app_context():
         try:
+            new_rollups = not inspect(db.engine).has_table(ReferenceRollup.__tablename__)
             db.create_all()
+            added_columns = add_missing_columns(
+                Reference.__table__, CloudDocument.__table__, DocumentVersion.__table__
+            )
+            create_missing_indexes(Reference.__table__)
+            relinked = remove_duplicate_links()
+            # Tag names used to be unique across all users.
+            drop_unique(Tag.__table__, ["name"])
+            create_missing_indexes(Tag.__table__, DocumentTag.__table__)
+            create_missing_indexes(CloudDocument.__table__, DocumentVersion.__table__)
+            ensure_search_index()
+            if "reference.fingerprint" in added_columns:
+                backfill_keys()
+            if "reference.updated_at" in added_columns:
+                backfill_updated_at()
+            if "cloud_documents.owner_id" in added_columns:
+                backfill_owners()
+            if new_rollups or relinked:
+                rebuild_rollups()
         except Exception as e:
             app.logger.warning(
                 "Skipping table inspection on startup; will create_all later if needed",
@@ -93,6 +123,10 @@ def register_extensions(app):
     migrate.init_app(app, db)
     flask_static_digest.init_app(app)
     jwt.init_app(app)
+    citation_cache.init_app(app)
+    similarity_indexes.init_app(app)
+    tag_suggestions.init_app(app)
+    presigned_urls.init_app(app)
     return None
 
 
@@ -134,6 +168,12 @@ def register_commands(app):
     """Register Click commands."""
     app.cli.add_command(commands.test)
     app.cli.add_command(commands.lint)
+    app.cli.add_command(commands.rebuild_search_index)
+    app.cli.add_command(commands.backfill_dedup_keys)
+    app.cli.add_command(commands.build_metadata_index)
+    app.cli.add_command(commands.rebuild_reference_stats)
+    app.cli.add_command(commands.check_tag_counts)
+    app.cli.add_command(commands.purge_pending_uploads)
 
 
 def configure_logger(app):
@@ -148,4 +188,3 @@ def configure_logger(app):
 if __name__ == "__main__":
     app = create_app()
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)))  # nosec B104
-
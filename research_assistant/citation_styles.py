@@ -1,9 +1,2 @@
-def generate_citation(ref, style="APA"):
-    if style == "APA":
-        return f"{ref.authors} ({ref.year}). {ref.title}. {ref.source}."
-    elif style == "MLA":
-        return f"{ref.authors}. \"{ref.title}.\" {ref.source}, {ref.year}."
-    elif style == "Chicago":
-        return f"{ref.authors}. {ref.title}. {ref.source}, {ref.year}."
-    else:
-        return f"{ref.authors} ({ref.year}). {ref.title}."
\ No newline at end of file
+# Kept for backwards compatibility; the style engine lives in reference/citation_styles.py.
+from research_assistant.reference.citation_styles import generate_citation  # noqa: F401
@@ -5,6 +5,7 @@ from glob import glob
 from subprocess import call
 
 import click
+from flask.cli import with_appcontext
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 PROJECT_ROOT = os.path.join(HERE, os.pardir)
@@ -81,3 +82,93 @@ def lint(fix_imports, check):
         execute_tool("Fixing import order", "isort", *isort_args)
     execute_tool("Formatting style", "black", *black_args)
     execute_tool("Checking code style", "flake8")
+
+
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index():
+    """Create the reference full-text index if missing and rebuild its contents."""
+    from research_assistant.reference.search import ensure_search_index
+
+    ensure_search_index(rebuild=True)
+    click.echo("Reference search index rebuilt.")
+
+
+@click.command("backfill-dedup-keys")
+@with_appcontext
+def backfill_dedup_keys():
+    """Compute missing DOI keys / title fingerprints used for duplicate detection."""
+    from research_assistant.reference.dedup import backfill_keys
+
+    click.echo(f"Updated {backfill_keys()} references.")
+
+
+@click.command("build-metadata-index")
+@click.argument("dump", type=click.Path(exists=True, dir_okay=False))
+@click.option("--output", "-o", default=None, help="Index file (defaults to METADATA_INDEX_PATH).")
+@with_appcontext
+def build_metadata_index(dump, output):
+    """Build the offline DOI/title metadata index from a Crossref-style JSONL dump."""
+    from flask import current_app
+
+    from research_assistant.reference.enrichment import build_index
+
+    output = output or current_app.config.get("METADATA_INDEX_PATH")
+    if not output:
+        raise click.UsageError("Pass --output or set METADATA_INDEX_PATH.")
+    click.echo(f"Indexed {build_index(dump, output)} works into {output}.")
+
+
+@click.command("rebuild-reference-stats")
+@click.option("--user-id", type=int, default=None, help="Only this user's library.")
+@click.option("--verify-only", is_flag=True, help="Compare with a live aggregate without rebuilding.")
+@with_appcontext
+def rebuild_reference_stats(user_id, verify_only):
+    """Recompute the /references/stats rollups from scratch and verify them."""
+    from research_assistant.reference.rollups import rebuild, verify
+
+    if not verify_only:
+        click.echo(f"Rebuilt {rebuild(user_id)} rollup rows.")
+    mismatches = verify(user_id)
+    for key, stored, live in mismatches[:50]:
+        click.echo(f"  {key}: stored {stored}, live {live}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} rollup rows disagree with the live aggregate.")
+    click.echo("Rollups match the live aggregate.")
+
+
+@click.command("check-tag-counts")
+@click.option("--user-id", type=int, default=None, help="Only this user's tags.")
+@click.option("--repair", is_flag=True, help="Recompute the counters that disagree.")
+@with_appcontext
+def check_tag_counts(user_id, repair):
+    """Compare the tag usage counters with document_tags, optionally repairing them."""
+    from research_assistant.reference.rollups import rebuild, verify
+
+    mismatches = verify(user_id, dimensions=("tag",))
+    for key, stored, live in mismatches[:50]:
+        click.echo(f"  user {key[0]} tag {key[2]}: stored {stored}, live {live}")
+    if mismatches and repair:
+        rebuild(user_id, dimensions=("tag",))
+        mismatches = verify(user_id, dimensions=("tag",))
+        click.echo("Repaired." if not mismatches else "Still inconsistent after repair.")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} tag counters disagree with document_tags.")
+    click.echo("Tag counters are consistent.")
+
+
+@click.command("purge-pending-uploads")
+@click.option("--older-than", type=int, default=24, show_default=True, help="Age in hours.")
+@with_appcontext
+def purge_pending_uploads(older_than):
+    """Delete direct document uploads that were started but never completed, and their files."""
+    from datetime import timedelta
+
+    from research_assistant.writing_tool.blobs import delete_objects
+    from research_assistant.writing_tool.versions import purge_pending
+
+    keys = purge_pending(timedelta(hours=older_than))
+    failed = delete_objects(keys)
+    click.echo(f"Purged {len(keys)} pending uploads.")
+    if failed:
+        click.echo(f"Could not delete {len(failed)} files: {', '.join(failed)}", err=True)
@@ -2,6 +2,9 @@
 """Database module, including the SQLAlchemy database object and DB-related utilities."""
 from typing import Optional, Type, TypeVar
 
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+
 from .extensions import db
 
 T = TypeVar("T", bound="PkModel")
@@ -86,3 +89,98 @@ def reference_col(
         nullable=nullable,
         **column_kwargs,
     )
+
+
+def create_missing_indexes(*tables):
+    """Create indexes declared on tables that already exist.
+
+    ``db.create_all`` skips existing tables entirely, so indexes added to a
+    model later would otherwise never reach a deployed database.
+    """
+    for table in tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def add_missing_columns(*tables):
+    """Add nullable columns declared on models to tables that already exist.
+
+    Like indexes, columns added to a model later are not created by
+    ``db.create_all``. Returns the "table.column" names that were added.
+    """
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    added = []
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            ddl = "ALTER TABLE {} ADD COLUMN {} {}".format(
+                preparer.format_table(table),
+                preparer.format_column(column),
+                column.type.compile(dialect=db.engine.dialect),
+            )
+            with db.engine.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def drop_unique(table, columns):
+    """Drop a UNIQUE constraint or index on exactly ``columns`` that the model no longer declares.
+
+    Like new columns, narrowed uniqueness (e.g. from global to per user)
+    never reaches an existing table on its own. SQLite cannot drop a table
+    constraint, so there the table is rebuilt from the model; its declared
+    indexes are then recreated by ``create_missing_indexes``. Returns True
+    if anything was dropped.
+    """
+    inspector = inspect(db.engine)
+    if not inspector.has_table(table.name):
+        return False
+    columns = list(columns)
+    declared = {index.name for index in table.indexes}
+    preparer = db.engine.dialect.identifier_preparer
+    dropped = False
+    for index in inspector.get_indexes(table.name):
+        stale = index.get("unique") and index["column_names"] == columns and index["name"] not in declared
+        if stale and "duplicates_constraint" not in index:
+            with db.engine.begin() as conn:
+                conn.execute(text(f"DROP INDEX {preparer.quote(index['name'])}"))
+            dropped = True
+
+    constraints = [c for c in inspector.get_unique_constraints(table.name) if c["column_names"] == columns]
+    if not constraints:
+        return dropped
+    if db.engine.dialect.name == "sqlite":
+        _rebuild_sqlite_table(table, [c["name"] for c in inspector.get_columns(table.name)])
+    else:
+        with db.engine.begin() as conn:
+            for constraint in constraints:
+                conn.execute(text("ALTER TABLE {} DROP CONSTRAINT {}".format(
+                    preparer.format_table(table), preparer.quote(constraint["name"])
+                )))
+    return True
+
+
+def _rebuild_sqlite_table(table, existing_columns):
+    """Recreate ``table`` from its model definition, keeping the rows (SQLite has no DROP CONSTRAINT)."""
+    preparer = db.engine.dialect.identifier_preparer
+    rebuilt = table.to_metadata(MetaData(), name=f"{table.name}__rebuild")
+    names = ", ".join(preparer.quote(c.name) for c in table.columns if c.name in existing_columns)
+    old, new = preparer.format_table(table), preparer.format_table(rebuilt)
+    with db.engine.connect() as conn:
+        # Other tables' foreign keys to the table must survive the DROP.
+        enforced = conn.exec_driver_sql("PRAGMA foreign_keys").scalar()
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        conn.commit()
+        with conn.begin():
+            conn.execute(CreateTable(rebuilt))
+            conn.execute(text(f"INSERT INTO {new} ({names}) SELECT {names} FROM {old}"))
+            conn.execute(text(f"DROP TABLE {old}"))
+            conn.execute(text(f"ALTER TABLE {new} RENAME TO {old}"))
+        conn.exec_driver_sql(f"PRAGMA foreign_keys={'ON' if enforced else 'OFF'}")
+        conn.commit()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token holding the sort key and direction it
+was issued for plus the (sort value, id) of the last row of the page. The
+next page starts strictly after that pair, so paging stays stable while rows
+are inserted and costs one index range scan regardless of page depth.
+
+NULL sort values come last in either direction (NULLS LAST), and the
+predicate continuing after a row accounts for them: after a non-NULL value
+the NULL rows are still to come, after a NULL value only NULL rows with a
+later id are.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, nullslast, or_
+from sqlalchemy.types import Date, DateTime
+
+
+class CursorError(ValueError):
+    """Raised for malformed cursors or cursors issued for another ordering."""
+
+
+def _dump(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _load(column, value):
+    """The cursor's ``value`` as a Python value of ``column``'s type; raises CursorError."""
+    if value is None:
+        return None
+    try:
+        if isinstance(column.type, DateTime):
+            return datetime.fromisoformat(value)
+        if isinstance(column.type, Date):
+            return date.fromisoformat(value)
+        expected = column.type.python_type
+    except (ValueError, TypeError, NotImplementedError):
+        raise CursorError("Invalid cursor")
+    if not isinstance(value, expected):
+        raise CursorError("Invalid cursor")
+    return value
+
+
+def encode_cursor(sort_key, descending, last_value, last_id):
+    """Build the cursor pointing after the row (last_value, last_id)."""
+    payload = {"k": sort_key, "d": bool(descending), "v": [_dump(last_value), last_id]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_key, descending):
+    """Return (last_value, last_id) from a cursor; raises CursorError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value, last_id = payload["v"]
+    except (ValueError, TypeError, KeyError):
+        raise CursorError("Invalid cursor")
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise CursorError("Invalid cursor")
+    if payload.get("k") != sort_key or payload.get("d") != bool(descending):
+        raise CursorError("Cursor does not match sort_by/order")
+    return value, last_id
+
+
+def keyset_order(sort_col, id_col, descending=False):
+    """ORDER BY clauses for (sort_col, id_col) that keyset_page continues correctly."""
+    if descending:
+        return nullslast(sort_col.desc()), id_col.desc()
+    return nullslast(sort_col.asc()), id_col.asc()
+
+
+def _after(sort_col, id_col, value, last_id, descending):
+    """Rows ordered after (value, last_id) by keyset_order."""
+    later_id = id_col < last_id if descending else id_col > last_id
+    if value is None:
+        return and_(sort_col.is_(None), later_id)
+    later_value = sort_col < value if descending else sort_col > value
+    return or_(later_value, and_(sort_col == value, later_id), sort_col.is_(None))
+
+
+def keyset_page(query, sort_col, id_col, limit, cursor=None, sort_key=None, descending=False):
+    """
+    Apply keyset ordering/filtering to ``query`` and fetch one page.
+
+    Rows are ordered by (sort_col, id_col) so ties on the sort column are
+    broken by id; NULL sort values come last. Returns (rows, next_cursor); next_cursor is None on the
+    last page. ``sort_key`` is the public name stored in the cursor.
+    """
+    sort_key = sort_key or sort_col.key
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_key, descending)
+        value = _load(sort_col, value)
+        query = query.filter(_after(sort_col, id_col, value, last_id, descending))
+
+    query = query.order_by(*keyset_order(sort_col, id_col, descending))
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(sort_key, descending, getattr(last, sort_col.key), getattr(last, id_col.key))
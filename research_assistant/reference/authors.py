@@ -0,0 +1,120 @@
+"""Author-name parsing shared by .bib import, citation styles and export.
+
+Two representations are in play:
+
+  BibTeX   'Smith, John and Jane Q. Doe'   (import input)
+  stored   'Smith, J.; Doe, J. Q.'         (``Reference.authors``)
+
+The same co-authors recur throughout a library, so both directions are
+memoized in bounded LRU caches: BibTeX names per individual name, stored
+strings per whole author list (as tuples of ``ParsedAuthor``). The batch
+functions additionally collapse repeated values within one call, so a
+column of author strings is normalized with one cache lookup per distinct
+value.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+AUTHOR_CACHE_SIZE = 65536
+NAME_CACHE_SIZE = 65536
+
+ParsedAuthor = namedtuple("ParsedAuthor", "raw last first")
+
+
+# -------------------- Stored author lists --------------------
+
+def _split_author_item(item):
+    """
+    Input like: 'Lastname, F.' or 'Lastname, First Middle'
+    Return (last, first_part) without surrounding spaces/dots normalization.
+    """
+    if "," in item:
+        last, first = [x.strip() for x in item.split(",", 1)]
+    else:
+        # fallback: space-split -> last token as last name
+        tokens = item.split()
+        last = tokens[-1]
+        first = " ".join(tokens[:-1])
+    return last, first
+
+
+def split_authors(authors):
+    """'A, B.; C, D.' -> (ParsedAuthor('A, B.', 'A', 'B.'), ParsedAuthor('C, D.', 'C', 'D.'))"""
+    parsed = []
+    for item in (authors or "").split(";"):
+        item = item.strip()
+        if item:
+            parsed.append(ParsedAuthor(item, *_split_author_item(item)))
+    return tuple(parsed)
+
+
+@lru_cache(maxsize=AUTHOR_CACHE_SIZE)
+def parse_authors(authors):
+    """Cached ``split_authors``; for one-pass jobs over many lists use ``split_authors``."""
+    return split_authors(authors)
+
+
+def parse_authors_batch(values):
+    """``parse_authors`` for a column of stored author strings, one lookup per distinct value."""
+    parsed = {}
+    for value in values:
+        if value not in parsed:
+            parsed[value] = parse_authors(value)
+    return [parsed[value] for value in values]
+
+
+# -------------------- BibTeX names --------------------
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def normalize_bib_name(name):
+    """'Lastname, First Middle' or 'First Middle Lastname' -> 'Lastname, F. M.'"""
+    if "," in name:
+        last, first = [x.strip() for x in name.split(",", 1)]
+    else:
+        tokens = name.split()
+        last = tokens[-1]
+        first = " ".join(tokens[:-1])
+    initials = "".join([s[0].upper() + "." for s in first.split() if s])
+    return f"{last}, {initials}".strip()
+
+
+def normalize_bib_authors(raw):
+    """One BibTeX 'author' field -> 'Lastname, F.; Foo, B.'"""
+    return "; ".join(
+        normalize_bib_name(part) for part in (p.strip() for p in (raw or "").split(" and ")) if part
+    )
+
+
+def normalize_authors_batch(raw_values):
+    """
+    Normalize a batch of BibTeX 'author' fields to 'Lastname, F.; Foo, B.'.
+    Identical fields are normalized once per batch, and every distinct name
+    once per process (until evicted).
+    """
+    normalized = {}
+    out = []
+    for raw in raw_values:
+        raw = (raw or "").strip()
+        value = normalized.get(raw)
+        if value is None:
+            value = normalized[raw] = normalize_bib_authors(raw)
+        out.append(value)
+    return out
+
+
+def normalize_authors_from_bib(entry):
+    """Convert a single entry's BibTeX 'author' to 'Lastname, F.; Foo, B.'"""
+    return normalize_bib_authors((entry.get("author") or "").strip())
+
+
+def cache_stats():
+    """Hit/miss/size counters of the author caches."""
+    return {
+        name: func.cache_info()._asdict()
+        for name, func in (("parse_authors", parse_authors), ("normalize_bib_name", normalize_bib_name))
+    }
+
+
+def clear_caches():
+    parse_authors.cache_clear()
+    normalize_bib_name.cache_clear()
@@ -0,0 +1,158 @@
+"""Set-based bulk mutations of a user's references.
+
+A batch targets either an explicit ``ids`` list or a ``filter`` object,
+resolved to the matching ids with one query (for a list, that query is the
+ownership check). Updates and deletes are then UPDATE/DELETE statements over
+``id IN (...)`` - one per STATEMENT_CHUNK ids, to stay under bind-parameter
+limits - each also scoped by ``user_id``, so another user's rows can never
+be touched. The caller commits them as one transaction.
+
+Filter keys (all optional, combined with AND; at least one is required,
+``{"all": true}`` selects the whole library):
+
+  tag        tag id the reference carries
+  completed  true | false
+  year       exact year; year_from / year_to for an inclusive range
+  source, journal   exact match
+"""
+from sqlalchemy import and_, delete, select, update
+
+from research_assistant.extensions import db
+from research_assistant.reference.dedup import refresh_keys
+from research_assistant.reference.models import Reference
+from research_assistant.reference.rollups import TRACKED_FIELDS, track_changes
+from research_assistant.tag.models import DocumentTag, Tag
+
+MAX_BATCH_IDS = 5000
+STATEMENT_CHUNK = 5000
+# Columns a batch update may set; the first three can not be emptied.
+UPDATABLE_FIELDS = (
+    "title", "authors", "year", "source", "journal", "volume", "issue", "pages",
+    "doi", "url", "month", "note", "completed",
+)
+REQUIRED_FIELDS = ("title", "authors", "year")
+# filter key -> (required type, condition builder)
+FILTERS = {
+    "tag": (int, lambda v: Reference.tags.any(Tag.id == v)),
+    "completed": (bool, lambda v: Reference.completed.is_(v)),
+    "year": (None, lambda v: Reference.year == str(v)),
+    "year_from": (None, lambda v: Reference.year >= str(v)),
+    "year_to": (None, lambda v: Reference.year <= str(v)),
+    "source": (str, lambda v: Reference.source == v),
+    "journal": (str, lambda v: Reference.journal == v),
+}
+
+
+class BatchError(ValueError):
+    """Invalid batch request; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, ids=None):
+        super().__init__(message)
+        self.status = status
+        self.ids = ids
+
+
+def _filter_condition(flt):
+    if not isinstance(flt, dict):
+        raise BatchError("filter must be an object")
+    unknown = sorted(set(flt) - set(FILTERS) - {"all"})
+    if unknown:
+        raise BatchError(f"Unknown filter keys: {', '.join(unknown)}")
+    if not flt or (set(flt) == {"all"} and flt["all"] is not True):
+        raise BatchError('Empty filter; use {"all": true} to select the whole library')
+
+    conditions = []
+    for key, value in flt.items():
+        if key == "all" or value is None:
+            continue
+        expected, build = FILTERS[key]
+        if expected is not None and not isinstance(value, expected):
+            raise BatchError(f"filter.{key} must be of type {expected.__name__}")
+        conditions.append(build(value))
+    return conditions
+
+
+def chunks(ids, size=STATEMENT_CHUNK):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def select_targets(user_id, data):
+    """
+    Resolve a batch request body to the sorted ids of the user's targeted references.
+    Raises BatchError; a 404 lists ids that are missing or not the user's.
+    """
+    ids, flt = data.get("ids"), data.get("filter")
+    if (ids is None) == (flt is None):
+        raise BatchError("Provide exactly one of ids or filter")
+
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            raise BatchError("ids must be a list of integers")
+        if len(ids) > MAX_BATCH_IDS:
+            raise BatchError(f"At most {MAX_BATCH_IDS} ids per batch")
+        ids = sorted(set(ids))
+        owned = set(db.session.scalars(
+            select(Reference.id).where(Reference.user_id == user_id, Reference.id.in_(ids))
+        ))
+        missing = [i for i in ids if i not in owned]
+        if missing:
+            raise BatchError("References not found", status=404, ids=missing[:100])
+        return ids
+
+    condition = and_(Reference.user_id == user_id, *_filter_condition(flt))
+    return db.session.scalars(select(Reference.id).where(condition).order_by(Reference.id)).all()
+
+
+def clean_values(values):
+    """Validate the ``set`` object of a batch update; returns the column values."""
+    if not isinstance(values, dict) or not values:
+        raise BatchError("set must be a non-empty object")
+    unknown = sorted(set(values) - set(UPDATABLE_FIELDS))
+    if unknown:
+        raise BatchError(f"Fields can not be batch-updated: {', '.join(unknown)}")
+    empty = [f for f in REQUIRED_FIELDS if f in values and not values[f]]
+    if empty:
+        raise BatchError(f"Fields can not be empty: {', '.join(empty)}")
+    values = dict(values)
+    if "year" in values:
+        values["year"] = str(values["year"])
+    if "completed" in values and not isinstance(values["completed"], bool):
+        raise BatchError("completed must be true or false")
+    return values
+
+
+def update_references(user_id, ids, values):
+    """Set ``values`` on the targeted rows; returns the number of rows updated."""
+    updated = 0
+    with track_changes(ids if set(TRACKED_FIELDS) & set(values) else ()):
+        for chunk in chunks(ids):
+            result = db.session.execute(
+                update(Reference)
+                .where(Reference.user_id == user_id, Reference.id.in_(chunk))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            updated += result.rowcount
+    if {"title", "year", "doi"} & set(values):
+        refresh_keys(ids)
+    return updated
+
+
+def delete_references(user_id, ids):
+    """Delete the targeted rows and their tag links; returns the number of references deleted."""
+    deleted = 0
+    with track_changes(ids):
+        for chunk in chunks(ids):
+            db.session.execute(
+                delete(DocumentTag)
+                .where(DocumentTag.document_id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            )
+            result = db.session.execute(
+                delete(Reference)
+                .where(Reference.user_id == user_id, Reference.id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            )
+            deleted += result.rowcount
+    return deleted
@@ -0,0 +1,349 @@
+"""Streaming BibTeX import.
+
+The upload is scanned block by block (``@type{...}``) instead of being read
+and parsed in one go, so memory stays bounded by the chunk size rather than
+the file size. Each block is parsed on its own with a small field parser
+(bibtexparser's pyparsing grammar costs milliseconds per entry); chunks of
+entries get their authors normalized together, are checked for duplicates
+with one lookup query (see ``reference.dedup``) and are written with one
+multi-row INSERT.
+"""
+import codecs
+import re
+import unicodedata
+
+from bibtexparser.bibdatabase import COMMON_STRINGS
+from bibtexparser.latexenc import latex_to_unicode
+from sqlalchemy import insert
+
+from research_assistant.extensions import db
+from research_assistant.reference.authors import normalize_authors_batch
+from research_assistant.reference.citation_cache import citation_cache
+from research_assistant.reference.dedup import DEFAULT_POLICY, apply_updates, resolve_duplicates, with_keys
+from research_assistant.reference.models import Reference
+from research_assistant.reference.rollups import record_inserted
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 5000
+# Only the first few skipped entries are reported individually; the rest are counted.
+MAX_SKIPPED_REPORTED = 100
+
+_READ_SIZE = 64 * 1024
+_HEADER_RE = re.compile(r"@[ \t\r\n]*([A-Za-z]+)[ \t\r\n]*([{(])?")
+_KEY_RE = re.compile(r"@[ \t\r\n]*[A-Za-z]+[ \t\r\n]*[{(][ \t\r\n]*([^,\s{}()]*)")
+_TOKEN_RE = re.compile(r"\s*([^\s=,{}\"#()]+)\s*")
+_WS_RE = re.compile(r"[\s,]*")
+_DELIMS = {"{": re.compile(r"[{}]"), "(": re.compile(r"[()]")}
+# An '@type{' at the start of a line always begins a new entry, which lets the
+# scanner recover from an entry whose braces are never closed.
+_NEW_BLOCK = r"|\n[ \t]*(?=@[A-Za-z]+[ \t\r\n]*[{(])"
+_SCAN = {k: re.compile(v.pattern + _NEW_BLOCK) for k, v in _DELIMS.items()}
+_IGNORED_BLOCKS = {"comment", "preamble"}
+
+
+def _read_text(stream):
+    """Yield decoded text pieces from a binary or text stream."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        piece = stream.read(_READ_SIZE)
+        if isinstance(piece, bytes):
+            text = decoder.decode(piece, final=not piece)
+        else:
+            text = piece or ""
+        if text:
+            yield text
+        if not piece:
+            return
+
+
+def _next_header(buf, pos):
+    """
+    (offset, match) of the first block header at or after ``pos``. The match
+    is None when the header may still be incomplete (wait for more text), and
+    the offset is -1 when there is no '@' left at all.
+    """
+    while True:
+        at = buf.find("@", pos)
+        if at < 0:
+            return -1, None
+        m = _HEADER_RE.match(buf, at)
+        if m is None and not buf[at + 1:].strip():
+            # '@' at the very end of what has been read so far.
+            return at, None
+        if m is None or (m.group(2) is None and m.end() < len(buf)):
+            # A stray '@' (e-mail address, comment text ...)
+            pos = at + 1
+            continue
+        if m.group(2) is None:
+            # Header split across reads.
+            return at, None
+        return at, m
+
+
+def _block_end(buf, pos, opener, depth):
+    """
+    (end, depth) after scanning ``buf`` from ``pos`` for the delimiter closing
+    a block opened by ``opener`` at nesting ``depth``; end is None if the
+    block does not end within ``buf``.
+    """
+    for d in _SCAN[opener].finditer(buf, pos):
+        if d.group().startswith("\n"):
+            return d.start(), depth
+        depth += 1 if d.group() == opener else -1
+        if depth == 0:
+            return d.end(), depth
+    return None, depth
+
+
+def iter_bib_blocks(stream):
+    """
+    Yield (block_type, raw_text) for each ``@type{...}`` block in the stream.
+    Text outside blocks is treated as a comment and discarded, so only the
+    block currently being scanned is ever held in memory.
+    """
+    buf = ""
+    pos = 0          # scan position inside buf
+    start = None     # offset of the current block's '@'
+    block_type = None
+    opener = None
+    depth = 0
+
+    for text in _read_text(stream):
+        buf += text
+        while True:
+            if start is None:
+                at, m = _next_header(buf, pos)
+                if m is None:
+                    buf, pos = (buf[at:] if at >= 0 else ""), 0
+                    break
+                start = at
+                block_type = m.group(1).lower()
+                opener = m.group(2)
+                depth = 1
+                pos = m.end()
+
+            end, depth = _block_end(buf, pos, opener, depth)
+            if end is None:
+                buf, pos, start = buf[start:], len(buf) - start, 0
+                break
+
+            # A block cut short by the next entry is passed on as-is and
+            # reported as a parse error downstream.
+            yield block_type, buf[start:end]
+            buf, pos, start = buf[end:], 0, None
+
+    if start is not None:
+        yield block_type, buf[start:]
+
+
+def _block_key(raw):
+    m = _KEY_RE.match(raw)
+    return m.group(1) if m else ""
+
+
+def _column_limit(name):
+    return getattr(Reference.__table__.c[name].type, "length", None)
+
+
+_LIMITS = {name: _column_limit(name) for name in ("title", "authors", "year")}
+_DOI_LIMIT = _column_limit("doi")
+
+
+def _to_unicode(value):
+    """Same result as bibtexparser's convert_to_unicode, minus the slow path for plain text."""
+    if "\\" in value:
+        value = latex_to_unicode(value)
+    else:
+        value = unicodedata.normalize("NFC", value.replace("{", "").replace("}", ""))
+    return " ".join(value.split())
+
+
+def _match_brace(raw, i):
+    """Index of the '}' closing the '{' at raw[i]."""
+    depth = 0
+    for d in _DELIMS["{"].finditer(raw, i):
+        depth += 1 if d.group() == "{" else -1
+        if depth == 0:
+            return d.start()
+    raise ValueError("unbalanced braces")
+
+
+def _parse_value(raw, i, macros):
+    """Parse a field value (braced, quoted, number or macro, joined by '#')."""
+    parts = []
+    while True:
+        while raw[i].isspace():
+            i += 1
+        c = raw[i]
+        if c == "{":
+            j = _match_brace(raw, i)
+            parts.append(raw[i + 1:j])
+            i = j + 1
+        elif c == '"':
+            j, depth = i + 1, 0
+            while raw[j] != '"' or depth:
+                depth += {"{": 1, "}": -1}.get(raw[j], 0)
+                j += 1
+            parts.append(raw[i + 1:j])
+            i = j + 1
+        else:
+            m = _TOKEN_RE.match(raw, i)
+            if m is None:
+                raise ValueError(f"unexpected {c!r}")
+            token = m.group(1)
+            parts.append(token if token.isdigit() else macros.get(token.lower(), token))
+            i = m.end()
+        while i < len(raw) and raw[i].isspace():
+            i += 1
+        if i < len(raw) and raw[i] == "#":
+            i += 1
+            continue
+        return "".join(parts), i
+
+
+def _parse_fields(raw, i, macros):
+    """Parse 'name = value, ...' up to the block's closing delimiter."""
+    fields = {}
+    while True:
+        i = _WS_RE.match(raw, i).end()
+        if i >= len(raw) or raw[i] in ")}":
+            return fields
+        m = _TOKEN_RE.match(raw, i)
+        if m is None or m.end() >= len(raw) or raw[m.end()] != "=":
+            raise ValueError("expected 'field = value'")
+        fields[m.group(1).lower()], i = _parse_value(raw, m.end() + 1, macros)
+
+
+def parse_block(block_type, raw, macros):
+    """Parse one raw entry block into a bibtexparser-style dict (ENTRYTYPE, ID, fields)."""
+    m = _KEY_RE.match(raw)
+    if m is None:
+        raise ValueError("malformed entry header")
+    entry = _parse_fields(raw, m.end(), macros)
+    entry["ENTRYTYPE"] = block_type
+    entry["ID"] = m.group(1)
+    return entry
+
+
+def _add_string_macro(raw, macros):
+    """Register the macro(s) defined by an @string block."""
+    header = _HEADER_RE.match(raw)
+    for name, value in _parse_fields(raw, header.end(), macros).items():
+        macros[name] = value
+
+
+def _build_rows(entries, user_id):
+    """Turn parsed entries into insertable rows; returns (rows, skipped)."""
+    rows, skipped, candidates = [], [], []
+    for e in entries:
+        if (e.get("ENTRYTYPE") or "").lower() != "article":
+            skipped.append((e.get("ID", ""), "unsupported entry type"))
+            continue
+        candidates.append(e)
+
+    authors = normalize_authors_batch([_to_unicode(e.get("author") or "") for e in candidates])
+    for e, author_str in zip(candidates, authors):
+        doi = _to_unicode(e.get("doi") or "").strip()
+        row = {
+            "user_id": user_id,
+            "title": _to_unicode(e.get("title") or "").strip(),
+            "authors": author_str,
+            "year": _to_unicode(e.get("year") or "").strip(),
+            "source": "journal",
+            # Kept mainly as the duplicate-detection key; dropped if it can't fit.
+            "doi": doi if doi and len(doi) <= _DOI_LIMIT else None,
+        }
+        missing = [k for k in ("title", "authors", "year") if not row[k]]
+        if missing:
+            skipped.append((e.get("ID", ""), "missing " + ", ".join(missing)))
+            continue
+        too_long = [k for k, limit in _LIMITS.items() if limit and len(row[k]) > limit]
+        if too_long:
+            skipped.append((e.get("ID", ""), "too long: " + ", ".join(too_long)))
+            continue
+        rows.append(with_keys(row))
+    return rows, skipped
+
+
+def _iter_chunks(stream, chunk_size):
+    """
+    Parse entry blocks and group them into chunks of ``chunk_size``.
+    Yields (entries, failed_keys, block_count); @string macros are applied
+    to every entry that follows their definition.
+    """
+    macros = dict(COMMON_STRINGS)
+    entries, failed, count = [], [], 0
+    for block_type, raw in iter_bib_blocks(stream):
+        if block_type in _IGNORED_BLOCKS:
+            continue
+        try:
+            if block_type == "string":
+                _add_string_macro(raw, macros)
+                continue
+            entries.append(parse_block(block_type, raw, macros))
+        except (ValueError, IndexError):
+            failed.append(_block_key(raw))
+        count += 1
+        if count >= chunk_size:
+            yield entries, failed, count
+            entries, failed, count = [], [], 0
+    if count:
+        yield entries, failed, count
+
+
+def import_bib_stream(stream, user_id, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None,
+                      on_duplicate=DEFAULT_POLICY):
+    """
+    Import @article entries from a .bib stream for the given user.
+
+    Rows are inserted and committed one chunk at a time. Entries duplicating
+    a reference already in the library (or earlier in the file) are handled
+    per ``on_duplicate``: "skip" them, "update" the existing reference, or
+    "keep" both. ``on_chunk`` is called with the running report after every
+    chunk, before that chunk is committed. Returns a report::
+
+        {"count": ..., "parsed": ..., "skipped_count": ...,
+         "duplicates": ..., "updated": ...,
+         "chunks": [{"index", "parsed", "inserted", "skipped", "duplicates", "updated"}, ...],
+         "skipped": [{"key", "reason"}, ...]}
+    """
+    chunk_size = max(1, min(int(chunk_size), MAX_CHUNK_SIZE))
+    report = {
+        "count": 0, "parsed": 0, "skipped_count": 0, "duplicates": 0, "updated": 0,
+        "chunks": [], "skipped": [],
+    }
+
+    for index, (entries, failed, parsed) in enumerate(_iter_chunks(stream, chunk_size)):
+        rows, skipped = _build_rows(entries, user_id)
+        skipped.extend((key, "parse error") for key in failed)
+        rows, updates, duplicates = resolve_duplicates(user_id, rows, on_duplicate)
+
+        if rows:
+            db.session.execute(insert(Reference), rows)
+            record_inserted(rows)
+        apply_updates(updates)
+
+        report["count"] += len(rows)
+        report["parsed"] += parsed
+        report["skipped_count"] += len(skipped)
+        report["duplicates"] += duplicates
+        report["updated"] += len(updates)
+        report["chunks"].append({
+            "index": index,
+            "parsed": parsed,
+            "inserted": len(rows),
+            "skipped": len(skipped),
+            "duplicates": duplicates,
+            "updated": len(updates),
+        })
+        room = MAX_SKIPPED_REPORTED - len(report["skipped"])
+        report["skipped"].extend({"key": k, "reason": r} for k, r in skipped[:max(room, 0)])
+
+        # Progress written by the callback is committed together with the chunk.
+        if on_chunk is not None:
+            on_chunk(report)
+        db.session.commit()
+        for params in updates:
+            citation_cache.invalidate(params["id"])
+
+    return report
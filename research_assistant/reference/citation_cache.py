@@ -0,0 +1,171 @@
+"""Cache of rendered citations (text/HTML) and generated citation .docx bytes.
+
+Entries are keyed on (reference id, hash of the citable fields, style,
+format), so an edited reference can never be served a stale rendering even
+from a shared backend; ``invalidate`` additionally frees the old entries
+right away where the backend allows it.
+
+Backends (CITATION_CACHE_BACKEND):
+  memory  per-process LRU bounded by CITATION_CACHE_MAX_BYTES (default)
+  flask   the app's Flask-Caching ``cache``, shared between workers when it
+          is configured with a shared store (redis, memcached ...)
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from research_assistant.extensions import cache
+from research_assistant.reference.citation_styles import citable_fields
+
+# Rough per-entry bookkeeping cost added to the payload size.
+_ENTRY_OVERHEAD = 200
+
+
+def _sizeof(value):
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (tuple, list)):
+        return sum(_sizeof(v) for v in value)
+    return 64
+
+
+def content_hash(ref):
+    """Hash of every field a citation style can read."""
+    h = hashlib.sha1()
+    for field in citable_fields():
+        h.update(str(getattr(ref, field, None) or "").encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class MemoryBackend:
+    """Thread-safe LRU bounded by the accounted size of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._by_ref = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, ref_id, key, value):
+        size = _sizeof(value) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, size, ref_id)
+            self._by_ref.setdefault(ref_id, set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def invalidate(self, ref_id):
+        with self._lock:
+            for key in list(self._by_ref.get(ref_id, ())):
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_ref.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        _, size, ref_id = entry
+        self.size -= size
+        keys = self._by_ref.get(ref_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_ref[ref_id]
+
+    def stats(self):
+        return {"entries": len(self._data), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+class FlaskCacheBackend:
+    """Stores entries in the Flask-Caching ``cache``; stale entries just expire."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, ref_id, key, value):
+        cache.set(key, value, timeout=self.timeout)
+
+    def invalidate(self, ref_id):
+        # Keys embed the content hash, so edits already miss; nothing to enumerate.
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {"timeout": self.timeout}
+
+
+class CitationCache:
+    """Rendered-citation cache with hit/miss counters."""
+
+    def __init__(self):
+        self.backend = MemoryBackend(32 * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        if app.config.get("CITATION_CACHE_BACKEND", "memory") == "flask":
+            self.backend = FlaskCacheBackend(app.config.get("CITATION_CACHE_TIMEOUT", 3600))
+        else:
+            self.backend = MemoryBackend(app.config.get("CITATION_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(ref, style, kind):
+        return f"citation:{kind}:{ref.id}:{content_hash(ref)}:{style}"
+
+    def get_or_render(self, ref, style, kind, render):
+        """Cached ``render()`` result for (ref, its content, style, kind)."""
+        key = self.key(ref, style, kind)
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = render()
+            self.backend.set(ref.id, key, value)
+        return value
+
+    def invalidate(self, ref_id):
+        self.backend.invalidate(ref_id)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            **self.backend.stats(),
+        }
+
+
+citation_cache = CitationCache()
@@ -1,9 +1,218 @@
+"""Citation style engine.
+
+A style is plain data: which author-list format it uses and an ordered list
+of segments ``(field, pattern, italic, requires)`` (the last two optional).
+``compile_style`` turns that into a ``CitationStyle`` once; rendering a
+reference then only walks the prepared segment list. Segments whose field -
+or whose ``requires`` field - is empty are left out.
+
+Author strings ('Last, F.; Other, A.') are parsed by ``reference.authors``
+(cached), and each style additionally caches its formatted author list, so
+recurring co-authors and repeated renders never re-split the string.
+
+Adding a style means adding a definition, e.g.::
+
+    register_style("VANCOUVER", {
+        "authors": "ieee",
+        "segments": [("authors", "{}. "), ("title", "{}. "), ("journal", "{}. "), ("year", "{};")],
+    })
+"""
+from functools import lru_cache
+from html import escape
+
+from research_assistant.reference.authors import AUTHOR_CACHE_SIZE, parse_authors
+
+
+def _last_first(a):
+    """'Lastname, First/Initials' (leading author in MLA/Chicago)."""
+    return f"{a.last}, {a.first}".strip().strip(",")
+
+
+def _first_last(a):
+    """'F. Lastname' (subsequent authors in Chicago/MLA)."""
+    return f"{a.first} {a.last}".strip()
+
+
+def _join(items, sep, last_sep, two_sep=None):
+    if len(items) == 1:
+        return items[0]
+    if len(items) == 2 and two_sep is not None:
+        return f"{items[0]}{two_sep}{items[1]}"
+    return f"{sep.join(items[:-1])}{last_sep}{items[-1]}"
+
+
+def authors_apa(names):
+    """'A, B., C, D., & E, F.'"""
+    return _join([a.raw for a in names], ", ", ", & ", " & ")
+
+
+def authors_chicago(names):
+    """First author as 'Last, First', subsequent as 'First Last'; final 'and'."""
+    if len(names) == 1:
+        return _last_first(names[0])
+    items = [_last_first(names[0])] + [_first_last(a) for a in names[1:]]
+    return _join(items, ", ", ", and ", " and ")
+
+
+def authors_mla(names):
+    """MLA 9: 'Last, First' | 'Last, First, and First Last' | 'Last, First, et al.'"""
+    if len(names) == 1:
+        return _last_first(names[0])
+    if len(names) == 2:
+        return f"{_last_first(names[0])}, and {_first_last(names[1])}"
+    return f"{_last_first(names[0])}, et al."
+
+
+def authors_ieee(names):
+    """'F. Last, G. Other, and H. Third'"""
+    return _join([_first_last(a) for a in names], ", ", ", and ", " and ")
+
+
+def authors_harvard(names):
+    """'Last, F., Other, G. and Third, H.'"""
+    return _join([_last_first(a) for a in names], ", ", " and ")
+
+
+AUTHOR_FORMATS = {
+    "apa": authors_apa,
+    "chicago": authors_chicago,
+    "mla": authors_mla,
+    "ieee": authors_ieee,
+    "harvard": authors_harvard,
+}
+
+STYLE_DEFINITIONS = {
+    # Authors (Year). Title.
+    "APA": {
+        "authors": "apa",
+        "segments": [("authors", "{} "), ("year", "({}). "), ("title", "{}. ")],
+    },
+    # Authors. "Title." Year.
+    "CHICAGO": {
+        "authors": "chicago",
+        "segments": [("authors", "{}. "), ("title", '"{}." '), ("year", "{}. ")],
+    },
+    # Authors. "Title." Year.
+    "MLA": {
+        "authors": "mla",
+        "segments": [("authors", "{}. "), ("title", '"{}." '), ("year", "{}. ")],
+    },
+    # Authors, "Title," Journal, vol. V, no. N, pp. P, Year.
+    "IEEE": {
+        "authors": "ieee",
+        "segments": [
+            ("authors", "{}, "), ("title", '"{}," '), ("journal", "{}", True), ("journal", ", "),
+            ("volume", "vol. {}, "), ("issue", "no. {}, "), ("pages", "pp. {}, "), ("year", "{}. "),
+        ],
+    },
+    # Authors (Year) Title. Journal, V(N), pp. P.
+    "HARVARD": {
+        "authors": "harvard",
+        "segments": [
+            ("authors", "{} "), ("year", "({}) "), ("title", "{}. "), ("journal", "{}", True),
+            ("volume", ", {}", False, "journal"), ("issue", "({})", False, "journal"),
+            ("pages", ", pp. {}", False, "journal"), ("journal", ". "),
+        ],
+    },
+}
+
+
+class CitationStyle:
+    """A compiled citation style; render with text(), html(), segments() or add_runs()."""
+
+    def __init__(self, name, definition):
+        self.name = name
+        author_format = AUTHOR_FORMATS[definition["authors"]]
+        self.format_authors = lru_cache(maxsize=AUTHOR_CACHE_SIZE)(
+            lambda authors: author_format(parse_authors(authors)) if authors else ""
+        )
+        # Patterns are pre-split around "{}"; one without "{}" is emitted
+        # as-is whenever its field is set.
+        self._segments = []
+        for segment in definition["segments"]:
+            field, pattern = segment[0], segment[1]
+            italic = segment[2] if len(segment) > 2 else False
+            requires = segment[3] if len(segment) > 3 else field
+            prefix, has_value, suffix = pattern.partition("{}")
+            self._segments.append((field, prefix, bool(has_value), suffix, italic, requires))
+        self._fields = tuple(dict.fromkeys(
+            name for seg in self._segments for name in (seg[0], seg[5])
+        ))
+
+    def _value(self, ref, field):
+        value = getattr(ref, field, None)
+        if not value:
+            return ""
+        if field == "authors":
+            return self.format_authors(value)
+        return str(value).strip()
+
+    def segments(self, ref):
+        """[(text, italic), ...] for one reference."""
+        values = {field: self._value(ref, field) for field in self._fields}
+        return [
+            (prefix + values[field] + suffix if has_value else prefix, italic)
+            for field, prefix, has_value, suffix, italic, requires in self._segments
+            if values[field] and values[requires]
+        ]
+
+    def text(self, ref):
+        return "".join(text for text, _ in self.segments(ref)).rstrip()
+
+    def html(self, ref):
+        return "".join(
+            f"<i>{escape(text)}</i>" if italic else escape(text)
+            for text, italic in self.segments(ref)
+        ).rstrip()
+
+    def add_runs(self, paragraph, ref):
+        """Append the citation to a python-docx paragraph as runs."""
+        for text, italic in self.segments(ref):
+            run = paragraph.add_run(text)
+            if italic:
+                run.italic = True
+        return paragraph
+
+
+def compile_style(name, definition):
+    return CitationStyle(name, definition)
+
+
+STYLES = {name: compile_style(name, d) for name, d in STYLE_DEFINITIONS.items()}
+
+
+def register_style(name, definition):
+    """Add (or replace) a style from its definition."""
+    name = name.upper()
+    STYLE_DEFINITIONS[name] = definition
+    STYLES[name] = compile_style(name, definition)
+    return STYLES[name]
+
+
+def citable_fields():
+    """Reference attributes read by any registered style."""
+    return sorted({
+        name for d in STYLE_DEFINITIONS.values() for seg in d["segments"] for name in (seg[0], *seg[3:4])
+    })
+
+
+def get_style(name):
+    """Compiled style by (case-insensitive) name, or None."""
+    return STYLES.get((name or "").upper())
+
+
 def generate_citation(ref, style="APA"):
-    if style.upper() == "APA":
-        return f"{ref.authors} ({ref.year}). {ref.title}. {ref.source}."
-    elif style.upper() == "MLA":
-        return f"{ref.authors}. \"{ref.title}.\" {ref.source}, {ref.year}."
-    elif style.upper() == "CHICAGO":
-        return f"{ref.authors}. \"{ref.title}.\" {ref.source} ({ref.year})."
-    else:
-        return "Unsupported style"
\ No newline at end of file
+    """Plain-text citation for ``ref`` (APA when the style is unknown)."""
+    return (get_style(style) or STYLES["APA"]).text(ref)
+
+
+def format_authors_apa(authors):
+    return STYLES["APA"].format_authors(authors or "")
+
+
+def format_authors_chicago(authors):
+    return STYLES["CHICAGO"].format_authors(authors or "")
+
+
+def format_authors_mla(authors):
+    return STYLES["MLA"].format_authors(authors or "")
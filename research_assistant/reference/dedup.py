@@ -0,0 +1,212 @@
+"""Duplicate detection for references entering a user's library.
+
+Every reference carries two indexed keys, both scoped by ``user_id``:
+
+  doi_key      the DOI lower-cased and stripped of resolver prefixes
+  fingerprint  sha1 of the accent-folded, punctuation-free title plus year
+
+Two references are duplicates when their DOI keys match, or when their
+fingerprints match and at most one of them has a DOI (two different DOIs
+mean two different works, e.g. a preprint and its published version).
+
+The keys are kept current by ORM hooks for single-row writes; bulk writes
+(``insert(Reference)`` / ``update(Reference)``) must fill them with
+``with_keys``. Candidates are looked up in bulk: ``DuplicateIndex.load``
+issues one query for a whole chunk of incoming rows.
+"""
+import hashlib
+import re
+import unicodedata
+
+from sqlalchemy import event, or_, select, update
+
+from research_assistant.extensions import db
+from research_assistant.reference.models import Reference
+from research_assistant.reference.rollups import track_changes
+
+# What to do with an incoming reference that duplicates an existing one.
+DUPLICATE_POLICIES = ("skip", "update", "keep")
+DEFAULT_POLICY = "skip"
+# Fields an incoming duplicate may overwrite under the "update" policy.
+UPDATABLE_FIELDS = ("title", "authors", "year", "source", "journal", "volume", "issue", "pages", "doi", "url", "month")
+
+_DOI_PREFIX_RE = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.IGNORECASE)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_YEAR_RE = re.compile(r"\d{4}")
+
+
+def doi_key(doi):
+    """'https://doi.org/10.1000/ABC' -> '10.1000/abc'; None when empty."""
+    doi = _DOI_PREFIX_RE.sub("", (doi or "").strip()).strip().lower()
+    return doi or None
+
+
+def title_fingerprint(title, year):
+    """Fingerprint of a title+year that ignores case, accents, punctuation and spacing."""
+    folded = unicodedata.normalize("NFKD", title or "")
+    folded = "".join(c for c in folded if not unicodedata.combining(c)).casefold()
+    words = " ".join(_WORD_RE.findall(folded))
+    if not words:
+        return None
+    year = str(year or "").strip()
+    match = _YEAR_RE.search(year)
+    key = f"{words}|{match.group() if match else year}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def with_keys(row):
+    """Fill ``doi_key``/``fingerprint`` on a row dict meant for a bulk insert."""
+    row["doi_key"] = doi_key(row.get("doi"))
+    row["fingerprint"] = title_fingerprint(row.get("title"), row.get("year"))
+    return row
+
+
+@event.listens_for(Reference, "before_insert")
+@event.listens_for(Reference, "before_update")
+def _refresh_keys(mapper, connection, target):
+    target.doi_key = doi_key(target.doi)
+    target.fingerprint = title_fingerprint(target.title, target.year)
+
+
+class DuplicateIndex:
+    """
+    In-memory lookup over a user's potentially matching references.
+    Targets are existing reference ids, or row dicts added with ``add``
+    (rows pending insertion in the same chunk).
+    """
+
+    def __init__(self):
+        self._by_doi = {}
+        self._by_fingerprint = {}
+
+    @classmethod
+    def load(cls, user_id, rows):
+        """One query for every existing reference sharing a key with any of ``rows``."""
+        index = cls()
+        dois = {r["doi_key"] for r in rows if r.get("doi_key")}
+        fingerprints = {r["fingerprint"] for r in rows if r.get("fingerprint")}
+        conditions = []
+        if dois:
+            conditions.append(Reference.doi_key.in_(dois))
+        if fingerprints:
+            conditions.append(Reference.fingerprint.in_(fingerprints))
+        if not conditions:
+            return index
+        stmt = (
+            select(Reference.id, Reference.doi_key, Reference.fingerprint)
+            .where(Reference.user_id == user_id, or_(*conditions))
+            .order_by(Reference.id)
+        )
+        for ref_id, key, fingerprint in db.session.execute(stmt):
+            index.add(ref_id, key, fingerprint)
+        return index
+
+    def add(self, target, key, fingerprint):
+        if key:
+            self._by_doi.setdefault(key, target)
+        if fingerprint:
+            self._by_fingerprint.setdefault(fingerprint, []).append((target, key))
+
+    def match(self, key, fingerprint):
+        """The first target duplicating (key, fingerprint), or None."""
+        if key and key in self._by_doi:
+            return self._by_doi[key]
+        for target, other_key in self._by_fingerprint.get(fingerprint, ()):
+            if not key or not other_key:
+                return target
+        return None
+
+
+def _merge(into, row, fields):
+    """Copy the non-empty ``fields`` of ``row`` onto the dict ``into``."""
+    for field in fields:
+        value = row.get(field)
+        if value not in (None, ""):
+            into[field] = value
+
+
+def resolve_duplicates(user_id, rows, policy=DEFAULT_POLICY, fields=UPDATABLE_FIELDS):
+    """
+    Split incoming rows (with keys, see ``with_keys``) by duplicate policy.
+
+    Returns (to_insert, to_update, duplicates): rows to insert, update
+    parameter dicts keyed by ``id`` for existing references, and the number
+    of incoming rows that matched an existing or earlier row. Rows repeated
+    within ``rows`` are collapsed as well, except under "keep".
+    """
+    if policy == "keep" or not rows:
+        return rows, [], 0
+
+    index = DuplicateIndex.load(user_id, rows)
+    to_insert, updates, duplicates = [], {}, 0
+    for row in rows:
+        target = index.match(row["doi_key"], row["fingerprint"])
+        if target is None:
+            to_insert.append(row)
+            index.add(row, row["doi_key"], row["fingerprint"])
+            continue
+        duplicates += 1
+        if policy != "update":
+            continue
+        if isinstance(target, dict):
+            _merge(target, row, fields)
+            with_keys(target)
+        else:
+            _merge(updates.setdefault(target, {"id": target}), row, fields)
+
+    to_update = []
+    for params in updates.values():
+        if "doi" in params:
+            params["doi_key"] = doi_key(params["doi"])
+        if "title" in params and "year" in params:
+            params["fingerprint"] = title_fingerprint(params["title"], params["year"])
+        to_update.append(params)
+    return to_insert, to_update, duplicates
+
+
+def apply_updates(to_update):
+    """Bulk UPDATE by primary key for the parameter dicts from ``resolve_duplicates``."""
+    if to_update:
+        with track_changes([params["id"] for params in to_update]):
+            db.session.execute(update(Reference), to_update)
+
+
+def find_duplicate(user_id, title, year, doi=None):
+    """Id of an existing reference duplicating a single new one, or None."""
+    row = with_keys({"title": title, "year": year, "doi": doi})
+    return DuplicateIndex.load(user_id, [row]).match(row["doi_key"], row["fingerprint"])
+
+
+def refresh_keys(ids, batch_size=1000):
+    """Recompute the keys of the given references after a set-based UPDATE."""
+    for i in range(0, len(ids), batch_size):
+        rows = db.session.execute(
+            select(Reference.id, Reference.doi, Reference.title, Reference.year)
+            .where(Reference.id.in_(ids[i:i + batch_size]))
+        ).all()
+        db.session.execute(update(Reference), [
+            {"id": ref_id, "doi_key": doi_key(doi), "fingerprint": title_fingerprint(title, year)}
+            for ref_id, doi, title, year in rows
+        ])
+
+
+def backfill_keys(batch_size=1000):
+    """Compute missing keys for existing references (e.g. rows from before the columns existed)."""
+    total, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Reference.id, Reference.doi, Reference.title, Reference.year)
+            .where(Reference.fingerprint.is_(None), Reference.id > last_id)
+            .order_by(Reference.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return total
+        params = [
+            {"id": ref_id, "doi_key": doi_key(doi), "fingerprint": title_fingerprint(title, year)}
+            for ref_id, doi, title, year in rows
+        ]
+        db.session.execute(update(Reference), params)
+        db.session.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
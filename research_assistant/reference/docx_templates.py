@@ -0,0 +1,187 @@
+"""Preloaded .docx packages for citation and bibliography downloads.
+
+Opening a package with python-docx parses every XML part, and saving it
+re-deflates every part again, although a citation only ever changes
+``word/document.xml``. A ``DocxTemplate`` therefore prepares a package once
+per worker:
+
+  * the configured package (base styles, or a user's letterhead/fonts) is
+    split into its main document part and everything else;
+  * everything else is written once into a ready-made zip prefix;
+  * the document part is kept parsed.
+
+A render deep-copies the parsed document element, fills it, and appends the
+serialized part to a copy of the zip prefix - no re-parsing of styles,
+themes, headers or fonts, and no recompression of them either.
+
+User templates are stored once (``CitationTemplate``) already prepared, and
+compiled into a ``DocxTemplate`` at most once per worker.
+"""
+import threading
+import zipfile
+from collections import OrderedDict
+from copy import deepcopy
+from io import BytesIO
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.shared import Inches, Pt
+from docx.text.paragraph import Paragraph
+
+BIBLIOGRAPHY_STYLE = "Bibliography"
+BASE_FONT_SIZE = Pt(11)
+# Compiled user templates kept per worker.
+USER_TEMPLATE_CACHE_SIZE = 32
+
+
+class TemplateError(ValueError):
+    """Raised for uploads that are not usable .docx templates."""
+
+
+def _add_bibliography_style(doc):
+    """Paragraph style with a hanging indent, shared by every bibliography entry."""
+    if any(s.name == BIBLIOGRAPHY_STYLE for s in doc.styles):
+        return
+    style = doc.styles.add_style(BIBLIOGRAPHY_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+    style.base_style = doc.styles["Normal"]
+    fmt = style.paragraph_format
+    fmt.left_indent = Inches(0.5)
+    fmt.first_line_indent = Inches(-0.5)
+    fmt.space_after = Pt(0)
+
+
+def prepare_base():
+    """The default package: python-docx's template with an 11pt Normal style."""
+    doc = Document()
+    doc.styles["Normal"].font.size = BASE_FONT_SIZE
+    _add_bibliography_style(doc)
+    bio = BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
+
+
+def prepare_upload(data):
+    """
+    Validate a user-supplied .docx and add the styles citations rely on.
+    The user's own fonts, headers and body content are left untouched.
+    Returns the package bytes to store; raises TemplateError.
+    """
+    try:
+        doc = Document(BytesIO(data))
+    except Exception as e:
+        raise TemplateError(f"Not a valid .docx file: {e}")
+    _add_bibliography_style(doc)
+    bio = BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
+
+
+class DocxTemplate:
+    """A prepared package; ``new_document()`` / ``save()`` per render."""
+
+    def __init__(self, data):
+        with zipfile.ZipFile(BytesIO(data)) as src:
+            self.part_name = self._main_part_name(src)
+            root = parse_xml(src.read(self.part_name))
+            self._style_ids = self._read_style_ids(src)
+            prefix = BytesIO()
+            with zipfile.ZipFile(prefix, "w", zipfile.ZIP_DEFLATED) as dst:
+                for name in src.namelist():
+                    if name != self.part_name:
+                        dst.writestr(name, src.read(name))
+        self._root = root
+        self._prefix = prefix.getvalue()
+
+    @staticmethod
+    def _main_part_name(src):
+        rels = parse_xml(src.read("_rels/.rels"))
+        for rel in rels:
+            if rel.get("Type") == RT.OFFICE_DOCUMENT:
+                return rel.get("Target").lstrip("/")
+        raise TemplateError("Package has no main document part")
+
+    @staticmethod
+    def _read_style_ids(src):
+        try:
+            styles = parse_xml(src.read("word/styles.xml"))
+        except KeyError:
+            return {}
+        ids = {}
+        for style in styles.iterchildren(qn("w:style")):
+            name = style.find(qn("w:name"))
+            if name is not None:
+                ids[name.get(qn("w:val"))] = style.get(qn("w:styleId"))
+        return ids
+
+    def new_document(self):
+        """A fresh copy of the template's ``w:document`` element."""
+        return deepcopy(self._root)
+
+    def add_paragraph(self, document, style=None):
+        """Append a paragraph (before the section properties) and wrap it for python-docx."""
+        p = document.body.add_p()
+        style_id = self._style_ids.get(style) if style else None
+        if style_id:
+            p.get_or_add_pPr().style = style_id
+        return Paragraph(p, None)
+
+    def save(self, document):
+        """Package bytes with ``document`` as the main document part."""
+        bio = BytesIO(self._prefix)
+        with zipfile.ZipFile(bio, "a", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(self.part_name, serialize_part_xml(document))
+        return bio.getvalue()
+
+
+_lock = threading.Lock()
+_base = None
+_user_templates = OrderedDict()
+
+
+def base_template():
+    """This worker's default template, built on first use."""
+    global _base
+    if _base is None:
+        with _lock:
+            if _base is None:
+                _base = DocxTemplate(prepare_base())
+    return _base
+
+
+def template_version(template):
+    """
+    Identifies one stored upload of a template. Ids alone are not enough for
+    cache keys: a deleted template's id can be reused by the next upload.
+    """
+    stamp = template.created_at.strftime("%Y%m%d%H%M%S%f") if template.created_at else ""
+    return f"{template.id}.{stamp}"
+
+
+def user_template(template):
+    """
+    Compiled ``DocxTemplate`` for a stored CitationTemplate row (cached by
+    template_version). ``template.data`` is only read on a miss, so callers
+    can load the row with the data column deferred.
+    """
+    key = (template.id, template_version(template))
+    with _lock:
+        compiled = _user_templates.get(key)
+        if compiled is not None:
+            _user_templates.move_to_end(key)
+            return compiled
+    compiled = DocxTemplate(template.data)
+    with _lock:
+        _user_templates[key] = compiled
+        while len(_user_templates) > USER_TEMPLATE_CACHE_SIZE:
+            _user_templates.popitem(last=False)
+    return compiled
+
+
+def forget_template(template_id):
+    with _lock:
+        for key in [k for k in _user_templates if k[0] == template_id]:
+            del _user_templates[key]
@@ -0,0 +1,387 @@
+"""Offline metadata enrichment from a local Crossref-style dump.
+
+``build_index`` turns a JSONL dump (one work per line, Crossref REST
+``message`` objects; ``.gz`` accepted) into one compact index file:
+
+    header    magic, record count and the offsets/sizes of the two tables
+    records   uint32 length + compact JSON per work
+    doi       sorted (hash64(doi key), record offset) pairs
+    title     sorted (hash64(normalized title), record offset) pairs
+
+The build streams the dump once and sorts the key tables with an external
+merge sort, so dumps far larger than memory can be indexed. Lookups
+``mmap`` the file and binary-search a table - the OS page cache is shared by
+every worker and nothing is loaded up front. Hash hits are verified against
+the record itself, so a 64-bit collision can never produce a wrong match.
+
+``enrich_references`` then fills a user's missing journal/volume/issue/
+pages/doi/url fields in keyset batches, matching by DOI first and by title
+(+ year, + first author when ambiguous) otherwise. No network access.
+"""
+import gzip
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import or_, select, update
+
+from research_assistant.extensions import db
+from research_assistant.reference.authors import parse_authors
+from research_assistant.reference.citation_cache import citation_cache
+from research_assistant.reference.dedup import doi_key, title_fingerprint
+from research_assistant.reference.models import Reference
+from research_assistant.reference.rollups import track_changes
+
+MAGIC = b"RAMETA01"
+_HEADER = struct.Struct("<8sQQQQQ")  # magic, records, doi offset, doi count, title offset, title count
+_ENTRY = struct.Struct("<QQ")  # key hash, record offset
+_LENGTH = struct.Struct("<I")
+# Key entries sorted in memory before spilling to a run file.
+RUN_SIZE = 500_000
+
+# Reference column -> record key.
+ENRICHABLE_FIELDS = {
+    "journal": "j", "volume": "v", "issue": "i", "pages": "p", "doi": "d", "url": "u",
+}
+_LIMITS = {name: Reference.__table__.c[name].type.length for name in ENRICHABLE_FIELDS}
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "little")
+
+
+def _title_key(title):
+    return title_fingerprint(title, None)
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _year(work):
+    for field in ("issued", "published-print", "published-online", "published", "created"):
+        parts = (work.get(field) or {}).get("date-parts") or [[None]]
+        if parts[0] and parts[0][0]:
+            return str(parts[0][0])
+    return None
+
+
+def compact_record(work):
+    """The fields kept from one Crossref work (short keys), or None if unusable."""
+    work = work.get("message", work)
+    record = {
+        "d": work.get("DOI"),
+        "t": _first(work.get("title")),
+        "y": _year(work),
+        "j": _first(work.get("container-title")) or _first(work.get("short-container-title")),
+        "v": work.get("volume"),
+        "i": work.get("issue"),
+        "p": work.get("page"),
+        "u": work.get("URL"),
+    }
+    authors = work.get("author") or []
+    if authors:
+        record["a"] = authors[0].get("family") or authors[0].get("name")
+    record = {k: str(v).strip() for k, v in record.items() if v}
+    if not record.get("d") and not record.get("t"):
+        return None
+    return record
+
+
+def _iter_works(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            # Some snapshots wrap a page of works per line.
+            items = obj.get("items") if isinstance(obj.get("items"), list) else [obj]
+            for item in items:
+                if isinstance(item, dict):
+                    yield item
+
+
+class _RunWriter:
+    """Collects (hash, offset) entries and spills them as sorted run files."""
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.buffer = []
+        self.runs = []
+        self.count = 0
+
+    def add(self, key_hash, offset):
+        self.buffer.append((key_hash, offset))
+        self.count += 1
+        if len(self.buffer) >= RUN_SIZE:
+            self.spill()
+
+    def spill(self):
+        if not self.buffer:
+            return
+        self.buffer.sort()
+        fd, path = tempfile.mkstemp(dir=self.tmpdir, suffix=".run")
+        with os.fdopen(fd, "wb") as f:
+            for entry in self.buffer:
+                f.write(_ENTRY.pack(*entry))
+        self.runs.append(path)
+        self.buffer = []
+
+    def merged(self):
+        """All entries in sorted order, streamed from the run files."""
+        self.spill()
+        return heapq.merge(*[self._read_run(path) for path in self.runs])
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(_ENTRY.size * 4096)
+                if not chunk:
+                    return
+                yield from _ENTRY.iter_unpack(chunk)
+
+
+def build_index(dump_path, index_path):
+    """Build the index file for a JSONL dump; returns the number of records indexed."""
+    tmp_path = index_path + ".tmp"
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(index_path))) as tmpdir:
+        dois, titles = _RunWriter(tmpdir), _RunWriter(tmpdir)
+        records = 0
+        with open(tmp_path, "wb") as out:
+            out.write(b"\0" * _HEADER.size)
+            offset = _HEADER.size
+            for work in _iter_works(dump_path):
+                record = compact_record(work)
+                if record is None:
+                    continue
+                data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                out.write(_LENGTH.pack(len(data)))
+                out.write(data)
+                key, title = doi_key(record.get("d")), _title_key(record.get("t"))
+                if key:
+                    dois.add(_hash64(key), offset)
+                if title:
+                    titles.add(_hash64(title), offset)
+                offset += _LENGTH.size + len(data)
+                records += 1
+
+            tables = []
+            for writer in (dois, titles):
+                tables.append((offset, writer.count))
+                for entry in writer.merged():
+                    out.write(_ENTRY.pack(*entry))
+                offset += writer.count * _ENTRY.size
+            out.seek(0)
+            out.write(_HEADER.pack(MAGIC, records, *tables[0], *tables[1]))
+    os.replace(tmp_path, index_path)
+    return records
+
+
+class MetadataIndex:
+    """Read-only, memory-mapped view of an index file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._users = 0
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.records, *tables = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a metadata index")
+        self._doi_table = (tables[0], tables[1])
+        self._title_table = (tables[2], tables[3])
+
+    def close(self):
+        self._mm.close()
+
+    def _offsets(self, table, key_hash):
+        """Record offsets stored under ``key_hash`` (binary search, then scan equal keys)."""
+        start, count = table
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _ENTRY.unpack_from(self._mm, start + mid * _ENTRY.size)[0] < key_hash:
+                lo = mid + 1
+            else:
+                hi = mid
+        while lo < count:
+            entry_hash, offset = _ENTRY.unpack_from(self._mm, start + lo * _ENTRY.size)
+            if entry_hash != key_hash:
+                return
+            yield offset
+            lo += 1
+
+    def _record(self, offset):
+        (length,) = _LENGTH.unpack_from(self._mm, offset)
+        start = offset + _LENGTH.size
+        return json.loads(self._mm[start:start + length])
+
+    def by_doi(self, doi):
+        key = doi_key(doi)
+        if not key:
+            return None
+        for offset in self._offsets(self._doi_table, _hash64(key)):
+            record = self._record(offset)
+            if doi_key(record.get("d")) == key:
+                return record
+        return None
+
+    def by_title(self, title, year=None, first_author=None):
+        """Unique record with this normalized title (and year +/- 1, and first author if needed)."""
+        key = _title_key(title)
+        if not key:
+            return None
+        candidates = [
+            record for record in map(self._record, self._offsets(self._title_table, _hash64(key)))
+            if _title_key(record.get("t")) == key and _year_matches(record.get("y"), year)
+        ]
+        if len(candidates) > 1 and first_author:
+            candidates = [r for r in candidates if (r.get("a") or "").casefold() == first_author.casefold()]
+        return candidates[0] if len(candidates) == 1 else None
+
+
+def _year_matches(record_year, year):
+    if not year or not record_year:
+        return True
+    try:
+        return abs(int(record_year) - int(str(year)[:4])) <= 1
+    except ValueError:
+        return record_year == str(year)
+
+
+# path -> (mtime, MetadataIndex); _users counts the cache itself plus each open_index caller.
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _release(index):
+    """Drop one reference to ``index``; unmaps it after the last one. Call with _indexes_lock held."""
+    index._users -= 1
+    if index._users == 0:
+        index.close()
+
+
+@contextmanager
+def open_index(path):
+    """
+    Shared MetadataIndex for ``path``, reopened when the file has been rebuilt.
+
+    A replaced index stays mapped until every lookup still using it has left
+    its ``with`` block, and is closed by the last one.
+    """
+    mtime = os.stat(path).st_mtime
+    with _indexes_lock:
+        cached = _indexes.get(path)
+        if cached is not None and cached[0] == mtime:
+            index = cached[1]
+        else:
+            index = MetadataIndex(path)
+            index._users += 1
+            _indexes[path] = (mtime, index)
+            if cached is not None:
+                _release(cached[1])
+        index._users += 1
+    try:
+        yield index
+    finally:
+        with _indexes_lock:
+            _release(index)
+
+
+def _missing(column):
+    return or_(column.is_(None), column == "")
+
+
+def _match(index, row, report):
+    """The index record for a reference row: by DOI, else by title/year/first author."""
+    record = index.by_doi(row.doi) if row.doi else None
+    if record is not None:
+        report["matched_doi"] += 1
+        return record
+    authors = parse_authors(row.authors)
+    record = index.by_title(row.title, row.year, authors[0].last if authors else None)
+    if record is not None:
+        report["matched_title"] += 1
+    return record
+
+
+def _fill(row, record, report):
+    """Update parameters filling the row's empty fields from ``record`` (None if nothing to fill)."""
+    params = {}
+    for field, key in ENRICHABLE_FIELDS.items():
+        value = record.get(key)
+        if value and not getattr(row, field) and len(value) <= _LIMITS[field]:
+            params[field] = value
+            report["filled"][field] += 1
+    if not params:
+        return None
+    if "doi" in params:
+        params["doi_key"] = doi_key(params["doi"])
+    params["id"] = row.id
+    return params
+
+
+def enrich_references(user_id, index, ids=None, batch_size=500, on_batch=None):
+    """
+    Fill missing metadata of the user's references from ``index``.
+
+    References are read in keyset batches of ``batch_size``; each batch is
+    written with one executemany UPDATE and committed. ``on_batch`` is
+    called with the running report before each commit. Returns::
+
+        {"examined", "matched_doi", "matched_title", "updated", "filled": {field: n}}
+    """
+    columns = [Reference.id, Reference.title, Reference.authors, Reference.year, *[
+        getattr(Reference, f) for f in ENRICHABLE_FIELDS
+    ]]
+    stmt = select(*columns).where(
+        Reference.user_id == user_id,
+        or_(*[_missing(getattr(Reference, f)) for f in ENRICHABLE_FIELDS]),
+    )
+    if ids is not None:
+        stmt = stmt.where(Reference.id.in_(ids))
+
+    report = {"examined": 0, "matched_doi": 0, "matched_title": 0, "updated": 0,
+              "filled": dict.fromkeys(ENRICHABLE_FIELDS, 0)}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            stmt.where(Reference.id > last_id).order_by(Reference.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for row in rows:
+            record = _match(index, row, report)
+            params = _fill(row, record, report) if record is not None else None
+            if params is not None:
+                updates.append(params)
+
+        if updates:
+            with track_changes([params["id"] for params in updates if "journal" in params]):
+                db.session.execute(update(Reference), updates)
+        report["examined"] += len(rows)
+        report["updated"] += len(updates)
+        if on_batch is not None:
+            on_batch(report)
+        db.session.commit()
+        for params in updates:
+            citation_cache.invalidate(params["id"])
+
+    return report
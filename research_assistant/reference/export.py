@@ -0,0 +1,164 @@
+"""Streaming export of a reference library (BibTeX, CSL-JSON, RIS).
+
+``export_lines`` reads rows in batches through a server-side cursor
+(``yield_per``) and yields serialized text a batch at a time, so neither
+the result set nor the output document is ever held in memory as a whole.
+Author lists are split without the citation engine's LRU cache, which a
+single pass over a large library would only churn.
+"""
+import json
+import re
+
+from research_assistant.reference.authors import split_authors
+from research_assistant.reference.models import Reference
+
+EXPORT_FIELDS = (
+    "id", "title", "authors", "year", "journal", "volume", "issue", "pages",
+    "doi", "url", "month", "note",
+)
+BATCH_SIZE = 1000
+
+_BIB_ESCAPE_RE = re.compile(r"([&%$#_])")
+_KEY_RE = re.compile(r"[^a-z0-9]")
+
+
+def _bib_escape(value):
+    value = _BIB_ESCAPE_RE.sub(r"\\\1", str(value))
+    # An unbalanced brace would break the rest of the file.
+    if value.count("{") != value.count("}"):
+        value = value.replace("{", r"\{").replace("}", r"\}")
+    return value
+
+
+class BibTeXWriter:
+    mimetype = "application/x-bibtex"
+    extension = "bib"
+    # (BibTeX field, row attribute)
+    FIELDS = (
+        ("title", "title"), ("journal", "journal"), ("year", "year"), ("month", "month"),
+        ("volume", "volume"), ("number", "issue"), ("pages", "pages"), ("doi", "doi"),
+        ("url", "url"), ("note", "note"),
+    )
+
+    def __init__(self):
+        self._keys = {}
+
+    def header(self):
+        return ""
+
+    def footer(self):
+        return ""
+
+    def _citekey(self, row):
+        authors = split_authors(row.authors)
+        base = _KEY_RE.sub("", (authors[0].last if authors else "ref").lower()) or "ref"
+        base += _KEY_RE.sub("", str(row.year or "").lower())
+        n = self._keys.get(base, 0)
+        self._keys[base] = n + 1
+        return base if n == 0 else f"{base}_{n + 1}"
+
+    def entry(self, row):
+        lines = [f"@article{{{self._citekey(row)},"]
+        authors = " and ".join(a.raw for a in split_authors(row.authors))
+        if authors:
+            lines.append(f"  author = {{{_bib_escape(authors)}}},")
+        for field, attr in self.FIELDS:
+            value = getattr(row, attr)
+            if value:
+                lines.append(f"  {field} = {{{_bib_escape(value)}}},")
+        lines.append("}\n\n")
+        return "\n".join(lines)
+
+
+class CSLJSONWriter:
+    mimetype = "application/vnd.citationstyles.csl+json"
+    extension = "json"
+    # (CSL variable, row attribute)
+    FIELDS = (
+        ("title", "title"), ("container-title", "journal"), ("volume", "volume"),
+        ("issue", "issue"), ("page", "pages"), ("DOI", "doi"), ("URL", "url"), ("note", "note"),
+    )
+
+    def __init__(self):
+        self._first = True
+
+    def header(self):
+        return "["
+
+    def footer(self):
+        return "\n]\n"
+
+    def entry(self, row):
+        item = {"id": str(row.id), "type": "article-journal"}
+        for field, attr in self.FIELDS:
+            value = getattr(row, attr)
+            if value:
+                item[field] = value
+        authors = [
+            {"family": a.last, "given": a.first} if a.first else {"literal": a.last}
+            for a in split_authors(row.authors)
+        ]
+        if authors:
+            item["author"] = authors
+        year = str(row.year or "").strip()
+        if year.isdigit():
+            item["issued"] = {"date-parts": [[int(year)]]}
+        elif year:
+            item["issued"] = {"literal": year}
+        sep = "\n" if self._first else ",\n"
+        self._first = False
+        return sep + json.dumps(item, ensure_ascii=False)
+
+
+class RISWriter:
+    mimetype = "application/x-research-info-systems"
+    extension = "ris"
+    # (RIS tag, row attribute)
+    FIELDS = (
+        ("TI", "title"), ("JO", "journal"), ("PY", "year"), ("VL", "volume"), ("IS", "issue"),
+        ("DO", "doi"), ("UR", "url"), ("N1", "note"),
+    )
+
+    def header(self):
+        return ""
+
+    def footer(self):
+        return ""
+
+    def entry(self, row):
+        lines = ["TY  - JOUR"]
+        lines.extend(f"AU  - {a.raw}" for a in split_authors(row.authors))
+        for tag, attr in self.FIELDS:
+            value = getattr(row, attr)
+            if value:
+                lines.append(f"{tag}  - {' '.join(str(value).split())}")
+        if row.pages:
+            start, _, end = str(row.pages).replace("--", "-").partition("-")
+            lines.append(f"SP  - {start.strip()}")
+            if end.strip():
+                lines.append(f"EP  - {end.strip()}")
+        lines.append("ER  - \n\n")
+        return "\n".join(lines)
+
+
+WRITERS = {"bib": BibTeXWriter, "csljson": CSLJSONWriter, "ris": RISWriter}
+
+
+def export_lines(query, fmt, batch_size=BATCH_SIZE):
+    """
+    Yield the serialized export of ``query`` (a Reference query) in pieces.
+    Rows are fetched ``batch_size`` at a time, as plain column tuples.
+    """
+    writer = WRITERS[fmt]()
+    columns = [getattr(Reference, f) for f in EXPORT_FIELDS]
+    rows = query.with_entities(*columns).order_by(Reference.id).yield_per(batch_size)
+
+    yield writer.header()
+    buffer = []
+    for row in rows:
+        buffer.append(writer.entry(row))
+        if len(buffer) >= batch_size:
+            yield "".join(buffer)
+            buffer = []
+    buffer.append(writer.footer())
+    yield "".join(buffer)
@@ -0,0 +1,84 @@
+"""Tag filters and tag facet counts for reference listings.
+
+  tags_all   references carrying every one of the tags
+  tags_any   references carrying at least one of them
+  tags_none  references carrying none of them
+
+Each filter is one ``id IN (subquery)`` over ``document_tags``, answered from
+the (tag_id, document_id) index without touching ``reference``; ``tags_all``
+is a GROUP BY ... HAVING count over the same index range (links are unique
+per document and tag). Facets count, for every other tag, how many of the
+matching references carry it.
+"""
+from sqlalchemy import func, select
+
+from research_assistant.extensions import db
+from research_assistant.reference.models import Reference
+from research_assistant.reference.rollups import tag_usage
+from research_assistant.tag.models import DocumentTag, Tag
+
+TAG_FILTERS = ("tags_all", "tags_any", "tags_none")
+MAX_FILTER_TAGS = 50
+FACET_LIMIT = 50
+
+
+def parse_tag_ids(raw, name):
+    """'1,2,3' -> [1, 2, 3]; raises ValueError."""
+    try:
+        ids = sorted({int(x) for x in raw.split(",") if x.strip()})
+    except ValueError:
+        raise ValueError(f"{name} must be a comma-separated list of tag ids")
+    if len(ids) > MAX_FILTER_TAGS:
+        raise ValueError(f"At most {MAX_FILTER_TAGS} tags in {name}")
+    return ids
+
+
+def parse_tag_filters(args):
+    """{filter name: [tag ids]} for the tag filters present in ``args``."""
+    return {name: parse_tag_ids(args[name], name) for name in TAG_FILTERS if args.get(name)}
+
+
+def _tagged(tag_ids):
+    return select(DocumentTag.document_id).where(DocumentTag.tag_id.in_(tag_ids))
+
+
+def tag_conditions(filters):
+    """WHERE conditions on Reference for parsed tag filters."""
+    conditions = []
+    if filters.get("tags_all"):
+        ids = filters["tags_all"]
+        conditions.append(Reference.id.in_(
+            _tagged(ids).group_by(DocumentTag.document_id).having(func.count() == len(ids))
+        ))
+    if filters.get("tags_any"):
+        conditions.append(Reference.id.in_(_tagged(filters["tags_any"])))
+    if filters.get("tags_none"):
+        conditions.append(Reference.id.not_in(_tagged(filters["tags_none"])))
+    return conditions
+
+
+def tag_facets(user_id, filters, limit=FACET_LIMIT):
+    """
+    [{"id", "name", "count"}] of the user's tags among the references matching
+    ``filters``, most frequent first; tags fixed by tags_all/tags_none are left out.
+    Without filters the counts come straight from the tag usage rollups.
+    """
+    excluded = set(filters.get("tags_all", ())) | set(filters.get("tags_none", ()))
+    if not filters:
+        usage = sorted(tag_usage(user_id), key=lambda row: (-row[2], row[1]))
+        return [{"id": i, "name": name, "count": count} for i, name, count in usage if count][:limit]
+
+    count = func.count().label("count")
+    stmt = (
+        select(Tag.id, Tag.name, count)
+        .select_from(DocumentTag)
+        .join(Reference, Reference.id == DocumentTag.document_id)
+        .join(Tag, Tag.id == DocumentTag.tag_id)
+        .where(Reference.user_id == user_id, Tag.user_id == user_id, *tag_conditions(filters))
+        .group_by(Tag.id, Tag.name)
+        .order_by(count.desc(), Tag.name)
+        .limit(limit)
+    )
+    if excluded:
+        stmt = stmt.where(Tag.id.not_in(excluded))
+    return [{"id": i, "name": name, "count": n} for i, name, n in db.session.execute(stmt)]
@@ -0,0 +1,168 @@
+"""In-process background jobs for slow reference library operations.
+
+Jobs run on a small thread pool owned by the worker process. Their state and
+progress live in the ``reference_jobs`` table, so any web worker can answer
+``GET /references/jobs/<id>`` while the job runs elsewhere.
+"""
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, select
+
+from research_assistant.extensions import db
+from research_assistant.reference.bib_import import import_bib_stream
+from research_assistant.reference.enrichment import enrich_references, open_index
+from research_assistant.reference.models import ReferenceJob
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get("REFERENCE_JOB_WORKERS", 2),
+                thread_name_prefix="reference-job",
+            )
+        return _executor
+
+
+def submit_job(job, func, *args):
+    """Run ``func(job_id, *args)`` on the pool inside an app context."""
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                func(job.id, *args)
+            except Exception as e:
+                db.session.rollback()
+                _finish(job.id, "failed", error=str(e))
+                app.logger.exception("Reference job %s failed", job.id)
+            finally:
+                db.session.remove()
+
+    return _get_executor().submit(run)
+
+
+def _finish(job_id, status, error=None):
+    job = db.session.get(ReferenceJob, job_id)
+    if job is None:  # deleted with its account
+        return
+    job.status = status
+    job.error = error
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _start(job_id):
+    job = db.session.get(ReferenceJob, job_id)
+    if job is None:
+        return None
+    job.status = "running"
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def enqueue_bib_import(file_storage, user_id, chunk_size, on_duplicate):
+    """Save the upload to local disk and queue its import; returns the job."""
+    upload_dir = current_app.config["REFERENCE_UPLOAD_DIR"]
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, f"{uuid.uuid4().hex}.bib")
+    file_storage.save(path)
+
+    job = ReferenceJob(user_id=user_id, kind="bib_import", file_path=path)
+    db.session.add(job)
+    db.session.commit()
+    submit_job(job, _run_bib_import, chunk_size, on_duplicate)
+    return job
+
+
+def _run_bib_import(job_id, chunk_size, on_duplicate):
+    job = _start(job_id)
+    if job is None:
+        return
+    path = job.file_path
+
+    def progress(report):
+        job.parsed = report["parsed"]
+        job.inserted = report["count"]
+        job.skipped = report["skipped_count"]
+
+    try:
+        with open(path, "rb") as f:
+            report = import_bib_stream(
+                f, job.user_id, chunk_size=chunk_size, on_chunk=progress, on_duplicate=on_duplicate
+            )
+        job.report = {
+            "chunks": len(report["chunks"]),
+            "duplicates": report["duplicates"],
+            "updated": report["updated"],
+            "skipped": report["skipped"],
+        }
+        db.session.commit()
+        _finish(job_id, "done")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def delete_user_jobs(user_id):
+    """
+    Delete the user's jobs (uncommitted); returns the import files they still
+    hold, to be removed with ``remove_upload_files`` after the commit.
+    """
+    paths = db.session.scalars(
+        select(ReferenceJob.file_path).where(
+            ReferenceJob.user_id == user_id,
+            ReferenceJob.kind == "bib_import",
+            ReferenceJob.file_path.isnot(None),
+        )
+    ).all()
+    db.session.execute(
+        delete(ReferenceJob).where(ReferenceJob.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+    return paths
+
+
+def remove_upload_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def enqueue_enrichment(user_id, index_path, ids=None):
+    """Queue filling the user's missing metadata from the local index; returns the job."""
+    job = ReferenceJob(user_id=user_id, kind="enrich", file_path=index_path)
+    db.session.add(job)
+    db.session.commit()
+    submit_job(job, _run_enrichment, ids)
+    return job
+
+
+def _run_enrichment(job_id, ids):
+    job = _start(job_id)
+    if job is None:
+        return
+    batch_size = current_app.config.get("ENRICHMENT_BATCH_SIZE", 500)
+
+    def progress(report):
+        job.parsed = report["examined"]
+        job.inserted = report["updated"]
+        job.report = dict(report, filled=dict(report["filled"]))
+
+    with open_index(job.file_path) as index:
+        enrich_references(job.user_id, index, ids=ids, batch_size=batch_size, on_batch=progress)
+    _finish(job_id, "done")
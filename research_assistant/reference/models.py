@@ -3,6 +3,24 @@ from datetime import datetime
 
 class Reference(db.Model):
     __tablename__ = "reference"
+    # Keyset pagination: one index per allowed sort key, tiebreak on id.
+    __table_args__ = (
+        db.Index("ix_reference_user_id", "user_id", "id"),
+        db.Index("ix_reference_user_created", "user_id", "created_at", "id"),
+        db.Index("ix_reference_user_title", "user_id", "title", "id"),
+        db.Index("ix_reference_user_year", "user_id", "year", "id"),
+        # Duplicate detection (see reference.dedup).
+        db.Index("ix_reference_user_doi_key", "user_id", "doi_key"),
+        db.Index("ix_reference_user_fingerprint", "user_id", "fingerprint"),
+        # Change tracking for derived per-user indexes (see reference.similarity).
+        db.Index("ix_reference_user_updated", "user_id", "updated_at"),
+    )
+
+    # Columns exposed by to_dict (besides "tags"), in response order.
+    FIELDS = (
+        "id", "title", "authors", "year", "source", "journal", "volume", "issue",
+        "pages", "doi", "url", "month", "note", "completed",
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
@@ -11,6 +29,8 @@ class Reference(db.Model):
     year = db.Column(db.String(10), nullable=False)
     source = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set on every write, including bulk INSERT/UPDATE statements.
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # 新增期刊相关字段
     journal = db.Column(db.String(255))
@@ -24,23 +44,95 @@ class Reference(db.Model):
 
     completed = db.Column(db.Boolean, default=False)
 
+    # Dedup keys, maintained by reference.dedup: normalized DOI and title+year hash.
+    doi_key = db.Column(db.String(255))
+    fingerprint = db.Column(db.String(40))
+
     tags = db.relationship("Tag", secondary="document_tags", back_populates="documents")
 
+    def to_dict(self, fields=None):
+        """Serialize the reference; ``fields`` limits the output to those keys."""
+        fields = fields or self.FIELDS + ("tags",)
+        data = {f: getattr(self, f) for f in fields if f != "tags"}
+        if "tags" in fields:
+            data["tags"] = [{"id": t.id, "name": t.name} for t in self.tags]
+        return data
+
+
+class ReferenceJob(db.Model):
+    """A background job working on a user's reference library (e.g. a .bib import)."""
+
+    __tablename__ = "reference_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    kind = db.Column(db.String(32), nullable=False, default="bib_import")
+    # queued | running | done | failed
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    file_path = db.Column(db.String(512))
+
+    parsed = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    report = db.Column(db.JSON)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
     def to_dict(self):
         return {
             "id": self.id,
-            "title": self.title,
-            "authors": self.authors,
-            "year": self.year,
-            "source": self.source,
-            "journal": self.journal,
-            "volume": self.volume,
-            "issue": self.issue,
-            "pages": self.pages,
-            "doi": self.doi,
-            "url": self.url,
-            "month": self.month,
-            "note": self.note,
-            "completed": self.completed,
-            "tags": [{"id": t.id, "name": t.name} for t in self.tags],
+            "kind": self.kind,
+            "status": self.status,
+            "parsed": self.parsed,
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "error": self.error,
+            "report": self.report,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
         }
+
+
+class CitationTemplate(db.Model):
+    """A user's .docx template (letterhead, fonts) for citation downloads, stored once."""
+
+    __tablename__ = "citation_templates"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "size": self.size,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class ReferenceRollup(db.Model):
+    """
+    Pre-aggregated library counts, maintained by reference.rollups.
+
+    One row per (user, dimension, value): dimension "all" (value ""), "year",
+    "journal" (value "" when unset) or "tag" (value is the tag id).
+    """
+
+    __tablename__ = "reference_rollups"
+    __table_args__ = (
+        db.Index("ix_reference_rollups_user_top", "user_id", "dimension", "total"),
+    )
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    dimension = db.Column(db.String(16), primary_key=True)
+    value = db.Column(db.String(255), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,284 @@
+"""Incrementally maintained library statistics (``reference_rollups``).
+
+Each reference contributes 1 to the total (and, when completed, to the
+completed count) of the rows for its user under the dimensions:
+
+  all      value ""
+  year     the year
+  journal  the journal, "" when unset
+  tag      each tag id it carries
+
+Changes are applied as deltas - the contributions of the touched rows after
+the change minus those before it - so ``/references/stats`` reads a few
+dozen indexed rows no matter how large the library is.
+
+ORM writes of ``Reference`` objects (including tag collection changes) and
+``Tag`` deletions are tracked by session hooks, inside the flush. Bulk
+statements must be wrapped: ``track_changes(ids)`` around UPDATE/DELETE of
+existing references or their tag links, ``record_inserted(rows)`` after a
+bulk INSERT. ``rebuild`` recomputes everything from the base tables and
+``verify`` compares the rollups with a live aggregate.
+
+The "tag" rows double as the tag usage counters behind ``/tags/stats``
+(``tag_usage``): with unique (document_id, tag_id) links, the number of
+references carrying a tag is its number of assignments.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import String, and_, case, cast, delete, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from research_assistant.extensions import db
+from research_assistant.reference.models import Reference, ReferenceRollup
+from research_assistant.tag.models import DocumentTag, Tag
+
+DIMENSIONS = ("all", "year", "journal", "tag")
+# Reference columns that feed a rollup; other column changes need no tracking.
+TRACKED_FIELDS = ("year", "journal", "completed")
+SNAPSHOT_CHUNK = 5000
+_KEY_COLUMNS = ("user_id", "dimension", "value")
+
+
+def _contribute(delta, sign, user_id, year, journal, completed, tag_ids=()):
+    keys = [("all", ""), ("year", year or ""), ("journal", journal or "")]
+    keys.extend(("tag", str(tag_id)) for tag_id in tag_ids)
+    done = sign if completed else 0
+    for dimension, value in keys:
+        entry = delta.setdefault((user_id, dimension, value), [0, 0])
+        entry[0] += sign
+        entry[1] += done
+
+
+def snapshot(session, ids, sign=1):
+    """{(user_id, dimension, value): [total, completed]} contributed by the references ``ids``."""
+    ids = sorted(ids)
+    delta = {}
+    for i in range(0, len(ids), SNAPSHOT_CHUNK):
+        chunk = ids[i:i + SNAPSHOT_CHUNK]
+        tags = {}
+        for doc_id, tag_id in session.execute(
+            select(DocumentTag.document_id, DocumentTag.tag_id).where(DocumentTag.document_id.in_(chunk))
+        ):
+            tags.setdefault(doc_id, []).append(tag_id)
+        for row in session.execute(
+            select(Reference.id, Reference.user_id, Reference.year, Reference.journal, Reference.completed)
+            .where(Reference.id.in_(chunk))
+        ):
+            _contribute(delta, sign, row.user_id, row.year, row.journal, row.completed, tags.get(row.id, ()))
+    return delta
+
+
+def _merge(into, delta):
+    for key, (total, completed) in delta.items():
+        entry = into.setdefault(key, [0, 0])
+        entry[0] += total
+        entry[1] += completed
+    return into
+
+
+def _upsert(session, rows):
+    table = ReferenceRollup.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = (sqlite if dialect == "sqlite" else postgresql).insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=list(_KEY_COLUMNS), set_={
+            "total": table.c.total + stmt.excluded.total,
+            "completed": table.c.completed + stmt.excluded.completed,
+        })
+        session.execute(stmt, rows)
+        return
+    for row in rows:
+        result = session.execute(
+            update(table)
+            .where(*[table.c[k] == row[k] for k in _KEY_COLUMNS])
+            .values(total=table.c.total + row["total"], completed=table.c.completed + row["completed"])
+        )
+        if not result.rowcount:
+            session.execute(table.insert(), row)
+
+
+def apply_delta(session, delta):
+    """Add ``delta`` to the stored rollups; rows whose total reaches zero are removed."""
+    rows = [
+        dict(zip(_KEY_COLUMNS, key), total=total, completed=completed)
+        for key, (total, completed) in delta.items() if total or completed
+    ]
+    if not rows:
+        return
+    _upsert(session, rows)
+    session.execute(
+        delete(ReferenceRollup)
+        .where(ReferenceRollup.user_id.in_({row["user_id"] for row in rows}), ReferenceRollup.total <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+@contextmanager
+def track_changes(ids):
+    """Wrap bulk UPDATE/DELETE statements on the references ``ids`` (or their tag links)."""
+    before = snapshot(db.session, ids, sign=-1)
+    yield
+    apply_delta(db.session, _merge(snapshot(db.session, ids), before))
+
+
+def record_inserted(rows):
+    """Count rows just written with a bulk ``insert(Reference)``."""
+    delta = {}
+    for row in rows:
+        _contribute(delta, 1, row["user_id"], row.get("year"), row.get("journal"), row.get("completed"))
+    apply_delta(db.session, delta)
+
+
+# -------------------- ORM hooks --------------------
+
+def _changes_rollups(obj):
+    """Whether a dirty Reference has changes to a tracked column or its tags."""
+    attrs = inspect(obj).attrs
+    return any(attrs[name].history.has_changes() for name in TRACKED_FIELDS + ("tags",))
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    existing = {obj.id for obj in session.deleted if isinstance(obj, Reference)}
+    existing.update(
+        obj.id for obj in session.dirty if isinstance(obj, Reference) and _changes_rollups(obj)
+    )
+    existing.discard(None)
+    session.info["rollups"] = {
+        "before": snapshot(session, existing, sign=-1) if existing else {},
+        "existing": existing,
+        "new": [obj for obj in session.new if isinstance(obj, Reference)],
+        "deleted_tags": [(obj.user_id, obj.id) for obj in session.deleted if isinstance(obj, Tag)],
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    pending = session.info.pop("rollups", None)
+    if not pending:
+        return
+    ids = pending["existing"] | {obj.id for obj in pending["new"]}
+    if ids:
+        apply_delta(session, _merge(snapshot(session, ids), pending["before"]))
+    for user_id, tag_id in pending["deleted_tags"]:
+        session.execute(
+            delete(ReferenceRollup)
+            .where(ReferenceRollup.user_id == user_id, ReferenceRollup.dimension == "tag",
+                   ReferenceRollup.value == str(tag_id))
+            .execution_options(synchronize_session=False)
+        )
+
+
+# -------------------- Reads, rebuild and verification --------------------
+
+def _rows(user_id, dimension, order, limit=None):
+    stmt = (
+        select(ReferenceRollup.value, ReferenceRollup.total, ReferenceRollup.completed)
+        .where(ReferenceRollup.user_id == user_id, ReferenceRollup.dimension == dimension)
+        .order_by(*order)
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+    return db.session.execute(stmt).all()
+
+
+def library_stats(user_id, top=20):
+    """Totals, per-year counts and the ``top`` journals and tags of a user's library."""
+    overall = _rows(user_id, "all", ())
+    total, completed = (overall[0][1], overall[0][2]) if overall else (0, 0)
+    by_total = (ReferenceRollup.total.desc(), ReferenceRollup.value)
+    journals = _rows(user_id, "journal", by_total, top)
+    tags = _rows(user_id, "tag", by_total, top)
+    names = dict(db.session.execute(
+        select(Tag.id, Tag.name).where(Tag.id.in_([int(value) for value, _, _ in tags]))
+    ).all()) if tags else {}
+    return {
+        "total": total,
+        "completed": completed,
+        "completion_rate": round(completed / total, 4) if total else 0.0,
+        "years": [
+            {"year": value or None, "total": t, "completed": c}
+            for value, t, c in _rows(user_id, "year", (ReferenceRollup.value,))
+        ],
+        "journals": [{"journal": value or None, "total": t, "completed": c} for value, t, c in journals],
+        "tags": [
+            {"id": int(value), "name": names.get(int(value)), "total": t, "completed": c}
+            for value, t, c in tags
+        ],
+    }
+
+
+def tag_usage(user_id):
+    """[(tag id, name, references carrying it)] for the user's tags, by name; one indexed join."""
+    stmt = (
+        select(Tag.id, Tag.name, func.coalesce(ReferenceRollup.total, 0))
+        .outerjoin(ReferenceRollup, and_(
+            ReferenceRollup.user_id == Tag.user_id,
+            ReferenceRollup.dimension == "tag",
+            ReferenceRollup.value == cast(Tag.id, String),
+        ))
+        .where(Tag.user_id == user_id)
+        .order_by(Tag.name)
+    )
+    return db.session.execute(stmt).all()
+
+
+def live_aggregates(user_id=None, dimensions=DIMENSIONS):
+    """The rollups computed from scratch with GROUP BY queries over the base tables."""
+    done = func.sum(case((Reference.completed.is_(True), 1), else_=0))
+    groups = {
+        "all": None,
+        "year": func.coalesce(Reference.year, ""),
+        "journal": func.coalesce(Reference.journal, ""),
+        "tag": cast(DocumentTag.tag_id, String),
+    }
+    result = {}
+    for dimension in dimensions:
+        value = groups[dimension]
+        columns = [Reference.user_id] + ([value] if value is not None else [])
+        stmt = select(*columns, func.count(), done).group_by(*columns)
+        if dimension == "tag":
+            stmt = stmt.join(DocumentTag, DocumentTag.document_id == Reference.id)
+        if user_id is not None:
+            stmt = stmt.where(Reference.user_id == user_id)
+        for row in db.session.execute(stmt):
+            key_value = row[1] if value is not None else ""
+            result[(row[0], dimension, str(key_value))] = (row[-2], row[-1] or 0)
+    return result
+
+
+def stored_rollups(user_id=None, dimensions=DIMENSIONS):
+    stmt = select(ReferenceRollup).where(ReferenceRollup.dimension.in_(dimensions))
+    if user_id is not None:
+        stmt = stmt.where(ReferenceRollup.user_id == user_id)
+    return {
+        (r.user_id, r.dimension, r.value): (r.total, r.completed) for r in db.session.scalars(stmt)
+    }
+
+
+def verify(user_id=None, dimensions=DIMENSIONS):
+    """[(key, stored, live)] for every rollup row that disagrees with the live aggregate."""
+    stored, live = stored_rollups(user_id, dimensions), live_aggregates(user_id, dimensions)
+    return [
+        (key, stored.get(key), live.get(key))
+        for key in sorted(set(stored) | set(live), key=str)
+        if stored.get(key) != live.get(key)
+    ]
+
+
+def rebuild(user_id=None, dimensions=DIMENSIONS):
+    """Replace the stored rollups (of one user, or everyone) with live aggregates; returns the row count."""
+    stmt = delete(ReferenceRollup).where(ReferenceRollup.dimension.in_(dimensions))
+    if user_id is not None:
+        stmt = stmt.where(ReferenceRollup.user_id == user_id)
+    db.session.execute(stmt)
+    rows = [
+        dict(zip(_KEY_COLUMNS, key), total=total, completed=completed)
+        for key, (total, completed) in live_aggregates(user_id, dimensions).items()
+    ]
+    if rows:
+        db.session.execute(ReferenceRollup.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,127 @@
+"""Full-text search over the reference library.
+
+SQLite: an external-content FTS5 table (``reference_fts``) kept in sync with
+``reference`` by triggers, so ORM writes, bulk INSERTs and set-based
+UPDATE/DELETE statements are all indexed without application code.
+
+PostgreSQL: a GIN index on a ``to_tsvector`` expression of the same columns.
+The expression index is maintained by Postgres itself; queries repeat the
+exact expression so the planner can use it.
+
+Other dialects fall back to an unranked ILIKE scan.
+"""
+import re
+
+from sqlalchemy import column, func, literal_column, or_, select, table, text
+
+from research_assistant.extensions import db
+from research_assistant.reference.models import Reference
+
+SEARCH_COLUMNS = ("title", "authors", "journal", "note", "doi")
+# bm25 column weights, in SEARCH_COLUMNS order: title matters most.
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0, 3.0)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_fts = table("reference_fts", column("rowid"))
+_fts_ref = literal_column("reference_fts")
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS reference_fts USING fts5(
+        title, authors, journal, note, doi,
+        content='reference', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS reference_fts_ai AFTER INSERT ON reference BEGIN
+        INSERT INTO reference_fts(rowid, title, authors, journal, note, doi)
+        VALUES (new.id, new.title, new.authors, new.journal, new.note, new.doi);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reference_fts_ad AFTER DELETE ON reference BEGIN
+        INSERT INTO reference_fts(reference_fts, rowid, title, authors, journal, note, doi)
+        VALUES ('delete', old.id, old.title, old.authors, old.journal, old.note, old.doi);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reference_fts_au AFTER UPDATE OF
+        title, authors, journal, note, doi ON reference BEGIN
+        INSERT INTO reference_fts(reference_fts, rowid, title, authors, journal, note, doi)
+        VALUES ('delete', old.id, old.title, old.authors, old.journal, old.note, old.doi);
+        INSERT INTO reference_fts(rowid, title, authors, journal, note, doi)
+        VALUES (new.id, new.title, new.authors, new.journal, new.note, new.doi);
+    END""",
+]
+
+_PG_DOCUMENT = " || ' ' || ".join(f"coalesce({c}, '')" for c in SEARCH_COLUMNS)
+_PG_VECTOR = f"to_tsvector('english', {_PG_DOCUMENT})"
+_PG_DDL = [f"CREATE INDEX IF NOT EXISTS ix_reference_search ON reference USING gin ({_PG_VECTOR})"]
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def ensure_search_index(rebuild=False):
+    """Create the search index (and its triggers) if missing; populate it when new."""
+    dialect = _dialect()
+    with db.engine.begin() as conn:
+        if dialect == "sqlite":
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'reference_fts'")
+            ).first()
+            for ddl in _SQLITE_DDL:
+                conn.execute(text(ddl))
+            if rebuild or not exists:
+                conn.execute(text("INSERT INTO reference_fts(reference_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for ddl in _PG_DDL:
+                conn.execute(text(ddl))
+            if rebuild:
+                conn.execute(text("REINDEX INDEX ix_reference_search"))
+
+
+def query_tokens(q):
+    """Split user input into plain word tokens (no query syntax is passed through)."""
+    return _TOKEN_RE.findall(q or "")
+
+
+def _fts5_query(tokens):
+    # Every token must match; the last one as a prefix for type-ahead.
+    quoted = ['"' + t.replace('"', '""') + '"' for t in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _tsquery(tokens):
+    return " & ".join(tokens[:-1] + [tokens[-1] + ":*"])
+
+
+def search_references(user_id, q, limit=20, offset=0, options=()):
+    """
+    Ranked search within one user's references.
+    Returns (references, has_more); best matches first, ties by id.
+    ``options`` are ORM loader options applied to the Reference query.
+    """
+    tokens = query_tokens(q)
+    if not tokens:
+        return [], False
+
+    dialect = _dialect()
+    stmt = select(Reference).where(Reference.user_id == user_id).options(*options)
+    if dialect == "sqlite":
+        rank = func.bm25(_fts_ref, *FTS_WEIGHTS)
+        stmt = (
+            stmt.join(_fts, _fts.c.rowid == Reference.id)
+            .where(_fts_ref.op("MATCH")(_fts5_query(tokens)))
+            .order_by(rank, Reference.id)
+        )
+    elif dialect == "postgresql":
+        vector = literal_column(_PG_VECTOR)
+        tsq = func.to_tsquery("english", _tsquery(tokens))
+        stmt = stmt.where(vector.op("@@")(tsq)).order_by(
+            func.ts_rank_cd(vector, tsq).desc(), Reference.id
+        )
+    else:
+        for token in tokens:
+            pattern = f"%{token}%"
+            stmt = stmt.where(or_(*[getattr(Reference, c).ilike(pattern) for c in SEARCH_COLUMNS]))
+        stmt = stmt.order_by(Reference.id)
+
+    rows = db.session.scalars(stmt.limit(limit + 1).offset(offset)).all()
+    return rows[:limit], len(rows) > limit
@@ -1,44 +1,40 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from research_assistant.reference.models import Reference
+from sqlalchemy.orm import load_only, selectinload
+
+from research_assistant.reference.models import CitationTemplate, Reference, ReferenceJob
+from research_assistant.tag.models import Tag
 from research_assistant.extensions import db
+from research_assistant.pagination import CursorError, keyset_order, keyset_page
 
+import os
+from copy import deepcopy
 from io import BytesIO
-from docx import Document
 from docx.shared import Pt
 
-# Optional: .bib parsing (install bibtexparser)
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.customization import convert_to_unicode, homogenize_latex_encoding
+from research_assistant.reference.authors import cache_stats as author_cache_stats
+from research_assistant.reference.batch import (
+    BatchError, clean_values, delete_references, select_targets, update_references,
+)
+from research_assistant.reference.bib_import import import_bib_stream
+from research_assistant.reference.citation_cache import citation_cache
+from research_assistant.reference.citation_styles import STYLES, citable_fields, format_authors_apa
+from research_assistant.reference.export import WRITERS, export_lines
+from research_assistant.reference.dedup import DEFAULT_POLICY, DUPLICATE_POLICIES, find_duplicate
+from research_assistant.reference.docx_templates import (
+    BIBLIOGRAPHY_STYLE, TemplateError, base_template, forget_template, prepare_upload, template_version,
+    user_template,
+)
+from research_assistant.reference.facets import parse_tag_filters, tag_conditions, tag_facets
+from research_assistant.reference.jobs import enqueue_bib_import, enqueue_enrichment
+from research_assistant.reference.rollups import library_stats
+from research_assistant.reference.search import search_references
+from research_assistant.reference.similarity import similarity_indexes
 
 bp = Blueprint("reference", __name__, url_prefix="/references")
 
-
-def _normalize_authors_from_bib(entry):
-    """Convert BibTeX 'author' to 'Lastname, F.; Foo, B.'"""
-    raw = (entry.get("author") or "").strip()
-    if not raw:
-        return ""
-    parts = [p.strip() for p in raw.split(" and ") if p.strip()]
-    norm = []
-    for p in parts:
-        if "," in p:
-            last, first = [x.strip() for x in p.split(",", 1)]
-        else:
-            tokens = p.split()
-            last = tokens[-1]
-            first = " ".join(tokens[:-1])
-        initials = "".join([s[0].upper() + "." for s in first.split() if s])
-        norm.append(f"{last}, {initials}".strip())
-    return "; ".join(norm)
-
-
-def _load_bib_entries(file_stream):
-    parser = BibTexParser(common_strings=True)
-    parser.customization = lambda rec: convert_to_unicode(homogenize_latex_encoding(rec))
-    bib_db = bibtexparser.load(file_stream, parser=parser)
-    return bib_db.entries
+MAX_PAGE_SIZE = 1000
+MAX_SIMILAR = 100
 
 
 # -------------------- CRUD --------------------
@@ -46,44 +42,221 @@ def _load_bib_entries(file_stream):
 @bp.route("/", methods=["POST"])
 @jwt_required()
 def add_reference():
+    """
+    Add a reference. A reference with the same DOI, or the same title and
+    year, already in the library is a duplicate; ``on_duplicate`` decides:
+    skip (default, 409 with the existing id) | update (overwrite it, 200) | keep.
+    """
     data = request.get_json() or {}
     title = data.get("title")
     authors = data.get("authors")
     year = data.get("year")
     source = data.get("source")
+    doi = data.get("doi")
     user_id = int(get_jwt_identity())
 
     if not title or not authors or not year:
         return jsonify({"error": "Missing fields"}), 400
-
-    ref = Reference(
-        title=title,
-        authors=authors,
-        year=str(year),
-        source=source,
-        user_id=user_id,
-    )
+    policy, error = _duplicate_policy(data.get("on_duplicate"))
+    if error:
+        return error
+
+    fields = {"title": title, "authors": authors, "year": str(year), "source": source, "doi": doi}
+    if policy != "keep":
+        existing_id = find_duplicate(user_id, title, year, doi)
+        if existing_id is not None and policy == "skip":
+            return jsonify({"error": "Duplicate reference", "duplicate_of": existing_id}), 409
+        if existing_id is not None:
+            ref = db.session.get(Reference, existing_id)
+            for field, value in fields.items():
+                if value is not None:
+                    setattr(ref, field, value)
+            db.session.commit()
+            citation_cache.invalidate(ref.id)
+            return jsonify(ref.to_dict()), 200
+
+    ref = Reference(user_id=user_id, **fields)
     db.session.add(ref)
     db.session.commit()
     return jsonify(ref.to_dict()), 201
 
 
+def _duplicate_policy(value):
+    """(policy, error response) for an ``on_duplicate`` value."""
+    policy = (value or DEFAULT_POLICY).lower()
+    if policy not in DUPLICATE_POLICIES:
+        allowed = "|".join(DUPLICATE_POLICIES)
+        return None, (jsonify({"error": f"on_duplicate must be one of {allowed}"}), 400)
+    return policy, None
+
+
 @bp.route("/", methods=["GET"])
 @jwt_required()
 def list_references():
+    """
+    List the user's references.
+
+    Query params:
+      sort_by  created_at | title | year | id (ties broken by id)
+      order    asc | desc
+      fields   comma-separated subset of Reference.to_dict keys
+      tags_all / tags_any / tags_none
+               comma-separated tag ids the references must all / any /
+               none carry (see reference.facets)
+      facets   1 to add tag facet counts over all matching references
+               (the default when a tag filter is given)
+      limit / cursor
+               keyset pagination; when either is given, or facets are
+               returned, the response is {"items": [...], "next_cursor": ...}
+               instead of a bare list.
+    """
     user_id = int(get_jwt_identity())
     sort_by = request.args.get("sort_by", "created_at")
     allowed = {"created_at", "title", "year", "id"}
     if sort_by not in allowed:
         sort_by = "created_at"
+    descending = request.args.get("order", "asc").lower() == "desc"
 
-    refs = (
-        Reference.query
-        .filter_by(user_id=user_id)
-        .order_by(getattr(Reference, sort_by))
-        .all()
+    fields = _parse_fields(request.args.get("fields"))
+    if fields is None:
+        return jsonify({"error": "Unknown field in 'fields'"}), 400
+    try:
+        tag_filters = parse_tag_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with_facets = _truthy(request.args.get("facets", bool(tag_filters)))
+
+    query = (
+        Reference.query.filter_by(user_id=user_id)
+        .filter(*tag_conditions(tag_filters))
+        .options(*_loader_options(fields, sort_by))
+    )
+
+    sort_col = getattr(Reference, sort_by)
+    cursor = request.args.get("cursor")
+    if cursor is None and "limit" not in request.args:
+        refs = query.order_by(*keyset_order(sort_col, Reference.id, descending)).all()
+        if not with_facets:
+            return jsonify([ref.to_dict(fields) for ref in refs])
+        next_cursor = None
+    else:
+        limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), MAX_PAGE_SIZE)
+        try:
+            refs, next_cursor = keyset_page(
+                query, sort_col, Reference.id, limit,
+                cursor=cursor, sort_key=sort_by, descending=descending,
+            )
+        except CursorError as e:
+            return jsonify({"error": str(e)}), 400
+
+    body = {"items": [ref.to_dict(fields) for ref in refs], "next_cursor": next_cursor}
+    if with_facets:
+        body["facets"] = tag_facets(user_id, tag_filters)
+    return jsonify(body)
+
+
+@bp.route("/search", methods=["GET"])
+@jwt_required()
+def search_references_api():
+    """
+    Ranked full-text search over title, authors, journal, note and doi.
+    Query params: q, page (1-based), per_page, fields.
+    """
+    user_id = int(get_jwt_identity())
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "Missing query 'q'"}), 400
+    page = max(request.args.get("page", 1, type=int) or 1, 1)
+    per_page = min(max(request.args.get("per_page", 20, type=int) or 20, 1), MAX_PAGE_SIZE)
+
+    fields = _parse_fields(request.args.get("fields"))
+    if fields is None:
+        return jsonify({"error": "Unknown field in 'fields'"}), 400
+
+    refs, has_more = search_references(
+        user_id, q, limit=per_page, offset=(page - 1) * per_page,
+        options=_loader_options(fields),
     )
-    return jsonify([ref.to_dict() for ref in refs])
+    return jsonify({
+        "items": [ref.to_dict(fields) for ref in refs],
+        "page": page,
+        "per_page": per_page,
+        "has_more": has_more,
+    })
+
+
+@bp.route("/stats", methods=["GET"])
+@jwt_required()
+def reference_stats():
+    """
+    Library analytics from the pre-aggregated rollups: totals and completion
+    rate, counts per year, and the ``top`` (default 20) journals and tags.
+    """
+    top = min(max(request.args.get("top", 20, type=int) or 20, 1), MAX_PAGE_SIZE)
+    return jsonify(library_stats(int(get_jwt_identity()), top=top))
+
+
+@bp.route("/<int:ref_id>/similar", methods=["GET"])
+@jwt_required()
+def similar_references(ref_id):
+    """
+    "More like this": the user's references closest to ``ref_id`` by TF-IDF
+    cosine similarity of title, journal and note. Query params: k (default
+    10), min_score (0-1, e.g. 0.8 to list likely duplicates), fields.
+    """
+    user_id = int(get_jwt_identity())
+    k = min(max(request.args.get("k", 10, type=int) or 10, 1), MAX_SIMILAR)
+    min_score = request.args.get("min_score", 0.0, type=float)
+    fields = _parse_fields(request.args.get("fields"))
+    if fields is None:
+        return jsonify({"error": "Unknown field in 'fields'"}), 400
+
+    neighbours = similarity_indexes.similar(user_id, ref_id, k=k, min_score=min_score)
+    refs = _load_neighbours(user_id, neighbours, fields)
+    if neighbours is None or len(refs) < len(neighbours):
+        # Written or deleted since the index last compared ids with the table.
+        if neighbours is None and not Reference.query.filter_by(id=ref_id, user_id=user_id).count():
+            return jsonify({"error": "Reference not found"}), 404
+        neighbours = similarity_indexes.similar(user_id, ref_id, k=k, min_score=min_score, reconcile=True)
+        refs = _load_neighbours(user_id, neighbours, fields)
+    return jsonify({
+        "id": ref_id,
+        "items": [
+            {**refs[i].to_dict(fields), "score": score} for i, score in neighbours or () if i in refs
+        ],
+    })
+
+
+def _load_neighbours(user_id, neighbours, fields):
+    """{id: Reference} for the (id, score) pairs of a similarity query."""
+    if not neighbours:
+        return {}
+    return {
+        ref.id: ref for ref in Reference.query.filter(
+            Reference.user_id == user_id, Reference.id.in_([i for i, _ in neighbours])
+        ).options(*_loader_options(fields))
+    }
+
+
+def _loader_options(fields, *extra_columns):
+    """load_only/selectinload options matching a ``fields`` projection."""
+    options = []
+    if fields:
+        columns = {"id", *extra_columns} | (set(fields) - {"tags"})
+        options.append(load_only(*[getattr(Reference, c) for c in columns]))
+    if not fields or "tags" in fields:
+        options.append(selectinload(Reference.tags))
+    return options
+
+
+def _parse_fields(raw):
+    """'id,title,tags' -> ('id', 'title', 'tags'); () when absent, None if invalid."""
+    if not raw:
+        return ()
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    if not set(fields) <= set(Reference.FIELDS) | {"tags"}:
+        return None
+    return fields
 
 
 @bp.route("/<int:ref_id>", methods=["PUT"])
@@ -100,6 +273,7 @@ def update_reference(ref_id):
             setattr(ref, field, data[field])
 
     db.session.commit()
+    citation_cache.invalidate(ref.id)
     return jsonify(ref.to_dict())
 
 
@@ -114,9 +288,65 @@ def delete_reference(ref_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
+    citation_cache.invalidate(ref_id)
     return jsonify({"msg": "Deleted successfully"})
 
 
+# -------------------- Batch mutations --------------------
+# Body: {"ids": [1, 2, 3]} or {"filter": {...}} (see reference.batch), plus
+# the action's own keys. Everything runs in one transaction.
+
+@bp.route("/batch/update", methods=["POST"])
+@jwt_required()
+def batch_update_references():
+    """Set the same field values on many references: {"ids"|"filter", "set": {...}}."""
+    data = request.get_json() or {}
+    return _run_batch(data, lambda user_id, ids: {
+        "updated": update_references(user_id, ids, clean_values(data.get("set"))),
+    })
+
+
+@bp.route("/batch/complete", methods=["POST"])
+@jwt_required()
+def batch_complete_references():
+    """Mark many references completed (or not): {"ids"|"filter", "completed": true}."""
+    data = request.get_json() or {}
+    completed = data.get("completed", True)
+    return _run_batch(data, lambda user_id, ids: {
+        "updated": update_references(user_id, ids, clean_values({"completed": completed})),
+        "completed": completed,
+    })
+
+
+@bp.route("/batch/delete", methods=["POST"])
+@jwt_required()
+def batch_delete_references():
+    """Delete many references with their tag links: {"ids"|"filter"}."""
+    data = request.get_json() or {}
+    return _run_batch(data, lambda user_id, ids: {"deleted": delete_references(user_id, ids)})
+
+
+def _run_batch(data, action):
+    """Resolve the targets, apply ``action(user_id, ids)`` and commit once."""
+    user_id = int(get_jwt_identity())
+    try:
+        ids = select_targets(user_id, data)
+        summary = action(user_id, ids)
+        db.session.commit()
+    except BatchError as e:
+        db.session.rollback()
+        body = {"error": str(e)}
+        if e.ids:
+            body["ids"] = e.ids
+        return jsonify(body), e.status
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Batch failed: {e}"}), 400
+
+    for ref_id in ids:
+        citation_cache.invalidate(ref_id)
+    return jsonify({"matched": len(ids), **summary})
+
 
 # -------------------- Upload .bib  --------------------
 
@@ -127,41 +357,80 @@ def upload_bib():
     Strict to current Reference model:
       Only store: title, authors, year, source(='journal'), user_id
       Only handle @article entries.
+    The file is parsed incrementally and written in chunks of ``chunk_size``
+    rows (default BIB_IMPORT_CHUNK_SIZE); the response reports per-chunk
+    counts and the entries that were skipped.
+    Entries already in the library (same DOI, or same title and year) are
+    handled per ``on_duplicate=skip|update|keep`` (default skip).
+
+    With ``?async=1`` the upload is saved to disk and imported by a
+    background job instead; the response is 202 with the job id, and
+    progress can be polled at /references/jobs/<id>.
     """
     user_id = int(get_jwt_identity())
     f = request.files.get("file")
     if not f:
         return jsonify({"error": "No file uploaded"}), 400
 
+    chunk_size = request.args.get(
+        "chunk_size", current_app.config.get("BIB_IMPORT_CHUNK_SIZE", 500), type=int
+    )
+    if not chunk_size or chunk_size < 1:
+        return jsonify({"error": "chunk_size must be a positive integer"}), 400
+    policy, error = _duplicate_policy(request.args.get("on_duplicate"))
+    if error:
+        return error
+
+    if request.args.get("async", "").lower() in {"1", "true", "yes"}:
+        try:
+            job = enqueue_bib_import(f, user_id, chunk_size, policy)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": f"Failed to queue import: {e}"}), 500
+        return jsonify({"job_id": job.id, "status": job.status}), 202
+
     try:
-        entries = _load_bib_entries(f.stream)
+        report = import_bib_stream(f.stream, user_id, chunk_size=chunk_size, on_duplicate=policy)
     except Exception as e:
-        return jsonify({"error": f"Failed to parse .bib: {e}"}), 400
-
-    created = []
-    for e in entries:
-        if (e.get("ENTRYTYPE") or "").lower() != "article":
-            continue
-
-        title = (e.get("title") or "").strip("{} ")
-        authors = _normalize_authors_from_bib(e)
-        year = (e.get("year") or "").strip()
-        if not (title and authors and year):
-            continue
-
-        ref = Reference(
-            user_id=user_id,
-            title=title,
-            authors=authors,
-            year=str(year),
-            source="journal",
-        )
-        db.session.add(ref)
-        db.session.flush()
-        created.append(ref.to_dict())
+        db.session.rollback()
+        return jsonify({"error": f"Failed to import .bib: {e}"}), 500
 
-    db.session.commit()
-    return jsonify({"count": len(created), "created": created}), 201
+    return jsonify(report), 201
+
+
+@bp.route("/enrich", methods=["POST"])
+@jwt_required()
+def enrich_references_api():
+    """
+    Fill missing journal/volume/issue/pages/doi/url fields from the local
+    metadata index (no network access). Body: {"ids": [...]} to limit it to
+    some references, otherwise the whole library. Runs as a background job;
+    poll /references/jobs/<id>.
+    """
+    user_id = int(get_jwt_identity())
+    index_path = current_app.config.get("METADATA_INDEX_PATH")
+    if not index_path or not os.path.exists(index_path):
+        return jsonify({"error": "Metadata index is not configured"}), 503
+
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({"error": "ids must be a list of integers"}), 400
+
+    try:
+        job = enqueue_enrichment(user_id, index_path, ids)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Failed to queue enrichment: {e}"}), 500
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+
+@bp.route("/jobs/<int:job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    """Progress of a background job (entries parsed, inserted, skipped, errors)."""
+    user_id = int(get_jwt_identity())
+    job = ReferenceJob.query.filter_by(id=job_id, user_id=user_id).first_or_404()
+    return jsonify(job.to_dict())
 
 
 # -------------------- Generate .docx citation  --------------------
@@ -171,23 +440,43 @@ def upload_bib():
 def generate_citation_api(ref_id):
     """
     Generate a .docx file for the citation and trigger download.
-    Supported styles: APA | CHICAGO | MLA
+    Supported styles: any registered style (APA | CHICAGO | MLA | IEEE | HARVARD)
+    ``format=text|html`` returns the rendered citation as JSON instead.
+    ``template_id`` renders the .docx into one of the user's uploaded templates.
+    Renders are served from citation_cache while the reference is unchanged.
     """
     style = (request.args.get("style", "APA") or "APA").upper()
-    if style not in {"APA", "CHICAGO", "MLA"}:
+    if style not in STYLES:
         return jsonify({"error": f"Unsupported style: {style}"}), 400
+    fmt = (request.args.get("format", "docx") or "docx").lower()
+    if fmt not in {"docx", "text", "html"}:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
 
     ref = Reference.query.get_or_404(ref_id)
     if ref.user_id != int(get_jwt_identity()):
         return jsonify({"error": "Unauthorized"}), 403
 
+    if fmt != "docx":
+        render = STYLES[style].text if fmt == "text" else STYLES[style].html
+        citation = citation_cache.get_or_render(ref, style, fmt, lambda: render(ref))
+        return jsonify({"citation": citation, "style": style, "format": fmt})
+
+    template, version, error = _requested_template(ref.user_id)
+    if error:
+        return error
+
+    def render_docx():
+        bio, name = build_docx_citation(ref, style, template)
+        return bio.getvalue(), name
+
+    kind = f"docx:{version}" if version else "docx"
     try:
-        file_bytes, download_name = build_docx_citation(ref, style)
+        data, download_name = citation_cache.get_or_render(ref, style, kind, render_docx)
     except Exception as e:
         return jsonify({"error": f"Failed to build citation: {e}"}), 400
 
     return send_file(
-        file_bytes,
+        BytesIO(data),
         mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         as_attachment=True,
         download_name=download_name,
@@ -195,177 +484,251 @@ def generate_citation_api(ref_id):
     )
 
 
-
-# -------------------- Docx builder & utils --------------------
+@bp.route("/cite/cache-stats", methods=["GET"])
+@jwt_required()
+def citation_cache_stats():
+    """Hit/miss counters and size of this worker's citation and author-parsing caches."""
+    return jsonify({**citation_cache.stats(), "authors": author_cache_stats()})
 
 
-def build_docx_citation(ref, style: str):
+@bp.route("/bibliography", methods=["GET"])
+@jwt_required()
+def generate_bibliography_api():
     """
-    Build a single citation into a .docx for the given style.
-    With current model, we only have: authors, year, title.
-    APA  : Authors (Year). Title.
-    Chicago: Authors. "Title." Year.
-    MLA  : Authors. "Title." Year.
+    Render a whole bibliography into a single .docx download.
+    Selection (combinable): ids=1,2,3 | tag=<tag id> | completed=true|false;
+    with none of them the user's whole library is exported.
+    Supported styles: any registered style (APA | CHICAGO | MLA | IEEE | HARVARD)
+    ``template_id`` renders into one of the user's uploaded templates.
     """
-    doc = Document()
-    normal = doc.styles["Normal"]
-    normal.font.size = Pt(11)
+    user_id = int(get_jwt_identity())
+    style = (request.args.get("style", "APA") or "APA").upper()
+    if style not in STYLES:
+        return jsonify({"error": f"Unsupported style: {style}"}), 400
+    template, _, error = _requested_template(user_id)
+    if error:
+        return error
 
-    p = doc.add_paragraph()
-    p.paragraph_format.space_after = Pt(0)
+    query = Reference.query.filter_by(user_id=user_id).options(
+        load_only(Reference.id, *[getattr(Reference, c) for c in citable_fields()])
+    )
+    try:
+        query = _filter_selection(query)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    authors_raw = getattr(ref, "authors", "") or ""
-    year = getattr(ref, "year", "") or ""
-    title = (getattr(ref, "title", "") or "").strip()
-
-    if style == "APA":
-        authors_text = format_authors_apa(authors_raw)
-        # Authors (Year). Title.
-        if authors_text:
-            add_run(p, authors_text + " ")
-        if year:
-            add_run(p, f"({year}). ")
-        if title:
-            add_run(p, f"{title}. ")
-
-    elif style == "CHICAGO":
-        authors_text = format_authors_chicago(authors_raw)
-        # Authors. "Title." Year.
-        if authors_text:
-            add_run(p, authors_text + ". ")
-        if title:
-            add_run(p, f"\"{title}.\" ")
-        if year:
-            add_run(p, f"{year}. ")
-
-    elif style == "MLA":
-        authors_text = format_authors_mla(authors_raw)
-        # Authors. "Title." Year.
-        if authors_text:
-            add_run(p, authors_text + ". ")
-        if title:
-            add_run(p, f"\"{title}.\" ")
-        if year:
-            add_run(p, f"{year}. ")
+    refs = query.all()
+    if not refs:
+        return jsonify({"error": "No references selected"}), 404
 
-    # 生成内存文件 & 下载名
-    bio = BytesIO()
-    doc.save(bio)
-    bio.seek(0)
+    try:
+        file_bytes, download_name = build_docx_bibliography(refs, style, template)
+    except Exception as e:
+        return jsonify({"error": f"Failed to build bibliography: {e}"}), 400
 
-    first_author = extract_first_author(format_authors_apa(authors_raw))
-    year_str = str(year or "")
-    name = f"{first_author}_{year_str}_{style}.docx".strip("_").replace("__", "_")
-    safe = "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
-    return bio, (safe or f"citation_{style}.docx")
+    return send_file(
+        file_bytes,
+        mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        as_attachment=True,
+        download_name=download_name,
+        max_age=0,
+    )
 
 
-def add_run(paragraph, text, italic=False):
-    r = paragraph.add_run(text)
-    if italic:
-        r.italic = True
-    return r
+# -------------------- Export --------------------
 
+@bp.route("/export", methods=["GET"])
+@jwt_required()
+def export_references():
+    """
+    Stream the user's library as a file: format=bib|csljson|ris (default bib).
+    Selection as for /bibliography: ids=1,2,3 | tag=<tag id> | completed=true|false.
+    Rows are read through a server-side cursor and written as they arrive.
+    """
+    user_id = int(get_jwt_identity())
+    fmt = (request.args.get("format", "bib") or "bib").lower()
+    if fmt not in WRITERS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
 
-def format_authors_apa(authors):
-    if not authors:
-        return ""
-    if isinstance(authors, str):
-        items = [a.strip() for a in authors.split(";") if a.strip()]
-    elif isinstance(authors, (list, tuple)):
-        items = [str(a).strip() for a in authors if str(a).strip()]
-    else:
-        return str(authors)
-
-    n = len(items)
-    if n == 0:
-        return ""
-    if n == 1:
-        return items[0]
-    if n == 2:
-        return f"{items[0]} & {items[1]}"
-    return f"{', '.join(items[:-1])}, & {items[-1]}"
-
-def _split_author_item(item: str):
+    try:
+        query = _filter_selection(Reference.query.filter_by(user_id=user_id))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    writer = WRITERS[fmt]
+    return Response(
+        stream_with_context(export_lines(query, fmt)),
+        mimetype=writer.mimetype,
+        headers={"Content-Disposition": f"attachment; filename=references.{writer.extension}"},
+    )
+
+
+def _truthy(value):
+    return str(value).lower() in {"1", "true", "yes"}
+
+
+def _filter_selection(query):
+    """Apply the ids / tag / completed selection args; raises ValueError on bad input."""
+    if request.args.get("ids"):
+        try:
+            ids = [int(x) for x in request.args["ids"].split(",") if x.strip()]
+        except ValueError:
+            raise ValueError("ids must be a comma-separated list of integers")
+        query = query.filter(Reference.id.in_(ids))
+    if request.args.get("tag"):
+        tag_id = request.args.get("tag", type=int)
+        if tag_id is None:
+            raise ValueError("tag must be a tag id")
+        query = query.filter(Reference.tags.any(Tag.id == tag_id))
+    if request.args.get("completed") is not None:
+        query = query.filter(Reference.completed.is_(_truthy(request.args["completed"])))
+    return query
+
+
+def _requested_template(user_id):
+    """(DocxTemplate, template version, error response) for ?template_id=; base template if absent."""
+    if not request.args.get("template_id"):
+        return base_template(), None, None
+    template_id = request.args.get("template_id", type=int)
+    if template_id is None:
+        return None, None, (jsonify({"error": "template_id must be an integer"}), 400)
+    # Leave the uploaded bytes deferred: user_template only reads them on a cache miss.
+    row = (
+        CitationTemplate.query.options(
+            load_only(CitationTemplate.id, CitationTemplate.user_id, CitationTemplate.created_at)
+        )
+        .filter_by(id=template_id, user_id=user_id)
+        .first()
+    )
+    if row is None:
+        return None, None, (jsonify({"error": "Template not found"}), 404)
+    return user_template(row), template_version(row), None
+
+
+# -------------------- Citation .docx templates --------------------
+
+@bp.route("/templates", methods=["POST"])
+@jwt_required()
+def upload_citation_template():
     """
-    Input like: 'Lastname, F.' or 'Lastname, First Middle'
-    Return (last, first_part) without surrounding spaces/dots normalization.
+    Upload a .docx (letterhead, fonts, page setup) to render citations into.
+    Citations are appended after the template's own body content.
     """
-    item = (item or "").strip()
-    if not item:
-        return "", ""
-    if "," in item:
-        last, first = [x.strip() for x in item.split(",", 1)]
-    else:
-        # fallback: space-split -> last token as last name
-        tokens = item.split()
-        if not tokens:
-            return "", ""
-        last = tokens[-1]
-        first = " ".join(tokens[:-1])
-    return last, first
+    user_id = int(get_jwt_identity())
+    f = request.files.get("file")
+    if not f or not f.filename.lower().endswith(".docx"):
+        return jsonify({"error": "Please upload a .docx file"}), 400
 
+    max_bytes = current_app.config.get("CITATION_TEMPLATE_MAX_BYTES", 5 * 1024 * 1024)
+    raw = f.read(max_bytes + 1)
+    if len(raw) > max_bytes:
+        return jsonify({"error": f"Template exceeds {max_bytes} bytes"}), 400
+    try:
+        data = prepare_upload(raw)
+    except TemplateError as e:
+        return jsonify({"error": str(e)}), 400
 
-def _to_first_last(item: str) -> str:
-    """'Lastname, F.' -> 'F. Lastname'  (for Chicago/MLA subsequent authors)"""
-    last, first = _split_author_item(item)
-    return (f"{first} {last}").strip()
+    name = (request.form.get("name") or f.filename)[:255]
+    template = CitationTemplate(user_id=user_id, name=name, data=data, size=len(data))
+    db.session.add(template)
+    db.session.commit()
+    return jsonify(template.to_dict()), 201
 
 
-def _to_last_first(item: str) -> str:
-    """Normalize to 'Lastname, First/Initials' (for leading author in MLA/Chicago)."""
-    last, first = _split_author_item(item)
-    if not last and not first:
-        return item.strip()
-    return f"{last}, {first}".strip().strip(",")
+@bp.route("/templates", methods=["GET"])
+@jwt_required()
+def list_citation_templates():
+    user_id = int(get_jwt_identity())
+    templates = (
+        CitationTemplate.query.filter_by(user_id=user_id)
+        .options(load_only(CitationTemplate.id, CitationTemplate.name,
+                           CitationTemplate.size, CitationTemplate.created_at))
+        .order_by(CitationTemplate.id)
+        .all()
+    )
+    return jsonify([t.to_dict() for t in templates])
 
 
-def _authors_list(authors: str):
-    """Return list from 'A, B.; C, D.' -> ['A, B.', 'C, D.']"""
-    if not authors:
-        return []
-    return [a.strip() for a in authors.split(";") if a.strip()]
+@bp.route("/templates/<int:template_id>", methods=["DELETE"])
+@jwt_required()
+def delete_citation_template(template_id):
+    template = CitationTemplate.query.filter_by(
+        id=template_id, user_id=int(get_jwt_identity())
+    ).first()
+    if template is None:
+        return jsonify({"error": "Template not found"}), 404
+    db.session.delete(template)
+    db.session.commit()
+    forget_template(template_id)
+    return jsonify({"message": "Template deleted"})
 
 
-def format_authors_chicago(authors: str) -> str:
-    """
-    Chicago bibliography: first author as 'Last, First', subsequent as 'First Last'.
-    Join with comma, final 'and'.
-    """
-    items = _authors_list(authors)
-    n = len(items)
-    if n == 0:
-        return ""
-    if n == 1:
-        return _to_last_first(items[0])
+# -------------------- Docx builder & utils --------------------
+
+
+def build_docx_citation(ref, style: str, template=None):
+    """Build a single citation into a .docx for the given style (base template by default)."""
+    template = template or base_template()
+    doc = template.new_document()
+
+    p = template.add_paragraph(doc)
+    p.paragraph_format.space_after = Pt(0)
+    STYLES[style].add_runs(p, ref)
+
+    # 生成内存文件 & 下载名
+    bio = BytesIO(template.save(doc))
+
+    authors_raw = getattr(ref, "authors", "") or ""
+    year = getattr(ref, "year", "") or ""
+    first_author = extract_first_author(format_authors_apa(authors_raw))
+    year_str = str(year or "")
+    name = f"{first_author}_{year_str}_{style}.docx".strip("_").replace("__", "_")
+    safe = "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+    return bio, (safe or f"citation_{style}.docx")
 
-    first = _to_last_first(items[0])
-    rest = [_to_first_last(x) for x in items[1:]]
-    if len(rest) == 1:
-        return f"{first} and {rest[0]}"
-    return f"{first}, {', '.join(rest[:-1])}, and {rest[-1]}"
+
+def bibliography_sort_key(ref):
+    """Alphabetical by first author, then year, then title (all supported styles)."""
+    return (
+        (getattr(ref, "authors", "") or "").lower(),
+        str(getattr(ref, "year", "") or ""),
+        (getattr(ref, "title", "") or "").lower(),
+    )
 
 
-def format_authors_mla(authors: str) -> str:
+def build_docx_bibliography(refs, style: str, template=None):
     """
-    MLA 9:
-      1 author: 'Last, First'
-      2 authors: 'Last, First, and First Last'
-      3+ authors: 'Last, First, et al.'
+    Render many references into one .docx, sorted, one paragraph per entry.
+    Every entry uses the template's "Bibliography" paragraph style (hanging
+    indent). Entries are cloned from one prepared paragraph element:
+    python-docx's add_paragraph(style=...) re-resolves the style and searches
+    for the insertion point on every call, which dominates at thousands of
+    entries.
     """
-    items = _authors_list(authors)
-    n = len(items)
-    if n == 0:
-        return ""
-    if n == 1:
-        return _to_last_first(items[0])
-    if n == 2:
-        first = _to_last_first(items[0])
-        second = _to_first_last(items[1])
-        return f"{first}, and {second}"
-    # 3+
-    first = _to_last_first(items[0])
-    return f"{first}, et al."
+    template = template or base_template()
+    doc = template.new_document()
+
+    prototype = template.add_paragraph(doc, style=BIBLIOGRAPHY_STYLE)
+    prototype.add_run(" ")
+    prototype.add_run(" ").italic = True
+    template_p = prototype._p
+    plain_r, italic_r = template_p.r_lst
+    for r in (plain_r, italic_r):
+        template_p.remove(r)
+
+    compiled = STYLES[style]
+    for ref in sorted(refs, key=bibliography_sort_key):
+        p = deepcopy(template_p)
+        segments = compiled.segments(ref)
+        for i, (text, italic) in enumerate(segments):
+            r = deepcopy(italic_r if italic else plain_r)
+            r.t_lst[0].text = text.rstrip() if i == len(segments) - 1 else text
+            p.append(r)
+        template_p.addprevious(p)
+    template_p.getparent().remove(template_p)
+
+    bio = BytesIO(template.save(doc))
+    return bio, f"bibliography_{style}.docx"
 
 
 def strip_doi_prefix(doi: str) -> str:
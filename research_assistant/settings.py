@@ -8,6 +8,8 @@ environment variables.
 """
 
 import os
+import tempfile
+
 from environs import Env
 
 env = Env()
@@ -54,3 +56,46 @@ AWS_SECRET_ACCESS_KEY = env.str("AWS_SECRET_ACCESS_KEY")
 AWS_S3_BUCKET_NAME = env.str("AWS_S3_BUCKET_NAME")
 AWS_S3_REGION = env.str("AWS_S3_REGION")
 AWS_S3_ENDPOINT_URL = f"https://{AWS_S3_BUCKET_NAME}.s3.{AWS_S3_REGION}.amazonaws.com"
+
+# Streaming uploads (research_assistant.storage): multipart part size, parallel
+# part uploads, and the memory budget for parts read but not yet uploaded
+STORAGE_PART_SIZE = env.int("STORAGE_PART_SIZE", 8 * 1024 * 1024)
+STORAGE_UPLOAD_CONCURRENCY = env.int("STORAGE_UPLOAD_CONCURRENCY", 4)
+STORAGE_UPLOAD_MAX_MEMORY = env.int("STORAGE_UPLOAD_MAX_MEMORY", 64 * 1024 * 1024)
+
+# Direct-to-S3 document uploads: largest accepted file and presigned POST lifetime
+STORAGE_MAX_UPLOAD_BYTES = env.int("STORAGE_MAX_UPLOAD_BYTES", 512 * 1024 * 1024)
+STORAGE_UPLOAD_URL_EXPIRY = env.int("STORAGE_UPLOAD_URL_EXPIRY", 900)
+
+# Presigned download links: lifetime, how long before expiry a cached link is
+# replaced, and the per-worker cache size (they are also kept in the shared cache)
+STORAGE_DOWNLOAD_URL_EXPIRY = env.int("STORAGE_DOWNLOAD_URL_EXPIRY", 3600)
+STORAGE_DOWNLOAD_URL_MARGIN = env.int("STORAGE_DOWNLOAD_URL_MARGIN", 300)
+STORAGE_URL_CACHE_SIZE = env.int("STORAGE_URL_CACHE_SIZE", 10000)
+
+# Reference import
+BIB_IMPORT_CHUNK_SIZE = env.int("BIB_IMPORT_CHUNK_SIZE", 500)
+REFERENCE_JOB_WORKERS = env.int("REFERENCE_JOB_WORKERS", 2)
+REFERENCE_UPLOAD_DIR = env.str(
+    "REFERENCE_UPLOAD_DIR",
+    default=os.path.join(tempfile.gettempdir(), "research_assistant_uploads"),
+)
+
+# Citation render cache: "memory" (per worker LRU) or "flask" (the shared Flask-Caching store)
+CITATION_CACHE_BACKEND = env.str("CITATION_CACHE_BACKEND", "memory")
+CITATION_CACHE_MAX_BYTES = env.int("CITATION_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+CITATION_CACHE_TIMEOUT = env.int("CITATION_CACHE_TIMEOUT", 3600)
+
+# User-uploaded .docx citation templates
+CITATION_TEMPLATE_MAX_BYTES = env.int("CITATION_TEMPLATE_MAX_BYTES", 5 * 1024 * 1024)
+
+# Offline metadata enrichment: index built with `flask build-metadata-index`
+METADATA_INDEX_PATH = env.str("METADATA_INDEX_PATH", default=None)
+ENRICHMENT_BATCH_SIZE = env.int("ENRICHMENT_BATCH_SIZE", 500)
+
+# "More like this": per-worker TF-IDF indexes, one per recently queried library
+SIMILARITY_MAX_LIBRARIES = env.int("SIMILARITY_MAX_LIBRARIES", 8)
+
+# Tag autocomplete: per-worker prefix indexes; usage ranking refreshed every TTL seconds
+TAG_SUGGEST_MAX_USERS = env.int("TAG_SUGGEST_MAX_USERS", 64)
+TAG_SUGGEST_TTL = env.int("TAG_SUGGEST_TTL", 300)
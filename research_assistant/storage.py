@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Streaming uploads to S3 with bounded memory.
+
+``upload_stream`` reads a file object part by part and never needs its size
+up front: a body smaller than one part is sent with a single ``put_object``,
+anything larger becomes a multipart upload whose parts are sent by a small
+thread pool while the next ones are read. At most STORAGE_UPLOAD_MAX_MEMORY
+bytes of parts are held at a time (reading waits for a part to finish uploading),
+and the size and SHA-256 of the body are computed as it streams through.
+A failed multipart upload is aborted so no orphaned parts are billed.
+
+``presigned_upload`` and ``stat_object`` serve the other way in: clients
+upload straight to S3 and the app only checks the result. Download links
+come from ``presigned_urls``, which reuses signed URLs until near expiry.
+
+Tuning (app config):
+  STORAGE_PART_SIZE           bytes per part, at least S3's 5 MiB minimum
+  STORAGE_UPLOAD_CONCURRENCY  parts uploaded in parallel
+  STORAGE_UPLOAD_MAX_MEMORY   budget for parts read but not yet uploaded
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from flask import current_app
+
+from research_assistant.extensions import cache, get_s3_client
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+READ_CHUNK = 1024 * 1024
+
+StoredObject = namedtuple("StoredObject", "bucket key size sha256 etag")
+
+
+def default_bucket():
+    return current_app.config["AWS_S3_BUCKET_NAME"]
+
+
+def upload_settings():
+    """(part size, concurrency, max in-flight parts) from the app config."""
+    config = current_app.config
+    part_size = max(config.get("STORAGE_PART_SIZE", 8 * 1024 * 1024), MIN_PART_SIZE)
+    concurrency = max(config.get("STORAGE_UPLOAD_CONCURRENCY", 4), 1)
+    budget = config.get("STORAGE_UPLOAD_MAX_MEMORY", 64 * 1024 * 1024)
+    return part_size, concurrency, max(budget // part_size, 1)
+
+
+class _HashingReader:
+    """Reads exact-size parts from a stream, counting and hashing the bytes."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self._pending = None
+
+    def unread(self, part):
+        """Make ``part`` (already counted) the next one returned."""
+        self._pending = part
+
+    def read_part(self, part_size):
+        if self._pending is not None:
+            part, self._pending = self._pending, None
+            return part
+        buf = bytearray()
+        while len(buf) < part_size:
+            chunk = self.stream.read(min(READ_CHUNK, part_size - len(buf)))
+            if not chunk:
+                break
+            buf += chunk
+        self.size += len(buf)
+        self.sha256.update(buf)
+        return bytes(buf)
+
+
+def upload_stream(stream, key, bucket=None, content_type=None, client=None):
+    """Upload everything readable from ``stream`` to ``bucket/key``; returns a StoredObject."""
+    bucket = bucket or default_bucket()
+    client = client or get_s3_client()
+    part_size, concurrency, in_flight = upload_settings()
+    extra = {"ContentType": content_type} if content_type else {}
+    reader = _HashingReader(stream)
+
+    first = reader.read_part(part_size)
+    if len(first) < part_size:
+        response = client.put_object(Bucket=bucket, Key=key, Body=first, **extra)
+        return StoredObject(bucket, key, reader.size, reader.sha256.hexdigest(), response["ETag"])
+
+    reader.unread(first)
+    del first
+    upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, **extra)["UploadId"]
+    try:
+        parts = _upload_parts(client, bucket, key, upload_id, reader, part_size, concurrency, in_flight)
+        response = client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return StoredObject(bucket, key, reader.size, reader.sha256.hexdigest(), response["ETag"])
+
+
+def _upload_parts(client, bucket, key, upload_id, reader, part_size, concurrency, in_flight):
+    # One slot per part read but not yet uploaded; reading the next part waits for a free slot.
+    slots = threading.BoundedSemaphore(in_flight)
+    failed = threading.Event()
+
+    def send(number, body):
+        try:
+            response = client.upload_part(
+                Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+            )
+            return {"PartNumber": number, "ETag": response["ETag"]}
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        number = 1
+        while True:
+            slots.acquire()
+            body = b"" if failed.is_set() else reader.read_part(part_size)
+            if not body:
+                slots.release()
+                break
+            futures.append(pool.submit(send, number, body))
+            del body
+            number += 1
+    return [future.result() for future in futures]
+
+
+def presigned_upload(key, size, content_type=None, expires_in=900, bucket=None, client=None):
+    """
+    A presigned POST ({"url", "fields"}) letting a client upload ``bucket/key``
+    directly; S3 itself rejects a body that is not exactly ``size`` bytes.
+    """
+    bucket = bucket or default_bucket()
+    client = client or get_s3_client()
+    fields, conditions = {}, [["content-length-range", size, size]]
+    if content_type:
+        fields["Content-Type"] = content_type
+        conditions.append({"Content-Type": content_type})
+    return client.generate_presigned_post(
+        bucket, key, Fields=fields, Conditions=conditions, ExpiresIn=expires_in
+    )
+
+
+def stat_object(key, bucket=None, client=None):
+    """(size, etag without quotes) of ``bucket/key``, or None if there is no such object."""
+    bucket = bucket or default_bucket()
+    client = client or get_s3_client()
+    try:
+        head = client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return head["ContentLength"], head["ETag"].strip('"')
+
+
+class PresignedUrlCache:
+    """
+    Presigned download URLs, reused until they are within ``margin`` seconds
+    of expiring. Entries live in a bounded per-worker LRU and in the shared
+    Flask-Caching ``cache``, so a listing viewed again - on any worker -
+    signs nothing. Keyed on (bucket, key, download file name), since the
+    name is part of the signed URL.
+    """
+
+    def __init__(self, max_entries=10000, expires_in=3600, margin=300):
+        self.max_entries = max_entries
+        self.expires_in = expires_in
+        self.margin = margin
+        self.signed = 0
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("STORAGE_URL_CACHE_SIZE", 10000)
+        self.expires_in = app.config.get("STORAGE_DOWNLOAD_URL_EXPIRY", 3600)
+        self.margin = min(app.config.get("STORAGE_DOWNLOAD_URL_MARGIN", 300), self.expires_in // 2)
+        self.clear()
+
+    @staticmethod
+    def _cache_key(bucket, key, filename):
+        digest = hashlib.sha1(f"{bucket}\0{key}\0{filename or ''}".encode("utf-8")).hexdigest()
+        return f"presigned:{digest}"
+
+    def get(self, key, filename=None, bucket=None):
+        """A GET URL for ``bucket/key``, downloading as ``filename`` when given."""
+        return self.get_many([(key, filename)], bucket)[0]
+
+    def get_many(self, objects, bucket=None, client=None):
+        """GET URLs for [(key, filename)], signing only those not cached; in the same order."""
+        bucket = bucket or default_bucket()
+        now = time.time()
+        wanted = [self._cache_key(bucket, key, filename) for key, filename in objects]
+        urls = {}
+        with self._lock:
+            for ck in wanted:
+                entry = self._local.get(ck)
+                if entry and entry[1] - self.margin > now:
+                    urls[ck] = entry[0]
+                    self._local.move_to_end(ck)
+
+        missing = [ck for ck in dict.fromkeys(wanted) if ck not in urls]
+        if missing:
+            for ck, entry in zip(missing, cache.get_many(*missing)):
+                if entry and entry[1] - self.margin > now:
+                    urls[ck] = entry[0]
+                    self._remember(ck, entry)
+
+        fresh = {}
+        for ck, (key, filename) in zip(wanted, objects):
+            if ck in urls:
+                continue
+            params = {"Bucket": bucket, "Key": key}
+            if filename:
+                params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+            client = client or get_s3_client()
+            url = client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.expires_in)
+            urls[ck] = url
+            fresh[ck] = (url, now + self.expires_in)
+            self._remember(ck, fresh[ck])
+        if fresh:
+            self.signed += len(fresh)
+            cache.set_many(fresh, timeout=self.expires_in - self.margin)
+        return [urls[ck] for ck in wanted]
+
+    def _remember(self, ck, entry):
+        with self._lock:
+            self._local[ck] = entry
+            self._local.move_to_end(ck)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+presigned_urls = PresignedUrlCache()
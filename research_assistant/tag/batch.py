@@ -0,0 +1,114 @@
+"""Set-based tag assignment and removal across many references.
+
+Targets are resolved like reference batches (``ids`` or ``filter``, see
+reference.batch), which also checks they belong to the user. Then:
+
+  resolve   one ``INSERT ... ON CONFLICT (user_id, name) DO UPDATE ...
+            RETURNING`` creates the missing tags and returns the ids of all
+            requested names
+  assign    ``INSERT INTO document_tags SELECT ... ON CONFLICT DO NOTHING``
+            per STATEMENT_CHUNK references; pairs already present are skipped
+            by the unique (document_id, tag_id) index
+  remove    one DELETE per STATEMENT_CHUNK references
+
+Every statement is scoped to the user's references and tags. Library
+statistics are kept current through ``track_changes``.
+"""
+from sqlalchemy import delete, func, inspect, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+
+from research_assistant.extensions import db
+from research_assistant.reference.batch import BatchError, chunks
+from research_assistant.reference.models import Reference
+from research_assistant.reference.rollups import track_changes
+from research_assistant.tag.models import DocumentTag, Tag
+
+MAX_BATCH_TAGS = 100
+LINK_INDEX = "uq_document_tags_document_tag"
+_NAME_LIMIT = Tag.__table__.c.name.type.length
+
+
+def _dialect_insert(table):
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Batch tagging needs INSERT ... ON CONFLICT, not available on {dialect}")
+
+
+def clean_names(names):
+    """Validate a list of tag names; returns them stripped and de-duplicated, in order."""
+    if not isinstance(names, list) or not names or not all(isinstance(n, str) for n in names):
+        raise BatchError("tags must be a non-empty list of names")
+    names = list(dict.fromkeys(n.strip() for n in names if n.strip()))
+    if not names:
+        raise BatchError("tags must be a non-empty list of names")
+    if len(names) > MAX_BATCH_TAGS:
+        raise BatchError(f"At most {MAX_BATCH_TAGS} tags per batch")
+    too_long = [n for n in names if len(n) > _NAME_LIMIT]
+    if too_long:
+        raise BatchError(f"Tag names longer than {_NAME_LIMIT} characters: {', '.join(too_long[:5])}")
+    return names
+
+
+def resolve_tags(user_id, names, create=True):
+    """{name: tag id} for the user's tags called ``names``; missing ones are created when ``create``."""
+    if not create:
+        return dict(db.session.execute(
+            select(Tag.name, Tag.id).where(Tag.user_id == user_id, Tag.name.in_(names))
+        ).all())
+    stmt = _dialect_insert(Tag.__table__).values([{"user_id": user_id, "name": n} for n in names])
+    # A no-op update instead of DO NOTHING, so RETURNING also yields the existing rows.
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "name"], set_={"name": stmt.excluded.name}
+    ).returning(Tag.__table__.c.name, Tag.__table__.c.id)
+    return dict(db.session.execute(stmt).all())
+
+
+def assign_tags(user_id, ids, tag_ids):
+    """Link every reference in ``ids`` to every tag in ``tag_ids``; returns the number of new links."""
+    assigned = 0
+    with track_changes(ids):
+        for chunk in chunks(ids):
+            # Every (reference, tag) pair: a deliberate cross join.
+            pairs = (
+                select(Reference.id, Tag.id)
+                .join(Tag, true())
+                .where(Reference.user_id == user_id, Reference.id.in_(chunk),
+                       Tag.user_id == user_id, Tag.id.in_(tag_ids))
+            )
+            stmt = _dialect_insert(DocumentTag.__table__).from_select(["document_id", "tag_id"], pairs)
+            result = db.session.execute(stmt.on_conflict_do_nothing(index_elements=["document_id", "tag_id"]))
+            assigned += result.rowcount
+    return assigned
+
+
+def remove_tags(user_id, ids, tag_ids):
+    """Unlink the tags ``tag_ids`` from the references ``ids``; returns the number of links removed."""
+    owned_tags = select(Tag.id).where(Tag.user_id == user_id, Tag.id.in_(tag_ids))
+    removed = 0
+    with track_changes(ids):
+        for chunk in chunks(ids):
+            result = db.session.execute(
+                delete(DocumentTag)
+                .where(DocumentTag.document_id.in_(chunk), DocumentTag.tag_id.in_(owned_tags))
+                .execution_options(synchronize_session=False)
+            )
+            removed += result.rowcount
+    return removed
+
+
+def remove_duplicate_links():
+    """
+    Delete repeated (document_id, tag_id) rows so the unique link index can
+    be created on an existing database; returns the number of rows deleted.
+    """
+    if LINK_INDEX in {ix["name"] for ix in inspect(db.engine).get_indexes(DocumentTag.__tablename__)}:
+        return 0
+    keep = select(func.min(DocumentTag.id)).group_by(DocumentTag.document_id, DocumentTag.tag_id)
+    result = db.session.execute(
+        delete(DocumentTag).where(DocumentTag.id.not_in(keep)).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,74 @@
+"""The caller's references with their tags, for ``/tags/all-docs-with-tags``.
+
+A page costs two queries however many tags there are: one keyset range over
+``(user_id, id)`` for the references (joined to ``document_tags`` when
+filtering by tag), one for the tags of exactly those references. The whole
+library is produced the same way, page after page, and serialized to JSON
+as it is read, so neither the rows nor the response body are held in
+memory at once.
+"""
+import json
+
+from sqlalchemy import select
+
+from research_assistant.extensions import db
+from research_assistant.reference.models import Reference
+from research_assistant.tag.models import DocumentTag, Tag
+
+BATCH_SIZE = 1000
+
+
+def documents_page(user_id, limit, after_id=0, tag_id=None):
+    """([{"id", "title", "completed", "tags"}], has_more) for references with id > ``after_id``."""
+    stmt = (
+        select(Reference.id, Reference.title, Reference.completed)
+        .where(Reference.user_id == user_id, Reference.id > after_id)
+        .order_by(Reference.id)
+        .limit(limit + 1)
+    )
+    if tag_id is not None:
+        stmt = stmt.join(DocumentTag, Reference.id == DocumentTag.document_id).where(DocumentTag.tag_id == tag_id)
+    rows = db.session.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    tags = {}
+    if rows:
+        for doc_id, tid, name in db.session.execute(
+            select(DocumentTag.document_id, Tag.id, Tag.name)
+            .join(Tag, Tag.id == DocumentTag.tag_id)
+            .where(DocumentTag.document_id.in_([r.id for r in rows]), Tag.user_id == user_id)
+            .order_by(DocumentTag.document_id, Tag.id)
+        ):
+            tags.setdefault(doc_id, []).append({"id": tid, "name": name})
+    return [
+        {"id": r.id, "title": r.title, "completed": r.completed, "tags": tags.get(r.id, [])}
+        for r in rows
+    ], has_more
+
+
+def _dumps(items):
+    return ",".join(json.dumps(item, ensure_ascii=False) for item in items)
+
+
+def stream_all(user_id, tag_id=None, batch_size=BATCH_SIZE):
+    """Yield a JSON array of the user's whole (filtered) library, one page of references at a time."""
+    yield "["
+    after_id, first = 0, True
+    while True:
+        items, has_more = documents_page(user_id, batch_size, after_id, tag_id)
+        if items:
+            yield ("" if first else ",") + _dumps(items)
+            first = False
+            after_id = items[-1]["id"]
+        if not has_more:
+            break
+    yield "]"
+
+
+def stream_page(items, next_cursor, chunk=100):
+    """Yield the JSON object {"items": [...], "next_cursor": ...} for one page."""
+    yield '{"items":['
+    for i in range(0, len(items), chunk):
+        yield ("," if i else "") + _dumps(items[i:i + chunk])
+    yield f'],"next_cursor":{json.dumps(next_cursor)}}}'
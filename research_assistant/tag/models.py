@@ -1,21 +1,29 @@
-from research_assistant.database import Column, PkModel, db, reference_col, relationship
-from research_assistant.reference.models import Reference
+from research_assistant.database import db, reference_col
+from research_assistant.reference.models import Reference  # noqa: F401 (registers the relationship target)
 
 class Tag(db.Model):
     __tablename__ = "tags"
+    # Tag names are unique per user (resolved with INSERT ... ON CONFLICT, see tag.batch).
+    __table_args__ = (
+        db.Index("uq_tags_user_name", "user_id", "name", unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(64), unique=True, nullable=False)
+    name = db.Column(db.String(64), nullable=False)
     user_id = db.Column(db.Integer, nullable=False)
     documents = db.relationship("Reference", secondary="document_tags", back_populates="tags")
 
-
     def __repr__(self):
         return f"<Tag({self.name})>"
 
 # 多对多中间表，指向 reference 表而非本地 document 表
 class DocumentTag(db.Model):
     __tablename__ = "document_tags"
+    __table_args__ = (
+        db.Index("uq_document_tags_document_tag", "document_id", "tag_id", unique=True),
+        # Tag filters and facets (see reference.facets) scan by tag.
+        db.Index("ix_document_tags_tag_document", "tag_id", "document_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     document_id = reference_col("reference")  # 指向 reference.id
-    tag_id = reference_col("tags")
\ No newline at end of file
+    tag_id = reference_col("tags")
@@ -0,0 +1,124 @@
+"""Tag autocomplete: per-user prefix indexes behind ``/tags/suggest``.
+
+A user's tags are held as a sorted array of folded names (case and accents
+ignored), so the tags starting with a prefix are one ``bisect`` range.
+Ranking is by usage (``tag_usage``, i.e. the tag rollups), then name. The
+best ``k`` of a range come from whichever is cheaper: ranking the range
+itself when it is narrow, or walking all tags in usage order until ``k``
+fall inside it when it is wide (and so dense).
+
+Indexes are built lazily on the first suggestion for a user and kept in a
+bounded per-worker LRU. Creating, renaming or deleting tags must call
+``tag_suggestions.invalidate(user_id)``; that drops the local index and bumps
+a version in the shared cache so the other workers rebuild theirs too.
+Usage counts only move the ranking, so they are refreshed every
+TAG_SUGGEST_TTL seconds rather than on every assignment.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+from research_assistant.extensions import cache
+from research_assistant.reference.rollups import tag_usage
+
+MAX_SUGGESTIONS = 50
+# Sorts after every character a folded name can contain.
+_HIGH = "\U0010ffff"
+
+
+def fold(text):
+    """Case- and accent-insensitive form of a tag name or query."""
+    if text.isascii():
+        return text.strip().lower()
+    folded = unicodedata.normalize("NFKD", text.strip())
+    return "".join(c for c in folded if not unicodedata.combining(c)).casefold()
+
+
+class TagIndex:
+    """Sorted prefix index over one user's tags."""
+
+    def __init__(self, user_id, version=None):
+        self.user_id = user_id
+        self.version = version
+        self.built_at = time.monotonic()
+        entries = sorted((fold(name), name, tag_id, count) for tag_id, name, count in tag_usage(user_id))
+        self.keys = [e[0] for e in entries]
+        self.tags = [{"id": e[2], "name": e[1], "count": e[3]} for e in entries]
+        # Positions in ``keys`` by descending usage, and each position's rank in that order.
+        self.by_usage = sorted(range(len(entries)), key=lambda i: (-entries[i][3], entries[i][0]))
+        self.rank = [0] * len(entries)
+        for rank, i in enumerate(self.by_usage):
+            self.rank[i] = rank
+
+    def __len__(self):
+        return len(self.keys)
+
+    def suggest(self, q, k=10):
+        """The ``k`` most used tags whose folded name starts with ``fold(q)``."""
+        prefix = fold(q)
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _HIGH, lo)
+        matched = hi - lo
+        if not matched:
+            return []
+        if matched * matched <= k * len(self.keys):
+            best = heapq.nsmallest(k, range(lo, hi), key=self.rank.__getitem__)
+        else:
+            best = []
+            for i in self.by_usage:
+                if lo <= i < hi:
+                    best.append(i)
+                    if len(best) == k:
+                        break
+        return [self.tags[i] for i in best]
+
+
+class TagSuggestions:
+    """Bounded LRU of TagIndex per user, local to the worker process."""
+
+    def __init__(self, max_users=64, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_users = app.config.get("TAG_SUGGEST_MAX_USERS", 64)
+        self.ttl = app.config.get("TAG_SUGGEST_TTL", 300)
+        self.clear()
+
+    @staticmethod
+    def _version_key(user_id):
+        return f"tag-suggest:{user_id}"
+
+    def get(self, user_id):
+        version = cache.get(self._version_key(user_id))
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is None or index.version != version or time.monotonic() - index.built_at > self.ttl:
+            index = TagIndex(user_id, version)
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def suggest(self, user_id, q, k=10):
+        return self.get(user_id).suggest(q, k)
+
+    def invalidate(self, user_id):
+        """Call after committing a change to the user's tag names."""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+        cache.set(self._version_key(user_id), time.time_ns(), timeout=0)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+tag_suggestions = TagSuggestions()
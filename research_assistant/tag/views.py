@@ -1,11 +1,24 @@
-from flask import Blueprint, jsonify, request 
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from research_assistant.extensions import db
-from research_assistant.reference.models import Reference as Document 
-from research_assistant.tag.models import DocumentTag, Tag
+from research_assistant.reference.models import Reference as Document
+from research_assistant.tag.models import Tag
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+
+from research_assistant.pagination import CursorError, decode_cursor, encode_cursor
+from research_assistant.reference.batch import BatchError, select_targets
+from research_assistant.reference.rollups import tag_usage
+from research_assistant.tag.batch import assign_tags, clean_names, remove_tags, resolve_tags
+from research_assistant.tag.documents import documents_page, stream_all, stream_page
+from research_assistant.tag.suggest import MAX_SUGGESTIONS, tag_suggestions
 
 blueprint = Blueprint("tag", __name__, url_prefix="/tags")
 
+MAX_PAGE_SIZE = 1000
+# A database from before per-user tag names that still has the global unique on tags.name.
+TAG_CONFLICT = "Tag name conflicts with an existing tag"
+
 # 创建标签（如果已存在则返回）
 @blueprint.route("/", methods=["POST"])
 @jwt_required()
@@ -21,6 +34,7 @@ def add_tag():
         tag = Tag(name=name, user_id=user_id)
         db.session.add(tag)
         db.session.commit()
+        tag_suggestions.invalidate(int(user_id))
 
     return jsonify({"id": tag.id, "name": tag.name}), 200
 
@@ -32,82 +46,173 @@ def list_tags():
     tags = Tag.query.filter_by(user_id=user_id).all()
     return jsonify([{"id": t.id, "name": t.name} for t in tags])
 
+# 标签自动补全（按前缀匹配，按使用次数排序）
+@blueprint.route("/suggest", methods=["GET"])
+@jwt_required()
+def suggest_tags():
+    user_id = int(get_jwt_identity())
+    q = request.args.get("q", "")
+    k = min(max(request.args.get("k", 10, type=int) or 10, 1), MAX_SUGGESTIONS)
+    return jsonify(tag_suggestions.suggest(user_id, q, k))
+
 # 获取标签统计信息（每个标签使用次数）
 @blueprint.route("/stats", methods=["GET"])
 @jwt_required()
 def tag_stats():
-    user_id = get_jwt_identity()
-    result = db.session.query(
-        Tag.name, db.func.count(DocumentTag.id).label("count")
-    ).join(DocumentTag, Tag.id == DocumentTag.tag_id) \
-     .filter(Tag.user_id == user_id) \
-     .group_by(Tag.name).all()
-
-    return jsonify([{"tag": name, "count": count} for name, count in result])
+    # 计数由 reference.rollups 增量维护，这里只读不聚合
+    user_id = int(get_jwt_identity())
+    return jsonify([
+        {"id": tag_id, "tag": name, "count": count}
+        for tag_id, name, count in tag_usage(user_id) if count
+    ])
 
 # 为文档添加标签（如果标签不存在则创建）
 @blueprint.route("/assign", methods=["POST"])
 @jwt_required()
 def assign_tag():
+    user_id = int(get_jwt_identity())
     data = request.get_json()
     doc_id = data.get("document_id")
-    tag_name = data.get("tag")
+    tag_name = (data.get("tag") or "").strip()
 
     if not doc_id or not tag_name:
         return jsonify({"error": "Missing document_id or tag"}), 400
 
-    document = Document.query.get(doc_id)
+    document = _owned_document(user_id, doc_id)
     if not document:
         return jsonify({"error": "Document not found"}), 404
 
-    tag = Tag.query.filter_by(name=tag_name).first()
-    if not tag:
-        tag = Tag(name=tag_name, user_id=1)  # 可以用1或者当前user_id
-        db.session.add(tag)
-        db.session.flush()
+    try:
+        tag_id = resolve_tags(user_id, clean_names([tag_name]))[tag_name]
+        assign_tags(user_id, [document.id], [tag_id])
+        db.session.commit()
+        tag_suggestions.invalidate(user_id)
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), e.status
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": TAG_CONFLICT}), 409
+    return jsonify({"msg": f"Tag '{tag_name}' assigned to Document '{document.title}'"}), 200
 
-    if tag not in document.tags:
-        document.tags.append(tag)
 
-    db.session.commit()
-    return jsonify({"msg": f"Tag '{tag.name}' assigned to Document '{document.title}'"}), 200
+def _owned_document(user_id, doc_id):
+    return Document.query.options(load_only(Document.id, Document.title)).filter_by(
+        id=doc_id, user_id=user_id
+    ).first()
 
 # 获取所有文档及其标签
 @blueprint.route("/all-docs-with-tags", methods=["GET"])
 @jwt_required()
 def get_all_docs_with_tags():
-    docs = Document.query.all()
-    result = []
-    for doc in docs:
-        result.append({
-            "id": doc.id,
-            "title": doc.title,
-            "completed": doc.completed,
-            "tags": [{"id": tag.id, "name": tag.name} for tag in doc.tags]
-        })
-    return jsonify(result), 200
+    """
+    The caller's references with their tags, by id, streamed as JSON.
+
+    Query params:
+      tag_id   only references carrying this tag
+      limit / cursor
+               keyset pagination; when either is given the response is
+               {"items": [...], "next_cursor": ...} instead of a bare list.
+    """
+    user_id = int(get_jwt_identity())
+    tag_id = request.args.get("tag_id", type=int)
+    if request.args.get("tag_id") and tag_id is None:
+        return jsonify({"error": "tag_id must be an integer"}), 400
+
+    cursor = request.args.get("cursor")
+    if cursor is None and "limit" not in request.args:
+        return Response(stream_with_context(stream_all(user_id, tag_id)), mimetype="application/json")
+
+    limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), MAX_PAGE_SIZE)
+    after_id = 0
+    if cursor:
+        try:
+            after_id = int(decode_cursor(cursor, "id", False)[1])
+        except (CursorError, TypeError, ValueError):
+            return jsonify({"error": "Invalid cursor"}), 400
+    items, has_more = documents_page(user_id, limit, after_id, tag_id)
+    last_id = items[-1]["id"] if items else None
+    next_cursor = encode_cursor("id", False, last_id, last_id) if has_more else None
+    return Response(stream_with_context(stream_page(items, next_cursor)), mimetype="application/json")
 
 # 删除某文档上的某个标签
 @blueprint.route("/remove", methods=["DELETE"])
 @jwt_required()
 def remove_tag_from_document():
+    user_id = int(get_jwt_identity())
     data = request.get_json()
     doc_id = data.get("document_id")
     tag_id = data.get("tag_id")
 
-    document = Document.query.get(doc_id)
-    tag = Tag.query.get(tag_id)
+    document = _owned_document(user_id, doc_id)
+    tag = Tag.query.filter_by(id=tag_id, user_id=user_id).first()
 
     if not document or not tag:
         return jsonify({"error": "Unauthorized or not found"}), 404
 
-    if tag in document.tags:
-        document.tags.remove(tag)
+    if remove_tags(user_id, [document.id], [tag.id]):
         db.session.commit()
         return jsonify({"msg": f"Tag '{tag.name}' removed from document '{document.title}'"}), 200
 
     return jsonify({"error": "Tag was not assigned to the document"}), 400
 
+
+# -------------------- Batch tagging --------------------
+# Body: {"ids": [...]} or {"filter": {...}} selecting references (see
+# reference.batch), plus "tags": [names]. One transaction per request.
+
+@blueprint.route("/batch/assign", methods=["POST"])
+@jwt_required()
+def batch_assign_tags():
+    """Add tags (created if missing) to many references: {"ids"|"filter", "tags": [...]}."""
+    data = request.get_json() or {}
+
+    def action(user_id, ids):
+        tags = resolve_tags(user_id, clean_names(data.get("tags")))
+        return {
+            "tags": [{"id": tag_id, "name": name} for name, tag_id in tags.items()],
+            "assigned": assign_tags(user_id, ids, list(tags.values())),
+        }
+
+    return _run_tag_batch(data, action, creates_tags=True)
+
+
+@blueprint.route("/batch/remove", methods=["POST"])
+@jwt_required()
+def batch_remove_tags():
+    """Remove tags from many references: {"ids"|"filter", "tags": [...]}."""
+    data = request.get_json() or {}
+
+    def action(user_id, ids):
+        tags = resolve_tags(user_id, clean_names(data.get("tags")), create=False)
+        return {"removed": remove_tags(user_id, ids, list(tags.values())) if tags else 0}
+
+    return _run_tag_batch(data, action)
+
+
+def _run_tag_batch(data, action, creates_tags=False):
+    """Resolve the target references, apply ``action(user_id, ids)`` and commit once."""
+    user_id = int(get_jwt_identity())
+    try:
+        ids = select_targets(user_id, data)
+        summary = action(user_id, ids)
+        db.session.commit()
+        if creates_tags:
+            tag_suggestions.invalidate(user_id)
+    except BatchError as e:
+        db.session.rollback()
+        body = {"error": str(e)}
+        if e.ids:
+            body["ids"] = e.ids
+        return jsonify(body), e.status
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": TAG_CONFLICT}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Batch failed: {e}"}), 400
+    return jsonify({"matched": len(ids), **summary})
+
 # 设置文档完成或未完成状态
 @blueprint.route("/mark-complete", methods=["POST"])
 @jwt_required()
@@ -141,6 +246,7 @@ def update_tag_name():
 
     tag.name = new_name
     db.session.commit()
+    tag_suggestions.invalidate(tag.user_id)
     return jsonify({"msg": f"Tag renamed to '{new_name}'"}), 200
 
 # 删除标签（整个标签及其关联）
@@ -160,4 +266,5 @@ def delete_tag():
 
     db.session.delete(tag)
     db.session.commit()
+    tag_suggestions.invalidate(tag.user_id)
     return jsonify({"msg": f"Tag '{tag.name}' deleted"}), 200
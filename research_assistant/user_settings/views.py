@@ -153,7 +153,7 @@ def update_profile():
 def delete_account():
     """
     Delete the user's account and all related data:
-    - References
+    - References, their import jobs and citation templates
     - Tags
     - Brain entries
     - Planning tasks and phases
@@ -172,7 +172,11 @@ def delete_account():
     send_deletion_email = settings.notifications_enabled if settings else False
 
     from research_assistant.tag.models import DocumentTag
+    from research_assistant.reference.models import CitationTemplate, ReferenceRollup
+    from research_assistant.reference.docx_templates import forget_template
+    from research_assistant.reference.jobs import delete_user_jobs, remove_upload_files
     from research_assistant.brain.models import BrainEntry
+    from research_assistant.tag.suggest import tag_suggestions
     from sqlalchemy import text
 
     try:
@@ -191,12 +195,20 @@ def delete_account():
         Phase.query.filter_by(user_id=user_id).delete()
         BrainEntry.query.filter_by(user_id=user_id).delete()
         Reference.query.filter_by(user_id=user_id).delete()
+        ReferenceRollup.query.filter_by(user_id=user_id).delete()
+        template_ids = [t for (t,) in db.session.query(CitationTemplate.id).filter_by(user_id=user_id)]
+        CitationTemplate.query.filter_by(user_id=user_id).delete()
+        upload_files = delete_user_jobs(user_id)
         Tag.query.filter_by(user_id=user_id).delete()
         UserSettings.query.filter_by(user_id=user_id).delete()
 
         # Delete user record
         db.session.delete(user)
         db.session.commit()
+        tag_suggestions.invalidate(int(user_id))
+        remove_upload_files(upload_files)
+        for template_id in template_ids:
+            forget_template(template_id)
 
         # Send final account deletion email if enabled
         if send_deletion_email:
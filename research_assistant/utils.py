@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 """Helper utilities and decorators."""
-from flask import current_app, flash
+from flask import flash
 
-from research_assistant.extensions import get_s3_client
+from research_assistant.storage import upload_stream
 
 
 def flash_errors(form, category="warning"):
@@ -14,10 +14,4 @@ def flash_errors(form, category="warning"):
 
 def upload_file_to_s3(file_storage, key_name, bucket_name=None):
     """Upload a file object to S3 and return the key name."""
-    s3_client = get_s3_client()
-
-    if not bucket_name:
-        bucket_name = current_app.config["AWS_S3_BUCKET_NAME"]
-
-    s3_client.upload_fileobj(file_storage, bucket_name, key_name)
-    return key_name
+    return upload_stream(file_storage, key_name, bucket_name).key
@@ -0,0 +1,142 @@
+"""Content-addressed, reference-counted storage of document version files.
+
+Every uploaded file is stored once per distinct content: ``document_blobs``
+maps its SHA-256 to the S3 key holding it and counts the versions pointing
+at it. An upload streams to a fresh ``blobs/<uuid>`` key while it is hashed
+(storage.upload_stream); if that content is already stored, the new object
+is deleted again and the version points at the existing one. A client that
+sends the SHA-256 of a file it has uploaded before skips the transfer
+entirely - the new version is a metadata-only row. (Only the caller's own
+files can be claimed by hash; anything else would let a known hash stand in
+for a file never seen.) Likewise an upload is only reported as deduplicated
+when the caller already had that content, so responses never reveal what
+other users have stored.
+
+``release`` decrements the count when a version is deleted and returns the
+keys whose last reference is gone, to be deleted after the commit. Keys with
+no blob row - files uploaded before this table, direct uploads - belong to
+exactly one version and are always returned. All count changes are single
+conditional statements, so concurrent uploads and deletes of the same
+content cannot lose or double-free a blob.
+"""
+import uuid
+from collections import namedtuple
+
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from research_assistant.extensions import db, get_s3_client
+from research_assistant.storage import default_bucket, upload_stream
+from research_assistant.writing_tool.models import DocumentBlob, DocumentVersion
+
+BLOB_PREFIX = "blobs/"
+# S3 DeleteObjects accepts at most 1000 keys per request.
+DELETE_BATCH_SIZE = 1000
+
+# ``new``: this call uploaded the object and created its row (see ``discard``).
+Blob = namedtuple("Blob", "key sha256 size deduplicated new")
+
+
+def _dialect_insert(table):
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Blob storage needs INSERT ... ON CONFLICT, not available on {dialect}")
+
+
+def _owned(user_id, sha256):
+    """Whether one of the user's stored versions has the content ``sha256``."""
+    return exists().where(
+        DocumentVersion.checksum == sha256,
+        DocumentVersion.uploaded_by_id == user_id,
+        DocumentVersion.upload_status.is_(None),
+    )
+
+
+def claim(user_id, sha256):
+    """Add a reference to the stored file with ``sha256`` if the user has one; returns a Blob or None."""
+    row = db.session.execute(
+        update(DocumentBlob)
+        .where(DocumentBlob.sha256 == sha256, _owned(user_id, sha256))
+        .values(ref_count=DocumentBlob.ref_count + 1)
+        .returning(DocumentBlob.key, DocumentBlob.byte_size)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return Blob(row.key, sha256, row.byte_size, True, False) if row else None
+
+
+def store(user_id, stream, content_type=None):
+    """Upload ``stream`` (or find its content already stored) and add a reference; returns a Blob."""
+    stored = upload_stream(stream, f"{BLOB_PREFIX}{uuid.uuid4().hex}", content_type=content_type)
+    stmt = _dialect_insert(DocumentBlob.__table__).values(
+        sha256=stored.sha256, key=stored.key, byte_size=stored.size, ref_count=1
+    )
+    try:
+        key = db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["sha256"], set_={"ref_count": DocumentBlob.__table__.c.ref_count + 1}
+            ).returning(DocumentBlob.__table__.c.key)
+        ).scalar_one()
+        if key == stored.key:
+            return Blob(key, stored.sha256, stored.size, False, True)
+        deduplicated = db.session.execute(select(_owned(user_id, stored.sha256))).scalar()
+    except BaseException:
+        get_s3_client().delete_object(Bucket=stored.bucket, Key=stored.key)
+        raise
+    get_s3_client().delete_object(Bucket=stored.bucket, Key=stored.key)
+    return Blob(key, stored.sha256, stored.size, deduplicated, False)
+
+
+def discard(blob, bucket=None):
+    """
+    Undo ``store`` after the transaction holding its reference was rolled
+    back: a newly uploaded object has no row any more and is deleted. (The
+    reference count change was rolled back with the transaction.)
+    """
+    if blob is not None and blob.new:
+        delete_objects([blob.key], bucket)
+
+
+def release(keys):
+    """Drop one reference per entry of ``keys``; returns the keys no version uses any more."""
+    unused = []
+    for key in keys:
+        row = db.session.execute(
+            update(DocumentBlob)
+            .where(DocumentBlob.key == key)
+            .values(ref_count=DocumentBlob.ref_count - 1)
+            .returning(DocumentBlob.ref_count)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            unused.append(key)
+        elif row.ref_count <= 0:
+            gone = db.session.execute(
+                delete(DocumentBlob)
+                .where(DocumentBlob.key == key, DocumentBlob.ref_count <= 0)
+                .returning(DocumentBlob.key)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if gone:
+                unused.append(key)
+    return unused
+
+
+def delete_objects(keys, bucket=None):
+    """
+    Delete the S3 objects ``keys`` (call after committing ``release``), up to
+    DELETE_BATCH_SIZE per request; returns the keys S3 failed to delete.
+    """
+    bucket = bucket or default_bucket()
+    client = get_s3_client()
+    keys = list(keys)
+    failed = []
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        response = client.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key} for key in keys[start:start + DELETE_BATCH_SIZE]],
+            "Quiet": True,
+        })
+        failed.extend(error["Key"] for error in response.get("Errors", []))
+    return failed
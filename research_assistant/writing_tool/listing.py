@@ -0,0 +1,105 @@
+"""The caller's cloud documents with their versions, for ``GET /writing_tool/documents``.
+
+A page costs two queries however many documents or versions it holds: one
+keyset range over ``(owner_id, id)`` for the documents, one for the versions
+of exactly those documents (only the current ones, through the
+``(document_id, is_current)`` index, when ``current_only``). Download links,
+when asked for, come from the presigned URL cache in one batch per page.
+"""
+from sqlalchemy import select, update
+
+from research_assistant.extensions import db
+from research_assistant.storage import presigned_urls
+from research_assistant.writing_tool.models import CloudDocument, DocumentVersion
+
+BATCH_SIZE = 1000
+_VERSION_COLUMNS = (
+    DocumentVersion.id, DocumentVersion.document_id, DocumentVersion.major_version,
+    DocumentVersion.minor_version, DocumentVersion.uploaded_at, DocumentVersion.file_size,
+    DocumentVersion.is_current, DocumentVersion.file_url, DocumentVersion.file_key,
+    DocumentVersion.filename,
+)
+
+
+def version_dict(v):
+    return {
+        "version_id": v.id,
+        "version": f"v{v.major_version}.{v.minor_version}",
+        "uploaded_at": v.uploaded_at.isoformat() if v.uploaded_at else None,
+        "file_size": v.file_size,
+        "is_current": v.is_current,
+        "file_url": v.file_url,
+        "filename": v.filename,
+    }
+
+
+def documents_page(user_id, limit, after_id=0, current_only=False, links=False):
+    """([document dicts with "versions"], has_more) for the user's documents with id > ``after_id``."""
+    docs = db.session.execute(
+        select(CloudDocument.id, CloudDocument.title, CloudDocument.created_at)
+        .where(CloudDocument.owner_id == user_id, CloudDocument.id > after_id)
+        .order_by(CloudDocument.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    versions = {}
+    if docs:
+        stmt = (
+            select(*_VERSION_COLUMNS)
+            .where(DocumentVersion.document_id.in_([d.id for d in docs]),
+                   DocumentVersion.upload_status.is_(None))
+            .order_by(DocumentVersion.document_id, DocumentVersion.uploaded_at.desc(), DocumentVersion.id.desc())
+        )
+        if current_only:
+            stmt = stmt.where(DocumentVersion.is_current.is_(True))
+        rows = db.session.execute(stmt).all()
+        urls = presigned_urls.get_many([(v.file_key, v.filename) for v in rows]) if links else ()
+        for i, v in enumerate(rows):
+            entry = version_dict(v)
+            if links:
+                entry["download_url"] = urls[i]
+            versions.setdefault(v.document_id, []).append(entry)
+    return [
+        {
+            "document_id": d.id,
+            "title": d.title,
+            "created_at": d.created_at.isoformat() if d.created_at else None,
+            "versions": versions.get(d.id, []),
+        }
+        for d in docs
+    ], has_more
+
+
+def all_documents(user_id, current_only=False, links=False, batch_size=BATCH_SIZE):
+    """Every document of the user, fetched ``batch_size`` documents at a time."""
+    result, after_id = [], 0
+    while True:
+        items, has_more = documents_page(user_id, batch_size, after_id, current_only, links)
+        result.extend(items)
+        if not has_more:
+            return result
+        after_id = items[-1]["document_id"]
+
+
+def backfill_owners():
+    """
+    Set ``owner_id`` of documents created before the column existed to the
+    uploader of their first version; returns the number of documents updated.
+    """
+    first_uploader = (
+        select(DocumentVersion.uploaded_by_id)
+        .where(DocumentVersion.document_id == CloudDocument.id)
+        .order_by(DocumentVersion.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        update(CloudDocument)
+        .where(CloudDocument.owner_id.is_(None))
+        .values(owner_id=first_uploader)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
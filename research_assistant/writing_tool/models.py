@@ -1,19 +1,28 @@
 from research_assistant.database import PkModel
 from datetime import datetime, timezone
-from research_assistant.user.models import User
+from research_assistant.user.models import User  # noqa: F401 (registers the users table for the foreign keys)
 from research_assistant.extensions import db
 
 class CloudDocument(PkModel):
     __tablename__ = 'cloud_documents'
+    __table_args__ = (
+        # The caller's documents in id order (listing keyset).
+        db.Index("ix_cloud_documents_owner_id", "owner_id", "id"),
+    )
 
     title = db.Column(db.String, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
 
     def __repr__(self):
         return f"<Document({self.id}, {self.title})>"
 
 class DocumentVersion(PkModel):
     __tablename__ = 'document_versions'
+    __table_args__ = (
+        db.Index("ix_document_versions_document_current", "document_id", "is_current"),
+        db.Index("ix_document_versions_checksum", "checksum"),
+    )
 
     document_id = db.Column(db.Integer, db.ForeignKey('cloud_documents.id'), nullable=False)
 
@@ -26,6 +35,10 @@ class DocumentVersion(PkModel):
 
     uploaded_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     file_size = db.Column(db.Float)
+    checksum = db.Column(db.String(64))  # SHA-256 hex, computed while uploading
+    byte_size = db.Column(db.BigInteger)
+    filename = db.Column(db.String(255))
+    upload_status = db.Column(db.String(16))  # "pending" until a direct upload is completed
     uploaded_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     is_current = db.Column(db.Boolean, default=True)
@@ -35,3 +48,16 @@ class DocumentVersion(PkModel):
 
     def __repr__(self):
         return f"<DocumentVersion({self.document_id}, v{self.major_version}.{self.minor_version}, {self.file_key})>"
+
+class DocumentBlob(db.Model):
+    """A stored file shared by every version with the same content (see writing_tool.blobs)."""
+    __tablename__ = 'document_blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    key = db.Column(db.String, nullable=False, unique=True)
+    byte_size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<DocumentBlob({self.sha256[:12]}, {self.key}, refs={self.ref_count})>"
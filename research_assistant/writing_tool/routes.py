@@ -1,137 +1,293 @@
 # writing_tool/routes.py
 
-from flask import Blueprint, jsonify, request
+from botocore.exceptions import BotoCoreError, ClientError
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
+from werkzeug.utils import secure_filename
 
-from research_assistant.extensions import db, get_s3_client
+from research_assistant.extensions import db
+from research_assistant.pagination import CursorError, decode_cursor, encode_cursor
 from research_assistant.user.models import User
-from research_assistant.utils import upload_file_to_s3
+from research_assistant.storage import presigned_upload, presigned_urls, stat_object
+from research_assistant.writing_tool.blobs import claim, delete_objects, discard, release, store
+from research_assistant.writing_tool.listing import all_documents, documents_page
 from research_assistant.writing_tool.models import CloudDocument as Document
 from research_assistant.writing_tool.models import DocumentVersion
+from research_assistant.writing_tool.versions import UPLOAD_PENDING, check_upload, make_current, next_version
 
 writing_tool_bp = Blueprint("writing_tool", __name__, url_prefix="/writing_tool")
 
+MAX_PAGE_SIZE = 1000
+
 @writing_tool_bp.route("/documents", methods=["POST"])
 @jwt_required()
 def create_document():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
 
-    title = request.form.get("title")
-    file = request.files.get("file")
+    incoming = _incoming_file()
+    title = request.form.get("title") or request.args.get("title")
 
-    if not title or not file:
+    if not title or not incoming:
         return jsonify({"code": 1, "msg": "Missing title or file"}), 400
 
-    document = Document(title=title)
+    document = Document(title=title, owner_id=user.id)
     db.session.add(document)
-    db.session.flush()
-
-    file_key = f"documents/{document.id}_v1.0_{file.filename}"
-
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
-    file_size = round(size / (1024 * 1024), 2)
-
-    file_url = upload_file_to_s3(file, file_key)
-
-    version = DocumentVersion(
-        document_id=document.id,
-        major_version=1,
-        minor_version=0,
-        file_key=file_key,
-        file_url=file_url,
-        uploaded_by_id=user.id,
-        file_size=file_size,
-        is_current=True
-    )
-
-    db.session.add(version)
-    db.session.commit()
-
-    return jsonify({"code": 0, "msg": "Document created", "document_id": document.id})
+    deduplicated, error = _save_version(document, 1, 0, user.id, incoming)
+    if error:
+        return error
 
+    return jsonify({"code": 0, "msg": "Document created", "document_id": document.id, "deduplicated": deduplicated})
 
 
 @writing_tool_bp.route("/documents", methods=["GET"])
 @jwt_required()
 def list_documents_with_all_versions():
-    """Get all documents including all versions info."""
-    documents = Document.query.all()
-    result = []
-    for doc in documents:
-        version_list = []
-        for v in DocumentVersion.query.filter_by(document_id=doc.id).order_by(DocumentVersion.uploaded_at.desc()).all():
-            version_list.append({
-                "version_id": v.id,
-                "version": f"v{v.major_version}.{v.minor_version}",
-                "uploaded_at": v.uploaded_at.isoformat(),
-                "file_size": v.file_size,
-                "is_current": v.is_current,
-                "file_url": v.file_url
-            })
-        result.append({
-            "document_id": doc.id,
-            "title": doc.title,
-            "created_at": doc.created_at.isoformat() if hasattr(doc, 'created_at') else None,
-            "versions": version_list
-        })
-    return jsonify({"code": 0, "data": result})
+    """
+    Get the caller's documents including their versions.
+
+    Query params:
+      current_only  1 to include only the current version of each document
+      links         1 to add a presigned "download_url" to every version
+      limit / cursor
+                    keyset pagination over documents (by id); the response
+                    then also carries "next_cursor"
+    """
+    user_id = int(get_jwt_identity())
+    current_only = str(request.args.get("current_only", "")).lower() in {"1", "true", "yes"}
+    links = str(request.args.get("links", "")).lower() in {"1", "true", "yes"}
+
+    cursor = request.args.get("cursor")
+    if cursor is None and "limit" not in request.args:
+        return jsonify({"code": 0, "data": all_documents(user_id, current_only, links)})
+
+    limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), MAX_PAGE_SIZE)
+    after_id = 0
+    if cursor:
+        try:
+            _, after_id = decode_cursor(cursor, "id", False)
+            after_id = int(after_id)
+        except (CursorError, TypeError, ValueError):
+            return jsonify({"code": 1, "msg": "Invalid cursor"}), 400
 
+    items, has_more = documents_page(user_id, limit, after_id, current_only, links)
+    last_id = items[-1]["document_id"] if items else None
+    next_cursor = encode_cursor("id", False, last_id, last_id) if has_more else None
+    return jsonify({"code": 0, "data": items, "next_cursor": next_cursor})
 
 
 @writing_tool_bp.route("/documents/<string:document_id>/versions", methods=["POST"])
 @jwt_required()
 def upload_new_version(document_id):
-    user_id = get_jwt_identity()
-    file = request.files.get("file")
+    user_id = int(get_jwt_identity())
+    incoming = _incoming_file()
 
-    if not file:
+    if not incoming:
         return jsonify({"code": 1, "msg": "Missing file"}), 400
 
     document = Document.query.get_or_404(document_id)
+    if document.owner_id != user_id:
+        return jsonify({"code": 1, "msg": "Unauthorized access"}), 403
 
-    latest = DocumentVersion.query.filter_by(document_id=document_id)\
-        .order_by(DocumentVersion.major_version.desc(), DocumentVersion.minor_version.desc())\
-        .first()
+    major, minor = next_version(document.id)
+    new_version_str = f"v{major}.{minor}"
 
-    if latest:
-        major = latest.major_version
-        minor = latest.minor_version + 1
-        if minor >= 10:
-            major += 1
-            minor = 0
-        latest.is_current = False
-    else:
-        major, minor = 1, 0
+    deduplicated, error = _save_version(document, major, minor, user_id, incoming)
+    if error:
+        return error
+
+    return jsonify({"code": 0, "msg": "New version uploaded", "version": new_version_str, "deduplicated": deduplicated})
 
-    new_version_str = f"v{major}.{minor}"
-    file_key = f"documents/{document.id}_{new_version_str}_{file.filename}"
 
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
-    file_size = round(size / (1024 * 1024), 2)
+@writing_tool_bp.route("/documents/<int:document_id>/versions/upload-url", methods=["POST"])
+@jwt_required()
+def create_upload_url(document_id):
+    """
+    Start a direct upload of a new version: {"filename", "size", "content_type"?, "sha256"?}.
+
+    Returns the pending version and a presigned POST ({"url", "fields"}) to
+    send the file to; finish with .../versions/<version_id>/complete. When
+    "sha256" names a file the user already stored, the version is created
+    right away instead ("deduplicated": true, no "upload").
+    """
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get("filename") or "")
+    size = data.get("size")
+    max_bytes = current_app.config.get("STORAGE_MAX_UPLOAD_BYTES", 512 * 1024 * 1024)
 
-    file_url = upload_file_to_s3(file, file_key)
+    if not filename:
+        return jsonify({"code": 1, "msg": "Missing filename"}), 400
+    if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= max_bytes:
+        return jsonify({"code": 1, "msg": f"size must be between 1 and {max_bytes} bytes"}), 400
 
+    document = Document.query.get_or_404(document_id)
+    if document.owner_id != user_id:
+        return jsonify({"code": 1, "msg": "Unauthorized access"}), 403
+
+    major, minor = next_version(document.id)
+    sha256 = _content_hash(data.get("sha256"))
+    blob = claim(user_id, sha256) if sha256 else None
+    if blob:
+        version = DocumentVersion(
+            document_id=document.id,
+            major_version=major,
+            minor_version=minor,
+            file_key=blob.key,
+            file_url=blob.key,
+            uploaded_by_id=user_id,
+            file_size=round(blob.size / (1024 * 1024), 2),
+            byte_size=blob.size,
+            checksum=blob.sha256,
+            filename=filename
+        )
+        db.session.add(version)
+        db.session.flush()
+        make_current(version)
+        db.session.commit()
+        return jsonify({"code": 0, "version_id": version.id, "version": f"v{major}.{minor}", "deduplicated": True})
+
+    file_key = f"documents/{document.id}_v{major}.{minor}_{filename}"
     version = DocumentVersion(
         document_id=document.id,
         major_version=major,
         minor_version=minor,
         file_key=file_key,
-        file_url=file_url,
+        file_url=file_key,
         uploaded_by_id=user_id,
-        file_size=file_size,
-        is_current=True
+        file_size=round(size / (1024 * 1024), 2),
+        byte_size=size,
+        filename=filename,
+        is_current=False,
+        upload_status=UPLOAD_PENDING
     )
+    expires_in = current_app.config.get("STORAGE_UPLOAD_URL_EXPIRY", 900)
+    try:
+        upload = presigned_upload(file_key, size, data.get("content_type"), expires_in)
+    except (BotoCoreError, ClientError) as e:
+        return jsonify({"code": 1, "msg": f"Failed to generate upload link: {str(e)}"}), 500
 
     db.session.add(version)
     db.session.commit()
+    return jsonify({
+        "code": 0,
+        "version_id": version.id,
+        "version": f"v{major}.{minor}",
+        "upload": upload,
+        "expires_in": expires_in,
+    })
 
-    return jsonify({"code": 0, "msg": "New version uploaded", "version": new_version_str})
 
+@writing_tool_bp.route("/documents/<int:document_id>/versions/<int:version_id>/complete", methods=["POST"])
+@jwt_required()
+def complete_upload(document_id, version_id):
+    """Verify a direct upload ({"etag"?}: the ETag S3 returned) and make it the current version."""
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+
+    version = DocumentVersion.query.filter_by(id=version_id, document_id=document_id).first_or_404()
+    if version.uploaded_by_id != user_id:
+        return jsonify({"code": 1, "msg": "Unauthorized access"}), 403
+    if version.upload_status != UPLOAD_PENDING:
+        return jsonify({"code": 0, "msg": "Upload already completed", "version_id": version.id})
+
+    try:
+        problem = check_upload(version, stat_object(version.file_key), data.get("etag"))
+    except (BotoCoreError, ClientError) as e:
+        return jsonify({"code": 1, "msg": f"Failed to check uploaded file: {str(e)}"}), 500
+    if problem:
+        return jsonify({"code": 1, "msg": problem}), 409
+
+    make_current(version)
+    db.session.commit()
+    return jsonify({
+        "code": 0,
+        "msg": "New version uploaded",
+        "version_id": version.id,
+        "version": f"v{version.major_version}.{version.minor_version}",
+    })
+
+
+def _incoming_file():
+    """
+    (filename, stream, content type) of the uploaded file, or None.
+
+    Either the multipart form field "file", or the raw request body with the
+    name in ?filename= - the body then streams to storage without werkzeug
+    spooling it first.
+    """
+    if request.mimetype == "multipart/form-data":
+        file = request.files.get("file")
+        if not file or not file.filename:
+            return None
+        return file.filename, file.stream, file.mimetype
+    filename = request.args.get("filename")
+    if not filename:
+        return None
+    return filename, request.stream, request.mimetype or None
+
+
+def _content_hash(value):
+    """A client-supplied SHA-256 hex digest, or None if ``value`` is not one."""
+    value = (value or "").strip().lower()
+    return value if len(value) == 64 and all(c in "0123456789abcdef" for c in value) else None
+
+
+def _store_version(document, major, minor, user_id, incoming):
+    """
+    Store the upload as a content-addressed blob and return the (unsaved)
+    current DocumentVersion for it. A "sha256" form field or query arg naming
+    a file the user already stored skips reading the upload.
+    """
+    filename, stream, content_type = incoming
+    sha256 = _content_hash(request.form.get("sha256") or request.args.get("sha256"))
+    blob = (claim(user_id, sha256) if sha256 else None) or store(user_id, stream, content_type)
+    return DocumentVersion(
+        document_id=document.id,
+        major_version=major,
+        minor_version=minor,
+        file_key=blob.key,
+        file_url=blob.key,
+        uploaded_by_id=user_id,
+        file_size=round(blob.size / (1024 * 1024), 2),
+        byte_size=blob.size,
+        checksum=blob.sha256,
+        filename=secure_filename(filename) or None,
+        is_current=True
+    ), blob
+
+
+def _save_version(document, major, minor, user_id, incoming):
+    """
+    Store the upload as the document's new current version and commit;
+    returns (deduplicated, error response). Any failure rolls the whole
+    transaction back and deletes a file uploaded for it, so no stored file
+    is left without a version.
+    """
+    blob = None
+    try:
+        db.session.flush()
+        version, blob = _store_version(document, major, minor, user_id, incoming)
+        db.session.add(version)
+        db.session.flush()
+        make_current(version)
+        db.session.commit()
+    except (BotoCoreError, ClientError) as e:
+        _abandon(blob)
+        return None, (jsonify({"code": 1, "msg": f"Failed to upload file: {str(e)}"}), 500)
+    except Exception as e:
+        _abandon(blob)
+        current_app.logger.exception("Failed to save a version of document %s", document.id)
+        return None, (jsonify({"code": 1, "msg": f"Failed to save version: {str(e)}"}), 500)
+    return blob.deduplicated, None
+
+
+def _abandon(blob):
+    db.session.rollback()
+    try:
+        discard(blob)
+    except (BotoCoreError, ClientError) as e:
+        current_app.logger.warning("Failed to delete abandoned upload %s: %s", blob.key, e)
 
 
 @writing_tool_bp.route("/documents/<string:document_id>/versions/<string:version_id>/download", methods=["GET"])
@@ -155,12 +311,8 @@ def download_version(document_id, version_id):
         return jsonify({"code": 1, "msg": "Unauthorized access"}), 403
 
     try:
-        s3_client = get_s3_client()
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': '9900-files', 'Key': version.file_key},
-            ExpiresIn=3600
-        )
+        # Content-addressed keys carry no file name, so the link sets it.
+        presigned_url = presigned_urls.get(version.file_key, version.filename)
     except Exception as e:
         return jsonify({"code": 1, "msg": f"Failed to generate download link: {str(e)}"}), 500
 
@@ -176,19 +328,20 @@ def delete_version(document_id, version_id):
     except Exception:
         return jsonify({"code": 1, "msg": "Invalid version_id format"}), 400
 
+    document = Document.query.get_or_404(document_id)
+    if document.owner_id != int(get_jwt_identity()):
+        return jsonify({"code": 1, "msg": "Unauthorized access"}), 403
+
     version = DocumentVersion.query.filter_by(
-        document_id=document_id,
+        document_id=document.id,
         major_version=major,
         minor_version=minor
     ).first_or_404()
-    s3_client = get_s3_client()
-    try:
-        s3_client.delete_object(Bucket="9900-files", Key=version.file_key)
-    except Exception as e:
-        return jsonify({"code": 1, "msg": f"Failed to delete file from S3: {str(e)}"}), 500
 
+    unused = release([version.file_key])
     db.session.delete(version)
     db.session.commit()
+    _delete_files(unused)
 
     return jsonify({"code": 0, "msg": "Version and file deleted"})
 
@@ -198,15 +351,25 @@ def delete_version(document_id, version_id):
 def delete_document(document_id):
     """Delete an entire document, all its versions, and all related files in S3."""
     document = Document.query.get_or_404(document_id)
-    s3_client = get_s3_client()
+    if document.owner_id != int(get_jwt_identity()):
+        return jsonify({"code": 1, "msg": "Unauthorized access"}), 403
+    unused = release([version.file_key for version in document.versions])
     for version in document.versions:
-        try:
-            s3_client.delete_object(Bucket="9900-files", Key=version.file_key)
-        except Exception as e:
-            return jsonify({"code": 1, "msg": f"Failed to delete file {version.file_key} from S3: {str(e)}"}), 500
         db.session.delete(version)
 
     db.session.delete(document)
     db.session.commit()
+    _delete_files(unused)
+
+    return jsonify({"code": 0, "msg": "Document and all files deleted"})
 
-    return jsonify({"code": 0, "msg": "Document and all files deleted"}) 
\ No newline at end of file
+
+def _delete_files(keys):
+    """Delete files no version references any more; a failure only leaves an orphaned object."""
+    try:
+        failed = delete_objects(keys)
+    except (BotoCoreError, ClientError) as e:
+        current_app.logger.warning("Failed to delete unreferenced files %s: %s", keys, e)
+        return
+    if failed:
+        current_app.logger.warning("Failed to delete unreferenced files %s", failed)
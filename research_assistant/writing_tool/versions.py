@@ -0,0 +1,78 @@
+"""Version numbering, the current-version switch and direct-to-S3 uploads.
+
+Direct uploads take two requests and never pass file bytes through a
+worker:
+
+  upload-url  allocates the next version number as a *pending* row
+              (``upload_status = "pending"``, not current, hidden from
+              listings) and returns a presigned POST for its key
+  complete    checks the object S3 now holds - it must exist, have the
+              declared size and, when the client sends one, the ETag S3
+              returned to it - then makes the version current
+
+Pending rows that are never completed are removed by
+``flask purge-pending-uploads``.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select, update
+
+from research_assistant.extensions import db
+from research_assistant.writing_tool.models import DocumentVersion
+
+UPLOAD_PENDING = "pending"
+
+
+def next_version(document_id):
+    """(major, minor) following the document's latest version; minor rolls over at 10."""
+    latest = DocumentVersion.query.filter_by(document_id=document_id)\
+        .order_by(DocumentVersion.major_version.desc(), DocumentVersion.minor_version.desc())\
+        .first()
+    if not latest:
+        return 1, 0
+    major, minor = latest.major_version, latest.minor_version + 1
+    if minor >= 10:
+        major, minor = major + 1, 0
+    return major, minor
+
+
+def make_current(version):
+    """Mark ``version`` (flushed) as the document's only current version."""
+    db.session.execute(
+        update(DocumentVersion)
+        .where(DocumentVersion.document_id == version.document_id,
+               DocumentVersion.id != version.id,
+               DocumentVersion.is_current.is_(True))
+        .values(is_current=False)
+        .execution_options(synchronize_session=False)
+    )
+    version.is_current = True
+    version.upload_status = None
+
+
+def check_upload(version, stat, etag=None):
+    """Why the uploaded object ``stat`` ((size, etag) or None) does not match ``version``; None if it does."""
+    if stat is None:
+        return "File has not been uploaded"
+    size, stored_etag = stat
+    if version.byte_size is not None and size != version.byte_size:
+        return f"Uploaded file is {size} bytes, expected {version.byte_size}"
+    if etag and etag.strip('"') != stored_etag:
+        return "Uploaded file does not match the given ETag"
+    return None
+
+
+def purge_pending(older_than):
+    """Delete pending versions allocated more than ``older_than`` (a timedelta) ago; returns their keys."""
+    cutoff = datetime.now(timezone.utc) - older_than
+    stale = db.session.execute(
+        select(DocumentVersion.id, DocumentVersion.file_key)
+        .where(DocumentVersion.upload_status == UPLOAD_PENDING, DocumentVersion.uploaded_at < cutoff)
+    ).all()
+    if stale:
+        db.session.execute(
+            delete(DocumentVersion).where(DocumentVersion.id.in_([row.id for row in stale]))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    return [row.file_key for row in stale]
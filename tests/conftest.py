@@ -2,15 +2,18 @@
 """Defines fixtures available to all tests."""
 
 import logging
+import os
 
-# tests/conftest.py
+# create_app() prefers DATABASE_URL over the settings module; never let the
+# suite reach a real database (it drops every table afterwards).
+os.environ["DATABASE_URL"] = "sqlite://"
 
-# -*- coding: utf-8 -*-
-import pytest
-from webtest import TestApp
+import pytest  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from webtest import TestApp  # noqa: E402
 
-from research_assistant.app import create_app
-from research_assistant.database import db as _db
+from research_assistant.app import create_app  # noqa: E402
+from research_assistant.database import db as _db  # noqa: E402
 
 
 @pytest.fixture
@@ -18,54 +21,20 @@ def app():
     """Create application for the tests."""
     _app = create_app("tests.settings")
     _app.logger.setLevel(logging.CRITICAL)
-    ctx = _app.test_request_context()
-    ctx.push()
-
-    yield _app
-
-    ctx.pop()
-
-
-@pytest.fixture
-def testapp(app):
-    """Create Webtest app."""
-    return TestApp(app)
 
-
-@pytest.fixture
-def db(app):
-    """Create database for the tests."""
-    _db.app = app
-    with app.app_context():
+    with _app.app_context():
         _db.create_all()
-
-    yield _db
-
-    # Explicitly close DB connection
-    _db.session.close()
-    _db.drop_all()
-
-
-@pytest.fixture
-def app():
-    app = create_app()
-    app.config.update({
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False,
-        "DEBUG_TB_ENABLED": False,
-    })
-
-    with app.app_context():
-        _db.create_all()
-        yield app
+        yield _app
         _db.session.remove()
         _db.drop_all()
 
+
 @pytest.fixture
 def db(app):
+    """Database of the test app, created empty for each test."""
     return _db
 
+
 @pytest.fixture
 def client(app):
     """提供 Flask test client。"""
@@ -74,6 +43,15 @@ def client(app):
 
 @pytest.fixture
 def testapp(app):
-    import logging
-    app.logger.setLevel(logging.ERROR)
+    """Create Webtest app."""
     return TestApp(app)
+
+
+@pytest.fixture
+def auth(app):
+    """Authorization headers for a user id: ``auth(1)``."""
+
+    def headers(user_id=1):
+        return {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+    return headers
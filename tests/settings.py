@@ -11,3 +11,8 @@ DEBUG_TB_ENABLED = False
 CACHE_TYPE = "flask_caching.backends.SimpleCache"  # Can be "memcached", "redis", etc.
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 WTF_CSRF_ENABLED = False  # Allows form testing
+JWT_SECRET_KEY = "not-so-secret-jwt-signing-key-for-tests"
+AWS_ACCESS_KEY_ID = "testing"
+AWS_SECRET_ACCESS_KEY = "testing"
+AWS_S3_BUCKET_NAME = "test-bucket"
+AWS_S3_REGION = "us-east-1"
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Set-based reference batches only ever touch the caller's references."""
+from research_assistant.reference.batch import delete_references, update_references
+from research_assistant.reference.models import Reference
+
+
+def _library(db):
+    refs = [
+        Reference(user_id=user_id, title=f"U{user_id} R{i}", authors="Doe, J.", year=str(2000 + i))
+        for user_id in (1, 2) for i in range(3)
+    ]
+    db.session.add_all(refs)
+    db.session.commit()
+    return [r.id for r in refs[:3]], [r.id for r in refs[3:]]
+
+
+def _titles(user_id):
+    return sorted(r.title for r in Reference.query.filter_by(user_id=user_id))
+
+
+def test_foreign_ids_reject_the_whole_batch(client, auth, db):
+    mine, theirs = _library(db)
+    response = client.post("/references/batch/update",
+                           json={"ids": mine + theirs[:1], "set": {"title": "Hijacked"}}, headers=auth(1))
+    assert response.status_code == 404
+    assert response.get_json()["ids"] == theirs[:1]
+    response = client.post("/references/batch/delete", json={"ids": theirs}, headers=auth(1))
+    assert response.status_code == 404
+    assert "Hijacked" not in _titles(1)
+    assert len(_titles(2)) == 3
+
+
+def test_filters_are_scoped_to_the_caller(client, auth, db):
+    mine, theirs = _library(db)
+    response = client.post("/references/batch/complete", json={"filter": {"all": True}}, headers=auth(1))
+    assert response.get_json()["matched"] == 3
+    assert Reference.query.filter_by(user_id=2, completed=True).count() == 0
+
+    response = client.post("/references/batch/delete", json={"filter": {"year_from": "2001"}}, headers=auth(2))
+    assert response.get_json() == {"matched": 2, "deleted": 2}
+    assert len(_titles(1)) == 3
+    assert _titles(2) == ["U2 R0"]
+
+
+def test_statements_check_ownership_themselves(db):
+    mine, theirs = _library(db)
+    # Even with ids that skipped select_targets, other users' rows are untouched.
+    assert update_references(1, theirs, {"title": "Hijacked"}) == 0
+    assert delete_references(1, theirs) == 0
+    db.session.commit()
+    assert _titles(2) == ["U2 R0", "U2 R1", "U2 R2"]
+
+
+def test_invalid_batches(client, auth, db):
+    mine, _ = _library(db)
+    bodies = [
+        {"ids": mine, "filter": {"all": True}, "set": {"title": "x"}},
+        {"filter": {}, "set": {"title": "x"}},
+        {"filter": {"colour": "red"}, "set": {"title": "x"}},
+        {"ids": mine, "set": {"user_id": 2}},
+        {"ids": mine, "set": {"title": ""}},
+    ]
+    for body in bodies:
+        assert client.post("/references/batch/update", json=body, headers=auth(1)).status_code == 400
+    assert Reference.query.filter_by(user_id=1).count() == 3
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Streaming BibTeX scanner, parser and chunked import."""
+import io
+
+import pytest
+
+from research_assistant.reference import bib_import
+from research_assistant.reference.bib_import import import_bib_stream, iter_bib_blocks, parse_block
+from research_assistant.reference.models import Reference
+
+
+def _article(key, title, year="2020", authors="Doe, Jane and Roe, Rick"):
+    return f"@article{{{key},\n  title = {{{title}}},\n  author = {{{authors}}},\n  year = {year}\n}}\n"
+
+
+def _blocks(text, read_size=None, monkeypatch=None):
+    if read_size is not None:
+        monkeypatch.setattr(bib_import, "_READ_SIZE", read_size)
+    return list(iter_bib_blocks(io.BytesIO(text.encode("utf-8"))))
+
+
+def test_nested_braces_and_quoted_values():
+    raw = '@article{k1, title = {A {Nested {Deep}} Title}, note = "Quoted {with \\"} braces", year = 2021}'
+    ((block_type, block),) = _blocks(raw)
+    entry = parse_block(block_type, block, {})
+    assert entry["ENTRYTYPE"] == "article"
+    assert entry["ID"] == "k1"
+    assert entry["title"] == "A {Nested {Deep}} Title"
+    assert entry["note"] == 'Quoted {with \\"} braces'
+    assert entry["year"] == "2021"
+
+
+def test_parenthesized_block_and_stray_at():
+    text = "contact me@example.org\n@Article(k2, title = {Parens (inside)}, year = 1999)\n"
+    ((block_type, block),) = _blocks(text)
+    assert block_type == "article"
+    assert parse_block(block_type, block, {})["title"] == "Parens (inside)"
+
+
+def test_string_macros_comment_and_preamble(db):
+    text = (
+        "@comment{ not an entry @article{fake, title={No}} }\n"
+        '@preamble{ "\\newcommand{\\noop}[1]{}" }\n'
+        '@string{ jml = "Journal of ML" }\n'
+        "@article{k3, title = {Macros}, author = {Doe, Jane}, year = 2020,\n"
+        '  journal = jml # " Letters", month = jan}\n'
+    )
+    types = [block_type for block_type, _ in _blocks(text)]
+    assert types == ["comment", "preamble", "string", "article"]
+
+    macros = dict(bib_import.COMMON_STRINGS)
+    blocks = _blocks(text)
+    bib_import._add_string_macro(blocks[2][1], macros)
+    entry = parse_block("article", blocks[3][1], macros)
+    assert entry["journal"] == "Journal of ML Letters"
+    assert entry["month"] == "January"
+
+    report = import_bib_stream(io.BytesIO(text.encode()), user_id=1)
+    assert report["count"] == 1
+    assert report["skipped"] == []
+    assert Reference.query.one().title == "Macros"
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 7, 64])
+def test_blocks_split_across_reads(read_size, monkeypatch):
+    text = "% header\n" + "".join(_article(f"k{i}", f"Title {{{i}}}") for i in range(5)) + "@misc{m, note = {x}}"
+    whole = _blocks(text)
+    assert len(whole) == 6
+    assert _blocks(text, read_size, monkeypatch) == whole
+
+
+def test_utf8_character_split_across_reads(monkeypatch):
+    text = _article("u", "Über Ärger")
+    (block,) = _blocks(text, 5, monkeypatch)
+    assert "Über Ärger" in block[1]
+
+
+def test_unclosed_entry_is_cut_at_next_entry(db):
+    text = "@article{bad, title = {Never closed,\n" + _article("good", "Fine")
+    blocks = _blocks(text)
+    assert [b[1].split(",")[0] for b in blocks] == ["@article{bad", "@article{good"]
+
+    report = import_bib_stream(io.BytesIO(text.encode()), user_id=1)
+    assert report["count"] == 1
+    assert report["skipped"] == [{"key": "bad", "reason": "parse error"}]
+    assert Reference.query.one().title == "Fine"
+
+
+def test_truncated_file_reports_last_entry(db):
+    text = _article("ok", "Complete") + "@article{cut, title = {Trunc"
+    report = import_bib_stream(io.BytesIO(text.encode()), user_id=1)
+    assert report["count"] == 1
+    assert report["skipped"] == [{"key": "cut", "reason": "parse error"}]
+
+
+def test_malformed_field_is_skipped(db):
+    text = "@article{broken, title {no equals}}\n" + _article("ok", "Fine")
+    report = import_bib_stream(io.BytesIO(text.encode()), user_id=1)
+    assert report["count"] == 1
+    assert report["skipped"][0]["key"] == "broken"
+
+
+def test_chunked_insert_counts(db):
+    text = "".join(_article(f"k{i}", f"Distinct title {i}") for i in range(5))
+    text += "@book{b1, title = {A book}, author = {Doe, J.}, year = 2001}\n"
+    text += "@article{noyear, title = {No year}, author = {Doe, J.}}\n"
+    seen = []
+    report = import_bib_stream(
+        io.BytesIO(text.encode()), user_id=7, chunk_size=3, on_chunk=lambda r: seen.append(r["count"])
+    )
+
+    assert [c["parsed"] for c in report["chunks"]] == [3, 3, 1]
+    assert [c["inserted"] for c in report["chunks"]] == [3, 2, 0]
+    assert seen == [3, 5, 5]
+    assert report["count"] == 5
+    assert report["parsed"] == 7
+    assert report["skipped_count"] == 2
+    assert {s["key"]: s["reason"] for s in report["skipped"]} == {
+        "b1": "unsupported entry type",
+        "noyear": "missing year",
+    }
+    assert Reference.query.filter_by(user_id=7).count() == 5
+    assert Reference.query.filter_by(user_id=7, title="Distinct title 0").one().authors
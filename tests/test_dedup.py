@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Duplicate detection keys and policies."""
+import io
+
+from research_assistant.reference.bib_import import import_bib_stream
+from research_assistant.reference.dedup import doi_key, resolve_duplicates, title_fingerprint, with_keys
+from research_assistant.reference.models import Reference
+
+
+def _add(client, auth, user_id=1, **fields):
+    body = {"title": "Deep Learning", "authors": "Doe, J.", "year": "2020", **fields}
+    return client.post("/references/", json=body, headers=auth(user_id))
+
+
+def test_keys_ignore_formatting():
+    assert doi_key("https://doi.org/10.1000/ABC") == doi_key("doi: 10.1000/abc") == "10.1000/abc"
+    assert doi_key("  ") is None
+    assert title_fingerprint("Über-Deep  Learning!", "2020") == title_fingerprint("uber deep learning", "2020a")
+    assert title_fingerprint("Deep Learning", "2020") != title_fingerprint("Deep Learning", "2021")
+    assert title_fingerprint("?!", "2020") is None
+
+
+def test_add_reference_duplicate_policies(client, auth, db):
+    first = _add(client, auth, doi="10.1/x")
+    assert first.status_code == 201
+    ref_id = first.get_json()["id"]
+
+    skipped = _add(client, auth, title="deep learning.")
+    assert skipped.status_code == 409
+    assert skipped.get_json()["duplicate_of"] == ref_id
+
+    updated = _add(client, auth, title="Other title", doi="https://doi.org/10.1/X",
+                   source="conference", on_duplicate="update")
+    assert updated.status_code == 200
+    assert updated.get_json()["id"] == ref_id
+    assert db.session.get(Reference, ref_id).source == "conference"
+
+    assert _add(client, auth, title="Other title", on_duplicate="keep").status_code == 201
+    assert _add(client, auth, on_duplicate="bogus").status_code == 400
+
+
+def test_duplicates_are_per_user_and_distinct_dois_differ(client, auth, db):
+    assert _add(client, auth, doi="10.1/preprint").status_code == 201
+    # Same title and year, but two different DOIs: two different works.
+    assert _add(client, auth, doi="10.1/published").status_code == 201
+    # Another user's library is never consulted.
+    assert _add(client, auth, user_id=2, doi="10.1/preprint").status_code == 201
+    assert Reference.query.count() == 3
+
+
+def test_rows_repeated_within_a_chunk_collapse(db):
+    rows = [with_keys({"title": t, "year": "2020", "doi": d, "authors": "A"})
+            for t, d in [("Same", None), ("same!", None), ("Else", "10.1/e"), ("Renamed", "10.1/E")]]
+    to_insert, to_update, duplicates = resolve_duplicates(1, rows, "update")
+    assert [r["title"] for r in to_insert] == ["same!", "Renamed"]
+    assert to_update == []
+    assert duplicates == 2
+    assert resolve_duplicates(1, rows, "keep") == (rows, [], 0)
+
+
+def test_bib_import_updates_existing_reference(client, auth, db):
+    ref_id = _add(client, auth, doi="10.1/x").get_json()["id"]
+    text = "@article{k, title = {Deep learning}, author = {Doe, J.}, year = 2020, doi = {10.1/X}}\n"
+
+    report = import_bib_stream(io.BytesIO(text.encode()), 1, on_duplicate="skip")
+    assert (report["count"], report["duplicates"], report["updated"]) == (0, 1, 0)
+
+    text = text.replace("Deep learning", "Deep Learning, Revised")
+    report = import_bib_stream(io.BytesIO(text.encode()), 1, on_duplicate="update")
+    assert (report["count"], report["duplicates"], report["updated"]) == (0, 1, 1)
+    ref = db.session.get(Reference, ref_id)
+    db.session.refresh(ref)
+    assert ref.title == "Deep Learning, Revised"
+    assert ref.fingerprint == title_fingerprint("Deep Learning, Revised", "2020")
+    assert Reference.query.count() == 1
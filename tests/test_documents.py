@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed, reference-counted storage of document versions."""
+import hashlib
+import io
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from research_assistant.commands import purge_pending_uploads
+from research_assistant.user.models import User
+from research_assistant.writing_tool import blobs, routes
+from research_assistant.writing_tool.models import CloudDocument, DocumentBlob, DocumentVersion
+from research_assistant.writing_tool.versions import UPLOAD_PENDING
+
+DATA = b"the same docx bytes"
+
+
+@pytest.fixture
+def s3(app, db):
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=app.config["AWS_S3_BUCKET_NAME"])
+        app.s3_client = client
+        db.session.add_all([User(username="u1", email="u1@example.org"), User(username="u2", email="u2@example.org")])
+        db.session.commit()
+        yield client
+
+
+def _keys(app, s3):
+    return sorted(o["Key"] for o in s3.list_objects_v2(Bucket=app.config["AWS_S3_BUCKET_NAME"]).get("Contents", []))
+
+
+def _counts():
+    return sorted(b.ref_count for b in DocumentBlob.query)
+
+
+def _create(client, auth, user_id=1, data=DATA, **form):
+    form = {"title": "Draft", "file": (io.BytesIO(data), "draft.docx"), **form}
+    return client.post("/writing_tool/documents", data=form, headers=auth(user_id),
+                       content_type="multipart/form-data")
+
+
+def _new_version(client, auth, document_id, user_id=1, data=DATA):
+    return client.post(f"/writing_tool/documents/{document_id}/versions",
+                       data={"file": (io.BytesIO(data), "draft.docx")}, headers=auth(user_id),
+                       content_type="multipart/form-data")
+
+
+def test_identical_content_is_stored_once_and_freed_with_the_last_version(app, client, auth, s3):
+    created = _create(client, auth).get_json()
+    assert created["deduplicated"] is False
+    document_id = created["document_id"]
+    assert _new_version(client, auth, document_id).get_json()["deduplicated"] is True
+    sha256 = hashlib.sha256(DATA).hexdigest()
+    response = client.post(f"/writing_tool/documents/{document_id}/versions?filename=d.docx&sha256={sha256}",
+                           data=b"", headers={**auth(1), "Content-Type": "application/octet-stream"})
+    assert response.get_json()["deduplicated"] is True
+    assert len(_keys(app, s3)) == 1
+    assert _counts() == [3]
+
+    for version in ("v1.0", "v1.1"):
+        response = client.delete(f"/writing_tool/documents/{document_id}/versions/{version}", headers=auth(1))
+        assert response.status_code == 200
+    assert _counts() == [1]
+    assert len(_keys(app, s3)) == 1
+
+    assert client.delete(f"/writing_tool/documents/{document_id}", headers=auth(1)).status_code == 200
+    assert _counts() == []
+    assert _keys(app, s3) == []
+
+
+def test_dedup_is_not_reported_across_users(app, client, auth, s3):
+    _create(client, auth, 1)
+    response = _create(client, auth, 2)
+    # Stored once, but user 2 is not told that someone else has this file.
+    assert response.get_json()["deduplicated"] is False
+    assert _counts() == [2]
+    assert len(_keys(app, s3)) == 1
+
+    # Nor can user 2 claim user 1's file by its hash: the (empty) body is stored instead.
+    _create(client, auth, 1, data=b"private")
+    sha256 = hashlib.sha256(b"private").hexdigest()
+    response = _create(client, auth, 2, data=b"", sha256=sha256)
+    assert response.get_json()["deduplicated"] is False
+    assert _counts() == [1, 1, 2]
+
+
+def test_other_users_cannot_release_blobs(app, client, auth, s3):
+    document_id = _create(client, auth, 1).get_json()["document_id"]
+    assert client.delete(f"/writing_tool/documents/{document_id}/versions/v1.0", headers=auth(2)).status_code == 403
+    assert client.delete(f"/writing_tool/documents/{document_id}", headers=auth(2)).status_code == 403
+    assert _new_version(client, auth, document_id, user_id=2).status_code == 403
+    assert _counts() == [1]
+    assert len(_keys(app, s3)) == 1
+
+
+def test_failed_save_leaves_no_blob_behind(app, client, auth, s3, monkeypatch):
+    document_id = _create(client, auth).get_json()["document_id"]
+
+    def fail(version):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(routes, "make_current", fail)
+    # New content: the uploaded object is deleted again.
+    assert _new_version(client, auth, document_id, data=b"new content").status_code == 500
+    # Known content: the added reference is rolled back.
+    assert _new_version(client, auth, document_id).status_code == 500
+    assert _create(client, auth, data=b"other").status_code == 500
+
+    assert _counts() == [1]
+    assert len(_keys(app, s3)) == 1
+    assert DocumentVersion.query.count() == 1
+    assert CloudDocument.query.count() == 1
+
+
+def test_purge_pending_uploads_deletes_files_in_batches(app, db, s3, monkeypatch):
+    document = CloudDocument(title="Draft", owner_id=1)
+    db.session.add(document)
+    db.session.flush()
+    bucket = app.config["AWS_S3_BUCKET_NAME"]
+    started = datetime.now(timezone.utc) - timedelta(hours=2)
+    for minor in range(5):
+        key = f"pending/{minor}.docx"
+        s3.put_object(Bucket=bucket, Key=key, Body=b"partial")
+        db.session.add(DocumentVersion(document_id=document.id, major_version=1, minor_version=minor, file_key=key,
+                                       file_url=key, upload_status=UPLOAD_PENDING, uploaded_at=started))
+    db.session.commit()
+
+    requests = []
+    delete = s3.delete_objects
+    monkeypatch.setattr(s3, "delete_objects", lambda **kw: requests.append(kw) or delete(**kw))
+    monkeypatch.setattr(blobs, "DELETE_BATCH_SIZE", 2)
+    result = app.test_cli_runner().invoke(purge_pending_uploads, ["--older-than", "1"])
+
+    assert "Purged 5 pending uploads." in result.output
+    assert [len(r["Delete"]["Objects"]) for r in requests] == [2, 2, 1]
+    assert _keys(app, s3) == []
+    assert DocumentVersion.query.count() == 0
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Offline metadata index."""
+import json
+import os
+
+from research_assistant.reference import enrichment
+from research_assistant.reference.enrichment import build_index, open_index
+
+
+def _build(tmp_path, works, mtime):
+    dump, index_path = tmp_path / "dump.jsonl", str(tmp_path / "works.idx")
+    dump.write_text("\n".join(json.dumps(w) for w in works))
+    build_index(str(dump), index_path)
+    os.utime(index_path, (mtime, mtime))
+    return index_path
+
+
+def test_rebuilt_index_is_closed_after_its_last_lookup(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrichment, "_indexes", {})
+    path = _build(tmp_path, [{"DOI": "10.1/old", "title": ["Old"]}], 1_000_000)
+
+    with open_index(path) as old:
+        with open_index(path) as same:
+            assert same is old
+        path = _build(tmp_path, [{"DOI": "10.1/new", "title": ["New"]}], 2_000_000)
+        with open_index(path) as new:
+            assert new is not old
+            assert new.by_doi("10.1/new")["t"] == "New"
+        # Replaced in the cache, but still mapped for the lookup in progress.
+        assert not old._mm.closed
+        assert old.by_doi("10.1/old")["t"] == "Old"
+    assert old._mm.closed
+
+    with open_index(path) as index:
+        assert index is new
+    assert not new._mm.closed
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Keyset pagination of the reference list."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from research_assistant.reference.models import Reference
+
+
+def _pages(client, auth, **params):
+    ids, cursor = [], None
+    while True:
+        query = {"limit": 2, **params, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/references/", query_string=query, headers=auth(1)).get_json()
+        ids += [item["id"] for item in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_null_sort_values_do_not_end_pagination(client, auth, db, order):
+    stamps = [datetime(2024, 1, 2), None, datetime(2024, 1, 1), None, datetime(2024, 1, 2), None]
+    refs = [Reference(user_id=1, title=f"Paper {n}", authors="Doe, J.", year="2020") for n in range(len(stamps))]
+    db.session.add_all(refs)
+    db.session.flush()
+    for ref, stamp in zip(refs, stamps):
+        db.session.execute(update(Reference).where(Reference.id == ref.id).values(created_at=stamp))
+    db.session.commit()
+
+    dated = sorted((s, ref.id) for ref, s in zip(refs, stamps) if s)
+    undated = sorted(ref.id for ref, s in zip(refs, stamps) if s is None)
+    if order == "desc":
+        dated, undated = dated[::-1], undated[::-1]
+    expected = [ref_id for _, ref_id in dated] + undated
+
+    assert _pages(client, auth, sort_by="created_at", order=order) == expected
+    unpaged = client.get("/references/", query_string={"sort_by": "created_at", "order": order}, headers=auth(1))
+    assert [item["id"] for item in unpaged.get_json()] == expected
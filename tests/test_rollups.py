@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Incrementally maintained library statistics stay equal to a live aggregate."""
+import io
+
+from research_assistant.reference import rollups
+from research_assistant.reference.bib_import import import_bib_stream
+from research_assistant.reference.models import Reference, ReferenceRollup
+
+
+def _add(db, user_id=1, **fields):
+    ref = Reference(user_id=user_id, title=fields.pop("title", "T"), authors="Doe, J.",
+                    year=fields.pop("year", "2020"), **fields)
+    db.session.add(ref)
+    db.session.commit()
+    return ref
+
+
+def _stats(client, auth, user_id=1):
+    response = client.get("/references/stats", headers=auth(user_id))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_orm_writes_keep_rollups_current(client, auth, db):
+    a = _add(db, title="A", journal="Nature")
+    b = _add(db, title="B", journal="Nature", year="2021")
+    _add(db, user_id=2, title="Other user")
+    assert rollups.verify() == []
+
+    stats = _stats(client, auth)
+    assert (stats["total"], stats["completed"]) == (2, 0)
+    assert stats["journals"] == [{"journal": "Nature", "total": 2, "completed": 0}]
+    assert [y["year"] for y in stats["years"]] == ["2020", "2021"]
+
+    b.year, b.completed, b.journal = "2020", True, None
+    db.session.commit()
+    assert rollups.verify() == []
+    stats = _stats(client, auth)
+    assert stats["completed"] == 1
+    assert stats["years"] == [{"year": "2020", "total": 2, "completed": 1}]
+    assert {j["journal"]: j["total"] for j in stats["journals"]} == {"Nature": 1, None: 1}
+
+    db.session.delete(a)
+    db.session.commit()
+    assert rollups.verify() == []
+    assert _stats(client, auth)["total"] == 1
+    # Rows whose total reaches zero are removed rather than kept at 0.
+    assert ReferenceRollup.query.filter_by(user_id=1, dimension="journal", value="Nature").count() == 0
+
+
+def test_batch_endpoints_and_import_keep_rollups_current(client, auth, db):
+    ids = [_add(db, title=f"R{i}", year=str(2000 + i % 2)).id for i in range(4)]
+
+    response = client.post("/references/batch/complete", json={"ids": ids[:3]}, headers=auth())
+    assert response.status_code == 200
+    response = client.post("/references/batch/update",
+                           json={"filter": {"year": "2001"}, "set": {"journal": "Cell"}}, headers=auth())
+    assert response.get_json()["updated"] == 2
+    response = client.post("/references/batch/delete", json={"ids": [ids[0]]}, headers=auth())
+    assert response.get_json()["deleted"] == 1
+    assert rollups.verify() == []
+
+    text = "".join(
+        f"@article{{k{i}, title = {{Imported {i}}}, author = {{Doe, J.}}, year = 1999}}\n" for i in range(3)
+    )
+    import_bib_stream(io.BytesIO(text.encode()), 1, chunk_size=2)
+    assert rollups.verify() == []
+    stats = _stats(client, auth)
+    assert (stats["total"], stats["completed"]) == (6, 2)
+    assert {y["year"]: y["total"] for y in stats["years"]} == {"1999": 3, "2000": 1, "2001": 2}
+
+
+def test_rebuild_repairs_drift(db):
+    _add(db, title="A")
+    _add(db, title="B", completed=True)
+    db.session.query(ReferenceRollup).filter_by(dimension="all").update({"total": 99})
+    db.session.commit()
+    assert rollups.verify() == [((1, "all", ""), (99, 1), (2, 1))]
+
+    rollups.rebuild(user_id=1)
+    assert rollups.verify() == []
+
+
+def _tag_counts(client, auth, user_id=1):
+    response = client.get("/tags/stats", headers=auth(user_id))
+    assert response.status_code == 200
+    return {t["tag"]: t["count"] for t in response.get_json()}
+
+
+def test_tag_usage_counts(client, auth, db):
+    ids = [_add(db, title=f"R{i}").id for i in range(3)]
+    for ref_id in ids[:2]:
+        assert client.post("/tags/assign", json={"document_id": ref_id, "tag": "ml"},
+                           headers=auth()).status_code == 200
+    # Assigning the same tag twice is not counted twice.
+    client.post("/tags/assign", json={"document_id": ids[0], "tag": "ml"}, headers=auth())
+    response = client.post("/tags/batch/assign", json={"ids": ids, "tags": ["nlp", "ml"]}, headers=auth())
+    assert response.status_code == 200
+    assert _tag_counts(client, auth) == {"ml": 3, "nlp": 3}
+    assert rollups.verify() == []
+
+    ml = {t["name"]: t["id"] for t in client.get("/tags/list", headers=auth()).get_json()}["ml"]
+    response = client.delete("/tags/remove", json={"document_id": ids[0], "tag_id": ml}, headers=auth())
+    assert response.status_code == 200
+    client.post("/tags/batch/remove", json={"ids": ids[1:2], "tags": ["nlp"]}, headers=auth())
+    client.delete(f"/references/{ids[2]}", headers=auth())
+    assert _tag_counts(client, auth) == {"ml": 1, "nlp": 1}
+    assert rollups.verify() == []
+
+    client.delete("/tags/delete", json={"tag_id": ml}, headers=auth())
+    assert _tag_counts(client, auth) == {"nlp": 1}
+    assert rollups.verify() == []
+    # Another user's tags and counts are separate.
+    assert _tag_counts(client, auth, 2) == {}
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Incremental sync of the "more like this" index."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from research_assistant.reference.models import Reference
+from research_assistant.reference.similarity import LibraryIndex
+
+
+def _add(db, title, stamp):
+    ref = Reference(user_id=1, title=title, authors="Doe, J.", year="2020")
+    db.session.add(ref)
+    db.session.flush()
+    db.session.execute(update(Reference).where(Reference.id == ref.id).values(updated_at=stamp))
+    db.session.commit()
+    return ref.id
+
+
+def _neighbours(index, ref_id):
+    return [ref_id for ref_id, _ in index.neighbours(ref_id)]
+
+
+def test_rows_committed_after_later_stamps_are_picked_up(db):
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    graphs = _add(db, "Graph neural networks", now - timedelta(minutes=5))
+    proteins = _add(db, "Protein folding dynamics", now)
+    index = LibraryIndex(1)
+    assert index.sync() == 2
+    assert index.sync() == 0
+
+    # Stamped before the newest row the index has seen, but committed after the last sync.
+    renamed = _add(db, "Graph attention networks", now - timedelta(seconds=10))
+    db.session.execute(
+        update(Reference).where(Reference.id == proteins)
+        .values(title="Graph convolutional networks", updated_at=now - timedelta(seconds=5))
+    )
+    db.session.commit()
+    assert index.sync() == 2
+    assert sorted(_neighbours(index, graphs)) == sorted([renamed, proteins])
+    assert index.sync() == 0
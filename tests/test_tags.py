@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Per-user tag names and tag ownership."""
+import sqlite3
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import inspect, text
+
+from research_assistant.app import create_app
+from research_assistant.database import db as _db
+from research_assistant.reference.models import Reference
+from research_assistant.tag.batch import assign_tags, remove_tags
+from research_assistant.tag.models import DocumentTag, Tag
+
+# The tags table as databases created before per-user tag names have it.
+LEGACY_TAGS = """
+CREATE TABLE tags (
+    id INTEGER NOT NULL,
+    name VARCHAR(64) NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE (name)
+)
+"""
+
+
+def _references(*user_ids):
+    refs = [Reference(user_id=uid, title=f"Paper {uid}", authors="Doe, J.", year="2020") for uid in user_ids]
+    _db.session.add_all(refs)
+    _db.session.commit()
+    return [ref.id for ref in refs]
+
+
+def _assign(client, auth, user_id, ref_id, name):
+    return client.post("/tags/assign", json={"document_id": ref_id, "tag": name}, headers=auth(user_id))
+
+
+def test_same_tag_name_for_two_users(client, auth, db):
+    first, second = _references(1, 2)
+    assert _assign(client, auth, 1, first, "ml").status_code == 200
+    assert _assign(client, auth, 2, second, "ml").status_code == 200
+
+    rows = db.session.execute(text("SELECT user_id FROM tags WHERE name = 'ml' ORDER BY user_id")).all()
+    assert [r.user_id for r in rows] == [1, 2]
+
+
+def test_startup_drops_legacy_global_unique(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_TAGS)
+    conn.execute("INSERT INTO tags (id, name, user_id) VALUES (1, 'ml', 1)")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{path}")
+    app = create_app("tests.settings")
+    with app.app_context():
+        try:
+            inspector = inspect(_db.engine)
+            assert not [c for c in inspector.get_unique_constraints("tags") if c["column_names"] == ["name"]]
+            assert "uq_tags_user_name" in {ix["name"] for ix in inspector.get_indexes("tags")}
+            assert _db.session.get(Tag, 1).name == "ml"
+
+            (ref_id,) = _references(2)
+            response = app.test_client().post(
+                "/tags/assign", json={"document_id": ref_id, "tag": "ml"},
+                headers={"Authorization": f"Bearer {create_access_token(identity='2')}"},
+            )
+            assert response.status_code == 200
+            assert DocumentTag.query.count() == 1
+        finally:
+            _db.session.remove()
+            _db.engine.dispose()
+
+
+def test_conflict_with_global_unique_is_409(client, auth, db):
+    first, second = _references(1, 2)
+    db.session.execute(text("CREATE UNIQUE INDEX legacy_tags_name ON tags (name)"))
+    db.session.commit()
+    assert _assign(client, auth, 1, first, "ml").status_code == 200
+
+    response = _assign(client, auth, 2, second, "ml")
+    assert response.status_code == 409
+    response = client.post("/tags/batch/assign", json={"ids": [second], "tags": ["ml"]}, headers=auth(2))
+    assert response.status_code == 409
+    # The session was rolled back and is usable again.
+    assert _assign(client, auth, 2, second, "nlp").status_code == 200
+
+
+def test_batch_tagging_is_scoped_to_the_caller(client, auth, db):
+    mine, theirs = _references(1, 2)
+    assert _assign(client, auth, 2, theirs, "private").status_code == 200
+    their_tag = Tag.query.filter_by(user_id=2).one().id
+
+    response = client.post("/tags/batch/assign", json={"ids": [mine, theirs], "tags": ["ml"]}, headers=auth(1))
+    assert response.status_code == 404
+    assert response.get_json()["ids"] == [theirs]
+    response = client.post("/tags/batch/assign", json={"filter": {"tag": their_tag}, "tags": ["ml"]},
+                           headers=auth(1))
+    assert response.get_json()["matched"] == 0
+    response = client.post("/tags/batch/remove", json={"ids": [theirs], "tags": ["private"]}, headers=auth(1))
+    assert response.status_code == 404
+
+    # The statements themselves never link or unlink another user's tags or references.
+    assert assign_tags(1, [mine, theirs], [their_tag]) == 0
+    assert remove_tags(1, [theirs], [their_tag]) == 0
+    db.session.commit()
+    assert [(link.document_id, link.tag_id) for link in DocumentTag.query] == [(theirs, their_tag)]
+    assert [t.name for t in Tag.query.filter_by(user_id=2)] == ["private"]
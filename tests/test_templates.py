@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Citation .docx templates."""
+from sqlalchemy import event
+
+from research_assistant.reference.docx_templates import prepare_base
+from research_assistant.reference.models import CitationTemplate
+
+
+def test_template_bytes_are_only_loaded_to_compile(app, client, auth, db):
+    template = CitationTemplate(user_id=1, name="letterhead.docx", data=prepare_base(), size=0)
+    db.session.add(template)
+    db.session.commit()
+    response = client.post("/references/", json={"title": "Deep Learning", "authors": "Doe, J.", "year": "2020"},
+                           headers=auth(1))
+    ref_id, template_id = response.get_json()["id"], template.id
+    db.session.expunge_all()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        for expected_loads in (1, 1):
+            response = client.get(f"/references/{ref_id}/cite?template_id={template_id}", headers=auth(1))
+            assert response.status_code == 200
+            assert response.data.startswith(b"PK")
+            assert sum("citation_templates.data" in s for s in statements) == expected_loads
+        assert client.get(f"/references/{ref_id}/cite?template_id={template_id}",
+                          headers=auth(2)).status_code == 403
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)